@@ -0,0 +1,401 @@
+"""
+Колоночный движок отчётов в памяти процесса (NumPy) — для многолетних
+периодов и what-if, когда один отель гоняют десятками вариантов отчёта.
+
+Номера, заезды, платежи, расходы и снятия отеля лежат столбцами: суммы —
+int64 в тийинах (копейках), даты — порядковые номера дней (date.toordinal),
+способы оплаты, категории, типы и номера комнат — коды словарей.
+compute_totals и куб (reports.compute_cube) считаются группировками по кодам
+(np.add.at) без похода в Postgres.
+
+Снимок догоняет базу по ленте изменений (api/events.py): перед запросом
+читаются события отеля после последней применённой ревизии, строки
+затронутых объектов перечитываются по id (строки нет — объект удалён).
+Массовая правка ('bulk') или снимок, не сверявшийся дольше срока хранения
+ленты, — полная перезагрузка. Загрузка идёт одной REPEATABLE READ
+транзакцией вместе с ревизией, поэтому снимок согласован.
+
+Движок необязательный: нужен numpy и ANALYTICS_ENGINE=True. Без них — и
+внутри транзакции, где видно незакоммиченное, — отчёты считаются через ORM.
+Снимок у каждого воркера свой, в памяти не больше MAX_HOTELS отелей.
+"""
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import events, reports
+from .models import ChangeEvent
+
+try:
+    import numpy as np
+except ImportError:  # движок необязательный
+    np = None
+
+MAX_HOTELS = 8
+CHUNK = 50_000
+# сущности ленты в порядке применения: заезд ссылается на номер, платёж — на заезд
+ENTITIES = ['rooms', 'stays', 'payments', 'expenses', 'withdrawals']
+
+# day — порядковый номер дня, как date.toordinal(); суммы — в тийинах.
+# Правила те же, что в compute_totals и ROOM_NIGHTS_SQL.
+LOAD_SQL = {
+    'rooms': 'SELECT id, "roomType", floor, number, active FROM "Room" WHERE "hotelId" = %s',
+    'stays': """
+        SELECT id, "roomId",
+               "checkInDate"::date - DATE '0001-01-01' + 1,
+               "checkOutDate"::date - DATE '0001-01-01' + 1,
+               status IN ('CHECKED_IN', 'CHECKED_OUT')
+        FROM "Stay" WHERE "hotelId" = %s
+    """,
+    'payments': """
+        SELECT id, "stayId", COALESCE("businessDate" - DATE '0001-01-01' + 1, 0), (amount * 100)::bigint,
+               CASE WHEN method = 'OTHER' AND "customMethodLabel" <> '' THEN "customMethodLabel" ELSE method END
+        FROM "Payment" WHERE "hotelId" = %s
+    """,
+    'expenses': """
+        SELECT id, COALESCE("businessDate" - DATE '0001-01-01' + 1, 0), (amount * 100)::bigint, category
+        FROM "Expense" WHERE "hotelId" = %s
+    """,
+    'withdrawals': """
+        SELECT id, COALESCE("businessDate" - DATE '0001-01-01' + 1, 0), (amount * 100)::bigint, method
+        FROM "Withdrawal" WHERE "hotelId" = %s
+    """,
+}
+
+_lock = threading.Lock()
+_frames = OrderedDict()   # hotel_id → _Frame
+
+
+def available():
+    """Считать ли через движок прямо сейчас."""
+    return np is not None and settings.ANALYTICS_ENGINE and not connection.in_atomic_block
+
+
+def _take(values, index, default):
+    """values[index], а для index < 0 (ссылка на незагруженное) — default."""
+    out = np.full(len(index), default, values.dtype)
+    ok = index >= 0
+    out[ok] = values[index[ok]]
+    return out
+
+
+class _Table:
+    """Столбцы одной сущности. Строка объекта не переезжает; удалённая — alive=False."""
+
+    def __init__(self, **dtypes):
+        self.dtypes = dtypes
+        self.index = {}
+        self.size = 0
+        self.cols = {name: np.zeros(0, dtype) for name, dtype in {**dtypes, 'alive': np.bool_}.items()}
+
+    def __getitem__(self, name):
+        return self.cols[name][:self.size]
+
+    def load(self, keys, rows):
+        self.index = {key: i for i, key in enumerate(keys)}
+        self.size = len(keys)
+        columns = list(zip(*rows)) or [()] * len(self.dtypes)
+        for (name, dtype), values in zip(self.dtypes.items(), columns):
+            self.cols[name] = np.array(values, dtype)
+        self.cols['alive'] = np.ones(self.size, np.bool_)
+
+    def put(self, key, row):
+        i = self.index.get(key)
+        if i is None:
+            i = self.index[key] = self.size
+            if i == len(self.cols['alive']):
+                for name, col in self.cols.items():
+                    grown = np.zeros(max(2 * len(col), 16), col.dtype)
+                    grown[:self.size] = col[:self.size]
+                    self.cols[name] = grown
+            self.size += 1
+        for name, value in zip(self.dtypes, row):
+            self.cols[name][i] = value
+        self.cols['alive'][i] = True
+
+    def drop(self, key):
+        i = self.index.get(key)
+        if i is not None:
+            self.cols['alive'][i] = False
+
+    def nbytes(self):
+        return sum(col.nbytes for col in self.cols.values())
+
+
+class _Frame:
+    def __init__(self, hotel_id):
+        self.hotel_id = hotel_id
+        self.lock = threading.Lock()
+        self.revision = None   # id последнего применённого события; None — не загружен
+        self.checked = 0.0     # когда последний раз сверялись с лентой (monotonic)
+
+    # ─── загрузка ─────────────────────────────────────────────────────────────
+
+    def _reset(self):
+        # словари: значение → код (порядок вставки — порядок кодов)
+        self.words = {kind: {} for kind in ('room_type', 'floor', 'room', 'method', 'category', 'withdrawal')}
+        self.rooms = _Table(room_type=np.int32, floor=np.int32, room=np.int32, active=np.bool_)
+        self.stays = _Table(room=np.int32, check_in=np.int32, check_out=np.int32, sold=np.bool_)
+        self.payments = _Table(stay=np.int32, day=np.int32, amount=np.int64, method=np.int32)
+        self.expenses = _Table(day=np.int32, amount=np.int64, category=np.int32)
+        self.withdrawals = _Table(day=np.int32, amount=np.int64, method=np.int32)
+
+    def _code(self, kind, value):
+        words = self.words[kind]
+        code = words.get(value)
+        if code is None:
+            code = words[value] = len(words)
+        return code
+
+    def _encode(self, entity, row):
+        if entity == 'rooms':
+            _, room_type, floor, number, active = row
+            return self._code('room_type', room_type), self._code('floor', floor), self._code('room', number), active
+        if entity == 'stays':
+            _, room_id, check_in, check_out, sold = row
+            return self.rooms.index.get(room_id, -1), check_in, check_out, sold
+        if entity == 'payments':
+            _, stay_id, day, amount, method = row
+            return self.stays.index.get(stay_id, -1), day, amount, self._code('method', method)
+        if entity == 'expenses':
+            _, day, amount, category = row
+            return day, amount, self._code('category', category)
+        _, day, amount, method = row
+        return day, amount, self._code('withdrawal', method)
+
+    def load(self):
+        self._reset()
+        checked = time.monotonic()
+        with transaction.atomic():
+            with connection.cursor() as cur:
+                cur.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+            # seq выдаётся в порядке коммитов (events.sequence): всё, что не
+            # видно в этом снимке, придёт с seq больше последнего видимого
+            self.revision = ChangeEvent.objects.filter(hotel_id=self.hotel_id, seq__isnull=False) \
+                .order_by('-seq').values_list('seq', flat=True).first() or 0
+            for entity in ENTITIES:
+                keys, rows = [], []
+                with connection.chunked_cursor() as cur:
+                    cur.execute(LOAD_SQL[entity], [self.hotel_id])
+                    while True:
+                        chunk = cur.fetchmany(CHUNK)
+                        if not chunk:
+                            break
+                        for row in chunk:
+                            keys.append(row[0])
+                            rows.append(self._encode(entity, row))
+                getattr(self, entity).load(keys, rows)
+        self.checked = checked
+
+    def refresh(self):
+        """Догнать базу по ленте изменений."""
+        horizon = settings.EVENTS_RETENTION_DAYS * 86400 - 3600
+        if self.revision is None or time.monotonic() - self.checked > horizon:
+            self.load()
+            return
+        checked = time.monotonic()
+        events.sequence(self.hotel_id)
+        rows = list(
+            ChangeEvent.objects.filter(hotel_id=self.hotel_id, seq__gt=self.revision)
+            .order_by('seq').values_list('seq', 'entity', 'object_id', 'op')
+        )
+        touched = {entity: set() for entity in ENTITIES}
+        for _, entity, object_id, op in rows:
+            if entity not in touched:
+                continue
+            if op == 'bulk':
+                self.load()
+                return
+            touched[entity].add(object_id)
+        for entity in ENTITIES:
+            if touched[entity]:
+                self._apply(entity, touched[entity])
+        if rows:
+            self.revision = rows[-1][0]
+        self.checked = checked
+
+    def _apply(self, entity, ids):
+        table = getattr(self, entity)
+        found = set()
+        with connection.cursor() as cur:
+            cur.execute(LOAD_SQL[entity] + ' AND id = ANY(%s)', [self.hotel_id, list(ids)])
+            for row in cur.fetchall():
+                table.put(row[0], self._encode(entity, row))
+                found.add(row[0])
+        for key in ids - found:
+            table.drop(key)
+
+    # ─── запросы ──────────────────────────────────────────────────────────────
+
+    def _sum_by(self, table, column, kind, lo, hi):
+        """{значение словаря: сумма} по операциям с lo <= day <= hi."""
+        day = table['day']
+        mask = table['alive'] & (day >= lo) & (day <= hi)
+        codes = table[column][mask]
+        size = len(self.words[kind])
+        sums = np.zeros(size, np.int64)
+        np.add.at(sums, codes, table['amount'][mask])
+        present = np.bincount(codes, minlength=size) > 0
+        labels = list(self.words[kind])
+        return {labels[i]: int(sums[i]) / 100 for i in np.flatnonzero(present)}
+
+    def _active_rooms(self):
+        return self.rooms['alive'] & self.rooms['active']
+
+    def totals(self, from_date, to_date):
+        """То же, что reports.compute_totals."""
+        lo, hi = from_date.toordinal(), to_date.toordinal()
+        revenue_by_method = self._sum_by(self.payments, 'method', 'method', lo, hi)
+        expenses_by_category = self._sum_by(self.expenses, 'category', 'category', lo, hi)
+        withdrawals_by_method = self._sum_by(self.withdrawals, 'method', 'withdrawal', lo, hi)
+
+        available_nights = int(self._active_rooms().sum()) * (hi - lo + 1)
+        # проданные ночи — по тем же правилам, что в _facts (и живой номер)
+        stays = self.stays
+        nights = np.minimum(stays['check_out'], hi + 1) - np.maximum(stays['check_in'], lo)
+        sold = stays['alive'] & stays['sold'] & (nights > 0) & _take(self.rooms['alive'], stays['room'], False)
+        sold_nights = int(nights[sold].sum())
+
+        return reports.totals_snapshot(
+            revenue_by_method, expenses_by_category, withdrawals_by_method, sold_nights, available_nights,
+        )
+
+    def _facts(self, lo, hi):
+        """
+        Факты куба за [lo, hi] (как facts в CUBE_SQL): платежи, проданные ночи,
+        доступные ночи. room — строка номера, weekday 0..6 (пн..вс), method -1 у ночей.
+        """
+        rooms, stays, payments = self.rooms, self.stays, self.payments
+
+        # платежи — только с живыми заездом и номером (JOIN в SQL)
+        day = payments['day']
+        mask = payments['alive'] & (day >= lo) & (day <= hi)
+        stay = payments['stay'][mask]
+        room = _take(stays['room'], stay, -1)
+        ok = _take(stays['alive'], stay, False) & _take(rooms['alive'], room, False)
+        pay_room, pay_day = room[ok], day[mask][ok]
+        pay_method, pay_amount = payments['method'][mask][ok], payments['amount'][mask][ok]
+
+        # проданные ночи: каждая ночь заезда внутри периода — отдельный факт
+        start = np.maximum(stays['check_in'], lo)
+        count = np.minimum(stays['check_out'], hi + 1) - start
+        sold = stays['alive'] & stays['sold'] & (count > 0) & _take(rooms['alive'], stays['room'], False)
+        start, count = start[sold], count[sold].astype(np.int64)
+        offsets = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+        night_day = np.repeat(start, count) + offsets
+        night_room = np.repeat(stays['room'][sold], count)
+
+        # доступные ночи: активный номер × число дней каждого дня недели в периоде
+        days = hi - lo + 1
+        first = (lo - 1) % 7
+        per_weekday = np.array([days // 7 + ((k - first) % 7 < days % 7) for k in range(7)], np.int64)
+        active = np.flatnonzero(self._active_rooms())
+
+        n_pay, n_night = len(pay_room), len(night_room)
+        zeros = np.zeros(n_pay + n_night, np.int64)
+        return {
+            'room': np.concatenate([pay_room, night_room, np.repeat(active, 7)]).astype(np.int64),
+            'weekday': np.concatenate([
+                (pay_day - 1) % 7, (night_day - 1) % 7, np.tile(np.arange(7), len(active)),
+            ]).astype(np.int64),
+            'method': np.concatenate([
+                pay_method, np.full(n_night + 7 * len(active), -1, np.int32),
+            ]).astype(np.int64),
+            'revenue': np.concatenate([pay_amount, np.zeros(n_night + 7 * len(active), np.int64)]),
+            'sold': np.concatenate([np.zeros(n_pay, np.int64), np.ones(n_night, np.int64),
+                                    np.zeros(7 * len(active), np.int64)]),
+            'available': np.concatenate([zeros, np.tile(per_weekday, len(active))]),
+        }
+
+    def _dimension(self, facts, dim):
+        """(коды, число кодов, код → значение) измерения куба."""
+        if dim == 'weekday':
+            return facts['weekday'], 7, lambda code: code + 1
+        if dim == 'method':
+            labels = list(self.words['method'])
+            return facts['method'], len(labels), labels.__getitem__
+        labels = list(self.words[dim])
+        return self.rooms[dim][facts['room']].astype(np.int64), len(labels), labels.__getitem__
+
+    def _group(self, facts, dims):
+        """[(ключ, (выручка, продано, доступно))] по сочетаниям значений dims."""
+        if 'method' in dims:
+            keep = facts['method'] >= 0
+            facts = {name: values[keep] for name, values in facts.items()}
+        if not len(facts['room']):
+            return []
+        key = np.zeros(len(facts['room']), np.int64)
+        decoders = []
+        for dim in dims:
+            codes, size, decode = self._dimension(facts, dim)
+            key = key * size + codes
+            decoders.append((size, decode))
+        groups, inverse = np.unique(key, return_inverse=True)
+        sums = {}
+        for metric in ('revenue', 'sold', 'available'):
+            sums[metric] = np.zeros(len(groups), np.int64)
+            np.add.at(sums[metric], inverse, facts[metric])
+        out = []
+        for i, value in enumerate(groups.tolist()):
+            parts = []
+            for size, decode in reversed(decoders):
+                value, code = divmod(value, size)
+                parts.append(decode(code))
+            out.append((tuple(reversed(parts)), (
+                int(sums['revenue'][i]) / 100, int(sums['sold'][i]), int(sums['available'][i]),
+            )))
+        return out
+
+    def cube(self, periods, groupings):
+        """{измерения: {ключ: {период: (выручка, продано, доступно)}}} — вход reports.cube_result."""
+        by_set = {dims: {} for dims in [()] + list(groupings)}
+        for period, from_date, to_date in periods:
+            facts = self._facts(from_date.toordinal(), to_date.toordinal())
+            for dims, groups in by_set.items():
+                for key, values in self._group(facts, dims):
+                    groups.setdefault(key, {})[period] = values
+        return by_set
+
+    def stats(self):
+        return {
+            'revision': self.revision,
+            'rows': {entity: getattr(self, entity).size for entity in ENTITIES},
+            'bytes': sum(getattr(self, entity).nbytes() for entity in ENTITIES),
+        }
+
+
+@contextmanager
+def snapshot(hotel_id):
+    """Снимок отеля, догнанный до базы; держит его блокировку."""
+    with _lock:
+        frame = _frames.get(hotel_id)
+        if frame is None:
+            frame = _frames[hotel_id] = _Frame(hotel_id)
+        _frames.move_to_end(hotel_id)
+        while len(_frames) > MAX_HOTELS:
+            _frames.popitem(last=False)
+    with frame.lock:
+        frame.refresh()
+        yield frame
+
+
+def totals(hotel_id, from_date, to_date):
+    with snapshot(hotel_id) as frame:
+        return frame.totals(from_date, to_date)
+
+
+def cube(hotel_id, periods, groupings):
+    with snapshot(hotel_id) as frame:
+        return frame.cube(periods, groupings)
+
+
+def evict(hotel_id=None):
+    with _lock:
+        if hotel_id is None:
+            _frames.clear()
+        else:
+            _frames.pop(hotel_id, None)
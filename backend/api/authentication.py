@@ -32,12 +32,8 @@ class CookieJWTAuthentication(BaseAuthentication):
         except TokenError as e:
             raise AuthenticationFailed(str(e))
 
-        from .models import User
-        current_version = (
-            User.objects.filter(id=user.id)
-            .values_list('token_version', flat=True)
-            .first()
-        )
+        from .cache import token_version
+        current_version = token_version(user.hotel_id, user.id)
         if current_version is None:
             raise AuthenticationFailed('User no longer exists')
         if current_version != payload.get('tv', 0):
@@ -0,0 +1,124 @@
+"""
+Шина сообщений между воркерами на Postgres LISTEN/NOTIFY.
+
+Каналы:
+  cache_invalidate — '<hotel_id>/<namespace>', сброс L1 кэша (api/cache.py);
+  hotel_events     — '<hotel_id>', новые записи в ленте изменений (api/events.py).
+NOTIFY транзакционный: внутри atomic() сообщение уходит только после COMMIT,
+при откате — не уходит вовсе.
+
+Модули подписываются при импорте: subscribe(channel, handler) и
+on_gap(handler). В каждом воркере фоновый поток держит отдельное соединение
+с LISTEN на все каналы. Пока поток не подключён (старт, обрыв,
+переподключение), сообщения могли потеряться — поэтому после каждого
+(пере)подключения вызываются обработчики on_gap, а healthy() возвращает
+False, и подписчики сами сверяются с базой/SQLite.
+"""
+import logging
+import os
+import select
+import threading
+import time
+
+import psycopg2
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+CACHE_CHANNEL = 'cache_invalidate'
+EVENTS_CHANNEL = 'hotel_events'
+# раз в столько секунд тишины соединение пингуется — обрыв виден быстро
+KEEPALIVE = 30
+RECONNECT_MAX_DELAY = 30
+
+_lock = threading.Lock()
+_state = {'pid': None, 'healthy': False, 'received': 0, 'gaps': 0}
+_handlers = {}     # канал → [handler(payload)]
+_gap_handlers = []
+
+
+def subscribe(channel, handler):
+    _handlers.setdefault(channel, []).append(handler)
+
+
+def on_gap(handler):
+    _gap_handlers.append(handler)
+
+
+def notify(channel, payload):
+    with connection.cursor() as cur:
+        cur.execute('SELECT pg_notify(%s, %s)', [channel, payload])
+
+
+def healthy():
+    return _state['healthy'] and _state['pid'] == os.getpid()
+
+
+def stats():
+    return {k: v for k, v in _state.items() if k != 'pid'}
+
+
+def start():
+    """Запустить слушателя в этом процессе (повторный вызов — no-op)."""
+    if not settings.CACHE_BUS:
+        return
+    with _lock:
+        if _state['pid'] == os.getpid():
+            return
+        # после fork поток родителя не наследуется — заводим свой
+        _state.update(pid=os.getpid(), healthy=False)
+    threading.Thread(target=_listen, name='pg-bus', daemon=True).start()
+
+
+def _connect():
+    db = settings.DATABASES['default']
+    conn = psycopg2.connect(
+        dbname=db['NAME'], user=db['USER'], password=db['PASSWORD'],
+        host=db['HOST'], port=db['PORT'], application_name='hotel_crm bus',
+    )
+    conn.autocommit = True
+    for channel in _handlers:
+        conn.cursor().execute(f'LISTEN {channel}')
+    return conn
+
+
+def _gap():
+    for handler in _gap_handlers:
+        handler()
+
+
+def _listen():
+    delay = 1
+    while True:
+        conn = None
+        try:
+            conn = _connect()
+            # всё, что пришло до LISTEN, потеряно
+            _gap()
+            _state['healthy'] = True
+            delay = 1
+            while True:
+                if select.select([conn], [], [], KEEPALIVE) == ([], [], []):
+                    conn.cursor().execute('SELECT 1')
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    msg = conn.notifies.pop(0)
+                    _state['received'] += 1
+                    for handler in _handlers.get(msg.channel, []):
+                        handler(msg.payload)
+        except Exception as exc:
+            if _state['healthy']:
+                logger.warning('bus disconnected: %s', exc)
+            _state['healthy'] = False
+            _state['gaps'] += 1
+            _gap()
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        time.sleep(delay)
+        delay = min(delay * 2, RECONNECT_MAX_DELAY)
@@ -0,0 +1,300 @@
+"""
+Общий для gunicorn-воркеров кэш без внешних сервисов.
+
+Два уровня:
+  L1 — LRU в памяти процесса (CACHE_L1_SIZE записей);
+  L2 — SQLite-файл в режиме WAL (CACHE_PATH), общий для всех воркеров
+       контейнера: то, что загрузил один воркер, другие берут без Postgres.
+
+Инвалидация поколениями, которые тоже лежат в SQLite: у отеля есть общее
+поколение и поколение на каждый namespace ('rooms', 'auth', ...).
+invalidate(hotel_id[, namespace]) увеличивает счётчик — и во всех воркерах
+записи со старым поколением перестают совпадать, так что отчёты, справочники
+и проверка токенов везде видят одно и то же.
+
+Свой L1 каждый воркер чистит по сообщениям шины (api/bus.py, Postgres
+LISTEN/NOTIFY): пока слушатель подключён, попадание в L1 не трогает даже
+SQLite. Когда шина лежит, поколения сверяются на каждом обращении (один
+точечный SELECT к SQLite — микросекунды, не сеть).
+
+Значение, загруженное во время инвалидации или внутри транзакции, не
+сохраняется — иначе гонка «прочитал старое → кто-то записал → сохранил
+старое» (или чужое незакоммиченное) жила бы до следующей правки. Если SQLite недоступен, кэш отключается, а не врёт: loader()
+вызывается напрямую.
+
+Значения отдаются без копирования — вызывающий код их не меняет.
+"""
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import bus
+from .models import Hotel, HotelSettings, User
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS gens (scope TEXT PRIMARY KEY, gen INTEGER NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS entries ('
+    ' k TEXT PRIMARY KEY, hotel_id TEXT NOT NULL, namespace TEXT NOT NULL,'
+    ' hgen INTEGER NOT NULL, ngen INTEGER NOT NULL, expires REAL, value BLOB NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS entries_scope ON entries (hotel_id, namespace)',
+]
+
+_lock = threading.Lock()
+_l1 = OrderedDict()   # k → (hgen, ngen, expires, value)
+_stats = defaultdict(lambda: {'l1_hits': 0, 'l2_hits': 0, 'misses': 0})
+_local = threading.local()
+# растёт при каждой чистке L1: значение, загруженное до чистки, в L1 не кладём
+_epoch = 0
+
+MISSING = object()
+# tokenVersion живёт недолго: если сброс 'auth' потерялся (запись мимо
+# invalidate, правка в базе руками), отозванный токен работает не дольше этого
+AUTH_TTL = 60
+
+
+# ─── SQLite ───────────────────────────────────────────────────────────────────
+
+def _db():
+    """Своё соединение на поток (и на процесс — после fork не наследуется)."""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        return conn
+    path = settings.CACHE_PATH
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    for stmt in SCHEMA:
+        conn.execute(stmt)
+    _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+
+def _key(hotel_id, namespace, key):
+    return f'{hotel_id}\x1f{namespace}\x1f{key}'
+
+
+def _generations(db, hotel_id, namespace):
+    hscope, nscope = hotel_id, f'{hotel_id}/{namespace}'
+    gens = dict(db.execute('SELECT scope, gen FROM gens WHERE scope IN (?, ?)', (hscope, nscope)).fetchall())
+    return gens.get(hscope, 0), gens.get(nscope, 0)
+
+
+def _l1_put(k, entry, epoch):
+    with _lock:
+        if epoch != _epoch:
+            return
+        _l1[k] = entry
+        _l1.move_to_end(k)
+        while len(_l1) > settings.CACHE_L1_SIZE:
+            _l1.popitem(last=False)
+
+
+# ─── API ──────────────────────────────────────────────────────────────────────
+
+def lookup(hotel_id, namespace, key=''):
+    """
+    (value, token); value — MISSING при промахе. token передаётся в store():
+    значение, загруженное во время инвалидации, не сохранится. token None —
+    кэш недоступен.
+    """
+    k = _key(hotel_id, namespace, key)
+    stats = _stats[namespace]
+    bus.start()
+    now = time.time()
+    with _lock:
+        epoch = _epoch
+        if bus.healthy():
+            entry = _l1.get(k)
+            if entry is not None and (entry[2] is None or entry[2] > now):
+                _l1.move_to_end(k)
+                stats['l1_hits'] += 1
+                return entry[3], (entry[0], entry[1], epoch)
+    try:
+        db = _db()
+        hgen, ngen = _generations(db, hotel_id, namespace)
+    except sqlite3.Error as exc:
+        logger.warning('cache disabled: %s', exc)
+        return MISSING, None
+    token = (hgen, ngen, epoch)
+
+    with _lock:
+        entry = _l1.get(k)
+        if entry is not None and entry[:2] == (hgen, ngen) and (entry[2] is None or entry[2] > now):
+            _l1.move_to_end(k)
+            stats['l1_hits'] += 1
+            return entry[3], token
+
+    row = db.execute(
+        'SELECT expires, value FROM entries WHERE k = ? AND hgen = ? AND ngen = ?', (k, hgen, ngen)
+    ).fetchone()
+    if row is not None and (row[0] is None or row[0] > now):
+        value = pickle.loads(row[1])
+        _l1_put(k, (hgen, ngen, row[0], value), epoch)
+        stats['l2_hits'] += 1
+        return value, token
+
+    stats['misses'] += 1
+    return MISSING, token
+
+
+def store(hotel_id, namespace, key, value, token, ttl=None):
+    """Запомнить значение на обоих уровнях, если поколения не сменились с lookup()."""
+    if token is None or connection.in_atomic_block:
+        # внутри транзакции значение могло прийти из ещё не закоммиченного (или
+        # того, что откатится) — другим воркерам это отдавать нельзя
+        return
+    hgen, ngen, epoch = token
+    k = _key(hotel_id, namespace, key)
+    expires = time.time() + ttl if ttl else None
+    try:
+        db = _db()
+        if _generations(db, hotel_id, namespace) == (hgen, ngen):
+            db.execute(
+                'INSERT OR REPLACE INTO entries (k, hotel_id, namespace, hgen, ngen, expires, value) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (k, hotel_id, namespace, hgen, ngen, expires, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)),
+            )
+            _l1_put(k, (hgen, ngen, expires, value), epoch)
+    except sqlite3.Error as exc:
+        logger.warning('cache write failed: %s', exc)
+
+
+def cached(hotel_id, namespace, loader, key='', ttl=None):
+    """Значение из L1/L2 или loader() с запоминанием на обоих уровнях."""
+    value, token = lookup(hotel_id, namespace, key)
+    if value is MISSING:
+        value = loader()
+        store(hotel_id, namespace, key, value, token, ttl)
+    return value
+
+
+def generations(hotel_id, first, last):
+    """
+    {namespace: поколение} для namespace'ов отеля с именами от first до last
+    включительно (по строкам) — одним диапазонным запросом. Не бывшие в
+    инвалидации не попадают (их поколение 0); None — кэш недоступен.
+    """
+    prefix = f'{hotel_id}/'
+    try:
+        rows = _db().execute(
+            'SELECT scope, gen FROM gens WHERE scope BETWEEN ? AND ?', (prefix + first, prefix + last)
+        ).fetchall()
+    except sqlite3.Error as exc:
+        logger.warning('cache disabled: %s', exc)
+        return None
+    return {scope[len(prefix):]: gen for scope, gen in rows}
+
+
+def invalidate(hotel_id, namespace=None, broadcast=True):
+    """
+    Новое поколение отеля (или одного его namespace) — для всех воркеров.
+    broadcast: разослать по шине (внутри транзакции — уйдёт после COMMIT).
+    """
+    scope = hotel_id if namespace is None else f'{hotel_id}/{namespace}'
+    try:
+        db = _db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.execute(
+                'INSERT INTO gens (scope, gen) VALUES (?, 1) '
+                'ON CONFLICT (scope) DO UPDATE SET gen = gen + 1', (scope,)
+            )
+            if namespace is None:
+                db.execute('DELETE FROM entries WHERE hotel_id = ?', (hotel_id,))
+            else:
+                db.execute('DELETE FROM entries WHERE hotel_id = ? AND namespace = ?', (hotel_id, namespace))
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+    except sqlite3.Error as exc:
+        logger.error('cache invalidation failed for %s: %s', scope, exc)
+    evict_local(hotel_id, namespace)
+    if broadcast:
+        bus.notify(bus.CACHE_CHANNEL, f'{hotel_id}/{namespace or ""}')
+
+
+def invalidate_on_commit(hotel_id, namespace=None):
+    """
+    Сразу — чтобы этот же запрос увидел свою правку; и после коммита — на
+    случай, если другой воркер успел закэшировать строку, прочитанную до него.
+    """
+    invalidate(hotel_id, namespace, broadcast=False)
+    transaction.on_commit(lambda: invalidate(hotel_id, namespace))
+
+
+def evict_local(hotel_id=None, namespace=None):
+    """Выбросить записи из L1 этого процесса (все — без аргументов)."""
+    global _epoch
+    with _lock:
+        _epoch += 1
+        if hotel_id is None:
+            _l1.clear()
+            return
+        prefix = f'{hotel_id}\x1f' if namespace is None else f'{hotel_id}\x1f{namespace}\x1f'
+        for k in [k for k in _l1 if k.startswith(prefix)]:
+            del _l1[k]
+
+
+def _on_message(topic):
+    hotel_id, _, namespace = topic.partition('/')
+    evict_local(hotel_id, namespace or None)
+
+
+bus.subscribe(bus.CACHE_CHANNEL, _on_message)
+bus.on_gap(evict_local)
+
+
+def stats():
+    with _lock:
+        out = {}
+        for namespace, s in sorted(_stats.items()):
+            total = s['l1_hits'] + s['l2_hits'] + s['misses']
+            hits = s['l1_hits'] + s['l2_hits']
+            out[namespace] = {**s, 'hit_ratio': round(hits / total, 4) if total else 0}
+        l1_size = len(_l1)
+    try:
+        l2_size = _db().execute('SELECT count(*) FROM entries').fetchone()[0]
+    except sqlite3.Error:
+        l2_size = None
+    return {
+        'pid': os.getpid(), 'l1_entries': l1_size, 'l2_entries': l2_size,
+        'bus': bus.stats(), 'namespaces': out,
+    }
+
+
+# ─── справочники ──────────────────────────────────────────────────────────────
+
+def hotel_info(hotel_id):
+    """{'id', 'name', 'timezone', 'created_at'} или None."""
+    return cached(hotel_id, 'hotel', lambda: (
+        Hotel.objects.filter(id=hotel_id).values('id', 'name', 'timezone', 'created_at').first()
+    ))
+
+
+def hotel_name(hotel_id):
+    info = hotel_info(hotel_id)
+    return info['name'] if info else None
+
+
+def telegram_group_id(hotel_id):
+    return cached(hotel_id, 'settings', lambda: (
+        HotelSettings.objects.filter(hotel_id=hotel_id).values_list('telegram_group_id', flat=True).first() or ''
+    ))
+
+
+def token_version(hotel_id, user_id):
+    """tokenVersion пользователя (None — удалён); сброс — invalidate(hotel_id, 'auth')."""
+    return cached(hotel_id, 'auth', lambda: (
+        User.objects.filter(id=user_id).values_list('token_version', flat=True).first()
+    ), key=user_id, ttl=AUTH_TTL)
@@ -0,0 +1,183 @@
+"""
+Лента изменений отеля: каждая запись/удаление сущности пишет ChangeEvent в той
+же транзакции, GET /events отдаёт их как Server-Sent Events. Ревизия — seq,
+номер в порядке коммитов: его выдаёт sequence() уже после COMMIT. Клиент патчит локальное состояние по (entity, id, op) вместо полного
+перезапроса, а после обрыва переподключается с Last-Event-ID и получает
+пропущенное.
+
+Между воркерами события будят потоки через шину (api/bus.py, канал
+hotel_events); пока шина лежит, стрим опрашивает базу раз в POLL_FALLBACK
+секунд. Соединение живёт не дольше STREAM_SECONDS — воркер не занят вечно,
+а браузерный EventSource сам переподключается через retry. Пока стрим ждёт,
+соединение с базой закрыто; живых стримов в процессе — не больше
+EVENTS_MAX_STREAMS, остальные отдают накопившееся и сразу закрываются
+(клиент придёт снова через BUSY_RETRY_MS).
+"""
+import json
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import bus
+from .models import ChangeEvent
+
+STREAM_SECONDS = 55
+HEARTBEAT_SECONDS = 15
+POLL_FALLBACK = 2
+RETRY_MS = 2000
+BUSY_RETRY_MS = 10000
+BATCH = 500
+SEQUENCE = 'api_change_event_seq'
+# pg_advisory_xact_lock(класс, hashtext(hotel_id)) — нумерация событий отеля
+EVENTS_LOCK_CLASS = 1
+
+SEQUENCE_SQL = f"""
+    UPDATE api_change_event e SET seq = n.seq
+    FROM (SELECT id, nextval('{SEQUENCE}') AS seq
+          FROM (SELECT id FROM api_change_event WHERE hotel_id = %s AND seq IS NULL ORDER BY id) q) n
+    WHERE e.id = n.id
+"""
+
+_cond = threading.Condition()
+_seq = defaultdict(int)   # hotel_id → сколько раз будили
+_gaps = 0
+_streams = threading.BoundedSemaphore(settings.EVENTS_MAX_STREAMS)
+
+
+def sequence(hotel_id):
+    """
+    Пронумеровать закоммиченные события отеля. id выдаются при INSERT, а видны
+    после COMMIT, поэтому ревизией служит seq: своя короткая транзакция под
+    блокировкой отеля раздаёт номера тому, что уже закоммичено, — событие,
+    закоммиченное позже, получит номер больше любого выданного. Блокировка
+    держится только на этот UPDATE, незакоммиченных строк он не видит и не ждёт.
+    Внутри чужой транзакции не вызывается: блокировка дожила бы до её COMMIT.
+    """
+    if connection.in_atomic_block:
+        return
+    with transaction.atomic():
+        with connection.cursor() as cur:
+            cur.execute('SELECT pg_advisory_xact_lock(%s, hashtext(%s))', [EVENTS_LOCK_CLASS, hotel_id])
+            cur.execute(SEQUENCE_SQL, [hotel_id])
+
+
+def record(hotel_id, entity, object_id, op):
+    """Записать событие; номер и уведомление — после COMMIT вместе с данными."""
+    with transaction.atomic():
+        ChangeEvent.objects.create(hotel_id=hotel_id, entity=entity, object_id=object_id or '', op=op)
+        bus.notify(bus.EVENTS_CHANNEL, hotel_id)
+        transaction.on_commit(lambda: sequence(hotel_id))
+
+
+def record_bulk(hotel_id, entities):
+    """Массовая правка мимо ORM (импорт, слияние гостей): клиенту — перечитать сущность целиком."""
+    with transaction.atomic():
+        ChangeEvent.objects.bulk_create([
+            ChangeEvent(hotel_id=hotel_id, entity=entity, op='bulk') for entity in entities
+        ])
+        bus.notify(bus.EVENTS_CHANNEL, hotel_id)
+        transaction.on_commit(lambda: sequence(hotel_id))
+
+
+def head(hotel_id):
+    """Текущая ревизия отеля: всё, что закоммитят позже, придёт с seq больше."""
+    sequence(hotel_id)
+    return ChangeEvent.objects.filter(hotel_id=hotel_id, seq__isnull=False) \
+        .order_by('-seq').values_list('seq', flat=True).first() or 0
+
+
+def prune():
+    cutoff = datetime.now(timezone.utc) - timedelta(days=settings.EVENTS_RETENTION_DAYS)
+    deleted, _ = ChangeEvent.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
+
+
+# ─── пробуждение ──────────────────────────────────────────────────────────────
+
+def _on_event(hotel_id):
+    with _cond:
+        _seq[hotel_id] += 1
+        _cond.notify_all()
+
+
+def _on_gap():
+    global _gaps
+    with _cond:
+        _gaps += 1
+        _cond.notify_all()
+
+
+bus.subscribe(bus.EVENTS_CHANNEL, _on_event)
+bus.on_gap(_on_gap)
+
+
+def _token(hotel_id):
+    with _cond:
+        return _seq[hotel_id], _gaps
+
+
+def _wait(hotel_id, token, timeout):
+    """True — разбудили (или шина не работает и пора опросить базу)."""
+    if not bus.healthy():
+        timeout = min(timeout, POLL_FALLBACK)
+    with _cond:
+        return _cond.wait_for(lambda: (_seq[hotel_id], _gaps) != token, timeout) or not bus.healthy()
+
+
+# ─── SSE ──────────────────────────────────────────────────────────────────────
+
+def _frame(event, data, event_id=None):
+    head = f'id: {event_id}\n' if event_id is not None else ''
+    return f'{head}event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+
+def stream(hotel_id, last_id):
+    """
+    Генератор SSE-кадров. last_id=None — только новые события (кадр hello
+    с текущей ревизией); last_id старше хранимой истории — кадр reset:
+    клиенту надо перечитать всё.
+    """
+    bus.start()
+    live = _streams.acquire(blocking=False)
+    try:
+        yield f'retry: {RETRY_MS if live else BUSY_RETRY_MS}\n\n'
+        yield from _changes(hotel_id, last_id, live)
+    finally:
+        if live:
+            _streams.release()
+
+
+def _changes(hotel_id, last_id, live):
+    if last_id is None:
+        last_id = head(hotel_id)
+        yield _frame('hello', {'revision': last_id}, last_id)
+    else:
+        oldest = ChangeEvent.objects.filter(seq__isnull=False).order_by('seq').values_list('seq', flat=True).first()
+        if oldest is not None and last_id < oldest - 1:
+            last_id = head(hotel_id)
+            yield _frame('reset', {'revision': last_id}, last_id)
+
+    deadline = time.monotonic() + (STREAM_SECONDS if live else 0)
+    while True:
+        token = _token(hotel_id)
+        sequence(hotel_id)
+        rows = list(
+            ChangeEvent.objects.filter(hotel_id=hotel_id, seq__gt=last_id).order_by('seq')
+            .values_list('seq', 'entity', 'object_id', 'op')[:BATCH]
+        )
+        for rev, entity, object_id, op in rows:
+            yield _frame('change', {'entity': entity, 'id': object_id or None, 'op': op, 'revision': rev}, rev)
+            last_id = rev
+        if len(rows) == BATCH:
+            continue
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        # ждём без соединения: пул воркера не держим на весь стрим
+        connection.close()
+        if not _wait(hotel_id, token, min(HEARTBEAT_SECONDS, remaining)):
+            yield ': ping\n\n'
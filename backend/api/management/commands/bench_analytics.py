@@ -0,0 +1,215 @@
+"""
+Сравнение движка analytics (NumPy в памяти) с обычным расчётом отчётов.
+
+Запуск:
+    python manage.py bench_analytics --hotel <id> [--runs 5] [--days 365]
+    python manage.py bench_analytics --synthetic 1000000 [--years 8] [--keep]
+
+Для каждого из --runs случайных периодов по --days дней считаются
+compute_totals (ORM) и куб (SQL с GROUPING SETS) — и то же движком;
+результаты сверяются. --synthetic N заводит временный отель с N платежами
+(плюс заезды, расходы, снятия) и после замера удаляет его.
+"""
+import random
+import time
+import uuid
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api import analytics, reports
+from api.models import Payment
+
+CUBE_GROUPINGS = 'room_type,floor,weekday,method,room_type+weekday'
+SYNTHETIC_ROOMS = 120
+
+# временный отель: номера, заезды по 1–3 ночи друг за другом в каждом номере,
+# платежи по заездам, расходы и снятия — равномерно по периоду
+SYNTHETIC_SQL = [
+    """INSERT INTO "Hotel" (id, name, timezone, "createdAt") VALUES (%(hotel)s, 'bench', 'Asia/Tashkent', now())""",
+    """
+    INSERT INTO "Room" (id, "hotelId", number, floor, "roomType", capacity, "basePrice", active, "createdAt", version)
+    SELECT %(prefix)s || 'r' || i, %(hotel)s, (100 + i)::text, 1 + i / 20,
+           (ARRAY['SINGLE', 'DOUBLE', 'TWIN', 'SUITE'])[1 + i %% 4], 2, 300000, i %% 30 <> 0, now(), 1
+    FROM generate_series(0, %(rooms)s - 1) i
+    """,
+    """
+    INSERT INTO "Stay" (id, "hotelId", "roomId", "guestName", "checkInDate", "checkOutDate", status,
+                        "pricePerNight", "weeklyDiscountAmount", "manualAdjustmentAmount", "depositExpected",
+                        "createdAt", version)
+    SELECT %(prefix)s || 's' || i, %(hotel)s, %(prefix)s || 'r' || (i %% %(rooms)s), 'Guest ' || i,
+           %(start)s::timestamptz + ((i / %(rooms)s) * %(step)s) * interval '1 day',
+           %(start)s::timestamptz + ((i / %(rooms)s) * %(step)s + 1 + i %% %(nights)s) * interval '1 day',
+           (ARRAY['CHECKED_OUT', 'CHECKED_OUT', 'CHECKED_IN', 'CANCELLED', 'BOOKED'])[1 + i %% 5],
+           200000 + (i %% 7) * 25000, 0, 0, 0, now(), 1
+    FROM generate_series(0, %(stays)s - 1) i
+    """,
+    """
+    INSERT INTO "Payment" (id, "hotelId", "stayId", "paidAt", "businessDate", method, "customMethodLabel",
+                           amount, "createdAt", version)
+    SELECT %(prefix)s || 'p' || i, %(hotel)s, s.id, s."checkInDate" + (i %% 24) * interval '1 hour',
+           ((s."checkInDate" + (i %% 24) * interval '1 hour') AT TIME ZONE 'Asia/Tashkent')::date,
+           (ARRAY['CASH', 'CARD', 'PAYME', 'CLICK', 'OTHER'])[1 + i %% 5],
+           CASE WHEN i %% 5 = 4 THEN 'Bank' END, 50000 + (i %% 40) * 12500.50, now(), 1
+    FROM generate_series(0, %(payments)s - 1) i
+    JOIN "Stay" s ON s.id = %(prefix)s || 's' || (i %% %(stays)s)
+    """,
+    """
+    INSERT INTO "Expense" (id, "hotelId", "spentAt", "businessDate", category, method, amount, "createdAt", version)
+    SELECT %(prefix)s || 'e' || i, %(hotel)s, t, (t AT TIME ZONE 'Asia/Tashkent')::date,
+           (ARRAY['SALARY', 'UTILITIES', 'FOOD', 'REPAIR', 'CLEANING', 'OTHER'])[1 + i %% 6], 'CASH',
+           10000 + (i %% 50) * 3000, now(), 1
+    FROM generate_series(0, %(expenses)s - 1) i,
+         LATERAL (SELECT %(start)s::timestamptz + (i::bigint * %(span)s / %(expenses)s) * interval '1 second' AS t) x
+    """,
+    """
+    INSERT INTO "Withdrawal" (id, "hotelId", "withdrawnAt", "businessDate", method, amount, "createdAt", version)
+    SELECT %(prefix)s || 'w' || i, %(hotel)s, t, (t AT TIME ZONE 'Asia/Tashkent')::date,
+           (ARRAY['CASH', 'CARD'])[1 + i %% 2], 500000 + (i %% 10) * 100000, now(), 1
+    FROM generate_series(0, %(withdrawals)s - 1) i,
+         LATERAL (SELECT %(start)s::timestamptz + (i::bigint * %(span)s / %(withdrawals)s) * interval '1 second' AS t) x
+    """,
+]
+
+CLEANUP_TABLES = [
+    ('api_room_night', 'hotel_id'), ('Payment', 'hotelId'), ('Expense', 'hotelId'),
+    ('Withdrawal', 'hotelId'), ('Stay', 'hotelId'), ('Room', 'hotelId'),
+    ('api_change_event', 'hotel_id'), ('Hotel', 'id'),
+]
+
+
+def _rounded(value):
+    if isinstance(value, dict):
+        return {k: _rounded(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_rounded(v) for v in value]
+    if isinstance(value, float):
+        return round(value, 2)
+    return value
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает движок отчётов в памяти (NumPy) с расчётом через ORM/SQL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hotel', help='отель с данными')
+        parser.add_argument('--synthetic', type=int, help='завести временный отель с таким числом платежей')
+        parser.add_argument('--years', type=int, default=8, help='период синтетических данных')
+        parser.add_argument('--keep', action='store_true', help='не удалять синтетический отель')
+        parser.add_argument('--runs', type=int, default=5, help='сколько случайных периодов')
+        parser.add_argument('--days', type=int, default=365, help='длина периода')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        if analytics.np is None:
+            raise CommandError('numpy не установлен')
+        if bool(options['hotel']) == bool(options['synthetic']):
+            raise CommandError('нужен ровно один из --hotel и --synthetic')
+        hotel_id = options['hotel']
+        if options['synthetic']:
+            hotel_id = self._synthesize(options['synthetic'], options['years'])
+        try:
+            self._bench(hotel_id, options)
+        finally:
+            if options['synthetic'] and not options['keep']:
+                self._cleanup(hotel_id)
+
+    def _synthesize(self, payments, years):
+        hotel_id = str(uuid.uuid4())
+        stays = max(payments // 3, SYNTHETIC_ROOMS)
+        start = date.today() - timedelta(days=365 * years)
+        # шаг заездов в номере — чтобы они заняли весь период
+        step = max(365 * years * SYNTHETIC_ROOMS // stays, 1)
+        params = {
+            'hotel': hotel_id, 'prefix': hotel_id[:8], 'rooms': SYNTHETIC_ROOMS, 'stays': stays,
+            'step': step, 'nights': min(step, 3),
+            'payments': payments, 'expenses': max(payments // 10, 1), 'withdrawals': max(payments // 20, 1),
+            'start': start, 'span': 365 * years * 86400,
+        }
+        started = time.monotonic()
+        with transaction.atomic(), connection.cursor() as cur:
+            for sql in SYNTHETIC_SQL:
+                cur.execute(sql, params)
+            cur.execute('SELECT array_agg(id) FROM "Stay" WHERE "hotelId" = %s', [hotel_id])
+            reports.sync_room_nights(cur.fetchone()[0])
+        with connection.cursor() as cur:
+            cur.execute('ANALYZE')
+        self.stdout.write(
+            f'Синтетический отель {hotel_id}: {payments} платежей, {stays} заездов '
+            f'({time.monotonic() - started:.1f} с)'
+        )
+        return hotel_id
+
+    def _cleanup(self, hotel_id):
+        with transaction.atomic(), connection.cursor() as cur:
+            for table, column in CLEANUP_TABLES:
+                cur.execute(f'DELETE FROM "{table}" WHERE "{column}" = %s', [hotel_id])
+        analytics.evict(hotel_id)
+        self.stdout.write(f'Синтетический отель {hotel_id} удалён')
+
+    def _bench(self, hotel_id, options):
+        span = Payment.objects.filter(hotel_id=hotel_id, business_date__isnull=False) \
+            .values_list('business_date', flat=True)
+        first, last = span.order_by('business_date').first(), span.order_by('-business_date').first()
+        if first is None:
+            raise CommandError('у отеля нет платежей')
+
+        analytics.evict(hotel_id)
+        started = time.monotonic()
+        with analytics.snapshot(hotel_id) as frame:
+            info = frame.stats()
+        rows = sum(info['rows'].values())
+        self.stdout.write(
+            f'Загрузка движка: {rows} строк, {info["bytes"] / 2**20:.1f} МБ, '
+            f'{time.monotonic() - started:.2f} с'
+        )
+        started = time.monotonic()
+        with analytics.snapshot(hotel_id):
+            pass
+        self.stdout.write(f'Сверка с лентой без изменений: {(time.monotonic() - started) * 1000:.1f} мс')
+
+        rnd = random.Random(options['seed'])
+        days = options['days']
+        groupings = reports.parse_cube_dims(CUBE_GROUPINGS)
+        orm_totals = orm_cube = engine_totals = engine_cube = 0.0
+        mismatches = 0
+        self.stdout.write(f'{"период":<24}{"ORM":>10}{"движок":>10}{"SQL куб":>10}{"движок":>10}')
+        for _ in range(options['runs']):
+            offset = rnd.randint(0, max((last - first).days - days, 0))
+            from_date = first + timedelta(days=offset)
+            to_date = from_date + timedelta(days=days - 1)
+            prev_end = from_date - timedelta(days=1)
+            prev = (prev_end - (to_date - from_date), prev_end)
+            periods = [('cur', from_date, to_date), ('prev', *prev)]
+
+            t0 = time.monotonic()
+            expected = reports.compute_totals(hotel_id, from_date, to_date)
+            t1 = time.monotonic()
+            got = analytics.totals(hotel_id, from_date, to_date)
+            t2 = time.monotonic()
+            expected_cube = reports.compute_cube(hotel_id, from_date, to_date, groupings, prev)
+            t3 = time.monotonic()
+            got_cube = reports.cube_result(groupings, analytics.cube(hotel_id, periods, groupings), prev)
+            t4 = time.monotonic()
+
+            ok = _rounded(expected) == _rounded(got) and _rounded(expected_cube) == _rounded(got_cube)
+            mismatches += not ok
+            orm_totals += t1 - t0
+            engine_totals += t2 - t1
+            orm_cube += t3 - t2
+            engine_cube += t4 - t3
+            self.stdout.write(
+                f'{from_date:%Y-%m-%d}..{to_date:%Y-%m-%d} {t1 - t0:>9.3f}{t2 - t1:>10.3f}'
+                f'{t3 - t2:>10.3f}{t4 - t3:>10.3f}{"" if ok else "  РАСХОЖДЕНИЕ"}'
+            )
+
+        runs = max(options['runs'], 1)
+        self.stdout.write(
+            f'Среднее: totals {orm_totals / runs:.3f} → {engine_totals / runs:.3f} с '
+            f'(×{orm_totals / max(engine_totals, 1e-9):.0f}), '
+            f'куб {orm_cube / runs:.3f} → {engine_cube / runs:.3f} с '
+            f'(×{orm_cube / max(engine_cube, 1e-9):.0f})'
+        )
+        if mismatches:
+            raise CommandError(f'результаты разошлись в {mismatches} периодах')
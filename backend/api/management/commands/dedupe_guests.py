@@ -0,0 +1,232 @@
+"""
+Поиск и слияние дублей в клиентской базе (api_guest).
+
+Запуск:
+    python manage.py dedupe_guests --dry-run          # только отчёт
+    python manage.py dedupe_guests [--hotel <id>] [--batch-size 500]
+
+Кандидаты ищутся по ключам блокировки, а не попарным сравнением:
+  * телефон — последние 9 цифр ('+998 90 123-45-67' и '90 1234567' совпадут);
+  * имя — транслитерация кириллицы в латиницу, нижний регистр, без знаков,
+    слова по алфавиту ('Навоий Алишер' и 'Alisher Navoi' совпадут).
+Одинаковое имя с разными телефонами — разные люди; гость без телефона
+приклеивается к тёзке, только если у тёзок телефон один. Группы собираются
+union-find'ом, заезды перевешиваются на основного гостя пачками.
+"""
+import re
+import time
+from collections import defaultdict
+from functools import lru_cache
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count
+
+from api import events
+from api.models import Guest, Stay
+
+PHONE_KEY_DIGITS = 9
+MIN_PHONE_DIGITS = 7
+
+TRANSLIT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo',
+    'ж': 'j', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
+    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'x', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sh', 'ъ': '',
+    'ы': 'i', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+    'ў': 'o', 'қ': 'q', 'ғ': 'g', 'ҳ': 'h',
+}
+# апострофы узбекской латиницы (o'g'li, G'ulom) выбрасываются до разбиения на слова
+TRANSLIT_TABLE = str.maketrans({**TRANSLIT, "'": None, '`': None, 'ʻ': None, 'ʼ': None, '‘': None, '’': None})
+WORD_RE = re.compile(r'[^\W_]+')
+# варианты латиницы, которыми одно и то же имя пишут по-разному
+SPELLING = [
+    (re.compile(r'kh'), 'x'),
+    (re.compile(r'dj|zh'), 'j'),
+    (re.compile(r'iy$'), 'i'),
+    (re.compile(r'(.)\1+'), r'\1'),
+]
+
+
+def phone_key(digits):
+    if len(digits) < MIN_PHONE_DIGITS:
+        return None
+    return digits[-PHONE_KEY_DIGITS:]
+
+
+@lru_cache(maxsize=200_000)
+def _word_key(word):
+    # слова в именах сильно повторяются — кэш снимает почти все регулярки
+    for pattern, repl in SPELLING:
+        word = pattern.sub(repl, word)
+    return ''.join(ch for ch in word if ch.isascii() and ch.isalnum())
+
+
+def name_key(name):
+    words = WORD_RE.findall((name or '').lower().translate(TRANSLIT_TABLE))
+    return ' '.join(sorted(filter(None, map(_word_key, words)))) or None
+
+
+class UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, x):
+        parent = self.parent
+        root = x
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while x != root:
+            parent[x], x = root, parent.get(x, x)
+        return root
+
+    def union(self, a, b):
+        self.parent.setdefault(a, a)
+        self.parent.setdefault(b, b)
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[rb] = ra
+
+
+def find_groups(guests):
+    """guests: {id: (hotel_id, name, phone_digits)} → списки id по группам дублей."""
+    uf = UnionFind()
+    by_phone = {}
+    by_name = defaultdict(list)
+    for gid, (hid, name, digits) in guests.items():
+        pk = phone_key(digits)
+        if pk:
+            first = by_phone.setdefault((hid, pk), gid)
+            if first != gid:
+                uf.union(first, gid)
+        nk = name_key(name)
+        if nk:
+            by_name[(hid, nk)].append((gid, pk))
+
+    for members in by_name.values():
+        if len(members) < 2:
+            continue
+        phones = {pk for _, pk in members if pk}
+        if len(phones) > 1:
+            continue  # тёзки с разными номерами — не один человек
+        first = members[0][0]
+        for gid, _ in members[1:]:
+            uf.union(first, gid)
+
+    groups = defaultdict(list)
+    for gid in uf.parent:
+        groups[uf.find(gid)].append(gid)
+    return [g for g in groups.values() if len(g) > 1]
+
+
+class Command(BaseCommand):
+    help = 'Находит и сливает дубли гостей (по телефону и транслитерированному имени)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hotel', help='только этот отель')
+        parser.add_argument('--dry-run', action='store_true', help='показать группы, ничего не менять')
+        parser.add_argument('--batch-size', type=int, default=500, help='групп на транзакцию')
+        parser.add_argument('--show', type=int, default=20, help='сколько групп вывести в отчёте')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        qs = Guest.objects.all()
+        stays = Stay.objects.exclude(guest_id=None)
+        if options['hotel']:
+            qs = qs.filter(hotel_id=options['hotel'])
+            stays = stays.filter(hotel_id=options['hotel'])
+
+        keys = {
+            gid: (hid, name, digits) for gid, hid, name, digits
+            in qs.values_list('id', 'hotel_id', 'name', 'phone_digits').iterator(chunk_size=20000)
+        }
+        groups = find_groups(keys)
+        if not groups:
+            self.stdout.write(f'Дублей нет ({len(keys)} гостей, {time.monotonic() - started:.1f} с)')
+            return
+
+        # остальные поля и число заездов — только для попавших в группы
+        grouped = [gid for group in groups for gid in group]
+        rows = {}
+        stay_counts = {}
+        for i in range(0, len(grouped), 10000):
+            chunk = grouped[i:i + 10000]
+            for gid, hid, name, phone, digits, notes, created in Guest.objects.filter(id__in=chunk).values_list(
+                    'id', 'hotel_id', 'name', 'phone', 'phone_digits', 'notes', 'created_at'):
+                rows[gid] = (hid, name, phone, digits, notes, created)
+            stay_counts.update(
+                stays.filter(guest_id__in=chunk).values('guest_id')
+                .annotate(n=Count('id')).values_list('guest_id', 'n')
+            )
+
+        def rank(gid):
+            # основной — с телефоном, с наибольшим числом заездов, самый ранний
+            _, _, _, digits, _, created = rows[gid]
+            return (not digits, -stay_counts.get(gid, 0), created, gid)
+
+        plan = []
+        for group in groups:
+            keep, *dups = sorted(group, key=rank)
+            plan.append((keep, dups))
+        removed = sum(len(dups) for _, dups in plan)
+
+        self.stdout.write(
+            f'Гостей: {len(keys)}, групп дублей: {len(plan)}, к удалению: {removed} '
+            f'({time.monotonic() - started:.1f} с)'
+        )
+        for keep, dups in plan[:options['show']]:
+            self.stdout.write(f'  {self._label(rows, stay_counts, keep)}')
+            for gid in dups:
+                self.stdout.write(f'    ← {self._label(rows, stay_counts, gid)}')
+        if options['dry_run']:
+            return
+
+        size = max(options['batch_size'], 1)
+        moved = 0
+        for i in range(0, len(plan), size):
+            moved += self._merge(plan[i:i + size], rows)
+        self.stdout.write(
+            f'Слито: {removed} гостей, перевешено заездов: {moved} ({time.monotonic() - started:.1f} с)'
+        )
+
+    @staticmethod
+    def _label(rows, stay_counts, gid):
+        _, name, phone, _, _, _ = rows[gid]
+        return f'{name} {phone or "—"} [{gid}] заездов: {stay_counts.get(gid, 0)}'
+
+    def _merge(self, batch, rows):
+        """Одна транзакция на пачку: заезды → основному гостю, дубли удаляются."""
+        dup_ids, keep_ids = [], []
+        updates = []  # основной гость: телефон и заметки, подобранные у дублей
+        for keep, dups in batch:
+            dup_ids += dups
+            keep_ids += [keep] * len(dups)
+            _, _, phone, digits, notes, _ = rows[keep]
+            merged_notes = [notes] if notes else []
+            for gid in dups:
+                _, _, d_phone, d_digits, d_notes, _ = rows[gid]
+                if not digits and d_digits:
+                    phone, digits = d_phone, d_digits
+                if d_notes and d_notes not in merged_notes:
+                    merged_notes.append(d_notes)
+            updates.append((keep, phone, digits, '\n'.join(merged_notes)))
+
+        hotels = {rows[keep][0] for keep, _ in batch}
+        with transaction.atomic(), connection.cursor() as cur:
+            cur.execute(
+                'UPDATE "Stay" s SET "guestId" = m.keep, version = s.version + 1 '
+                'FROM unnest(%s::varchar[], %s::varchar[]) AS m(id, keep) WHERE s."guestId" = m.id',
+                [dup_ids, keep_ids],
+            )
+            moved = cur.rowcount
+            cur.execute('DELETE FROM api_guest WHERE id = ANY(%s::varchar[])', [dup_ids])
+            cur.execute(
+                'UPDATE api_guest g SET phone = u.phone, phone_digits = u.digits, notes = u.notes, '
+                'version = g.version + 1 '
+                'FROM unnest(%s::varchar[], %s::varchar[], %s::varchar[], %s::text[]) AS u(id, phone, digits, notes) '
+                'WHERE g.id = u.id',
+                [list(c) for c in zip(*updates)],
+            )
+            for hid in hotels:
+                events.record_bulk(hid, ['guests', 'stays'])
+        return moved
@@ -0,0 +1,64 @@
+"""
+Загрузка истории отеля (гости, заезды, платежи, расходы) из CSV/NDJSON.
+
+Запуск:
+    python manage.py import_hotel_data --hotel <hotel_id> \
+        --guests guests.csv --stays stays.ndjson --payments payments.csv --expenses expenses.csv
+
+Формат определяется по расширению (.ndjson/.jsonl → NDJSON, иначе CSV с
+заголовком); '-' вместо пути — stdin, тогда нужен --format. Колонки — как в
+JSON API (room_number можно вместо room_id). Всё грузится одной транзакцией.
+"""
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.importer import ENTITIES, ImportFailed, detect_format, import_hotel_data
+from api.models import Hotel
+
+
+class Command(BaseCommand):
+    help = 'Массовый импорт истории отеля через COPY (без сигналов и Telegram)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hotel', required=True, help='id отеля')
+        for entity in ENTITIES:
+            parser.add_argument(f'--{entity}', metavar='PATH', help=f'файл {entity} (CSV/NDJSON или -)')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='формат для stdin / нестандартных расширений')
+
+    def handle(self, *args, **options):
+        if not Hotel.objects.filter(id=options['hotel']).exists():
+            raise CommandError(f'Hotel {options["hotel"]} not found')
+
+        sources, opened = {}, []
+        try:
+            for entity in ENTITIES:
+                path = options.get(entity)
+                if not path:
+                    continue
+                fmt = options['format'] or detect_format(path)
+                if path == '-':
+                    fileobj = sys.stdin.buffer
+                else:
+                    fileobj = open(path, 'rb')
+                    opened.append(fileobj)
+                sources[entity] = (fileobj, fmt)
+            if not sources:
+                raise CommandError('Nothing to import: pass at least one of ' + ', '.join(f'--{e}' for e in ENTITIES))
+
+            try:
+                result = import_hotel_data(options['hotel'], sources)
+            except ImportFailed as exc:
+                for err in exc.errors:
+                    where = f'{err["entity"]}:{err["line"]}' if err['line'] else err['entity']
+                    self.stderr.write(f'  {where}: {err["message"]}')
+                raise CommandError(f'Import rolled back: {exc}')
+        finally:
+            for f in opened:
+                f.close()
+
+        for entity, stats in result['entities'].items():
+            self.stdout.write(f'{entity}: прочитано {stats["read"]}, добавлено {stats["inserted"]}')
+        self.stdout.write(
+            f'Готово: {result["rows"]} строк за {result["seconds"]} с ({result["rows_per_sec"]} строк/с)'
+        )
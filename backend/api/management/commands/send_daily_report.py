@@ -10,14 +10,14 @@ Cron (23:00 по серверному времени):
 import json
 import logging
 import urllib.request
-from datetime import datetime, timedelta, timezone
-from zoneinfo import ZoneInfo
+from datetime import datetime
 
 from django.conf import settings
 from django.core.management.base import BaseCommand
-from django.db.models import Sum
 
-from api.models import Hotel, HotelSettings, Room, Stay, Payment, Expense, Withdrawal
+from api import events
+from api.models import Hotel, HotelSettings, hotel_zone
+from api.reports import compute_dashboard
 
 logger = logging.getLogger(__name__)
 
@@ -48,65 +48,28 @@ def _send_telegram(group_id, text):
         return False
 
 
-def build_report(hotel, today_start_utc, today_end_utc, today_label):
-    """Собирает текст отчёта для одного отеля."""
-
-    # ── Заезды сегодня ────────────────────────────────────────────────────────
-    checkins_today = Stay.objects.filter(
-        hotel=hotel,
-        check_in_date__gte=today_start_utc,
-        check_in_date__lt=today_end_utc,
-        status__in=['CHECKED_IN', 'CHECKED_OUT'],
-    ).count()
-
-    # ── Выезды сегодня ────────────────────────────────────────────────────────
-    checkouts_today = Stay.objects.filter(
-        hotel=hotel,
-        check_out_date__gte=today_start_utc,
-        check_out_date__lt=today_end_utc,
-        status='CHECKED_OUT',
-    ).count()
-
-    # ── Приход сегодня по методам ─────────────────────────────────────────────
-    payments_today = Payment.objects.filter(
-        hotel=hotel,
-        paid_at__gte=today_start_utc,
-        paid_at__lt=today_end_utc,
-    )
-
-    income_by_method = {}
-    income_total = 0
-    for p in payments_today:
-        income_by_method[p.method] = income_by_method.get(p.method, 0) + float(p.amount)
-        income_total += float(p.amount)
-
-    # ── Расходы сегодня по категориям ─────────────────────────────────────────
-    expenses_today = Expense.objects.filter(
-        hotel=hotel,
-        spent_at__gte=today_start_utc,
-        spent_at__lt=today_end_utc,
-    )
-
+def build_report(hotel, today):
+    """Собирает текст отчёта для одного отеля; today — местная дата (reports.compute_dashboard)."""
+    figures = compute_dashboard(hotel.id, today)['figures']
+    income_by_method = figures['income_by_method']
+    income_total = figures['income_total']
     expenses_by_category = {}
-    expenses_total = 0
-    for e in expenses_today:
-        label = CATEGORY_LABELS.get(e.category, e.category)
-        expenses_by_category[label] = expenses_by_category.get(label, 0) + float(e.amount)
-        expenses_total += float(e.amount)
-
-    # ── Текущая занятость ─────────────────────────────────────────────────────
-    total_rooms = Room.objects.filter(hotel=hotel, active=True).count()
-    occupied_rooms = Stay.objects.filter(hotel=hotel, status='CHECKED_IN').count()
-    free_rooms = max(total_rooms - occupied_rooms, 0)
+    for category, amount in figures['expenses_by_category'].items():
+        label = CATEGORY_LABELS.get(category, category)
+        expenses_by_category[label] = expenses_by_category.get(label, 0) + amount
+    expenses_total = figures['expenses_total']
+    withdrawals_by_method = figures['withdrawals_by_method']
+    withdrawals_total = figures['withdrawals_total']
+    total_rooms, occupied_rooms, free_rooms = figures['total_rooms'], figures['occupied_rooms'], figures['free_rooms']
 
     # ── Сборка текста ─────────────────────────────────────────────────────────
     lines = [
-        f'📊 Отчёт за {today_label}',
+        f'📊 Отчёт за {today:%d.%m.%Y}',
         f'🏨 {hotel.name}',
         '',
         '🛎 Движение за день:',
-        f'  Заездов: {checkins_today}',
-        f'  Выездов: {checkouts_today}',
+        f'  Заездов: {figures["checked_in"]}',
+        f'  Выездов: {figures["checked_out"]}',
         '',
         '💰 Приход за день:',
     ]
@@ -126,19 +89,7 @@ def build_report(hotel, today_start_utc, today_end_utc, today_label):
     else:
         lines.append('  Расходов не было')
 
-    # ── Снятия за день ────────────────────────────────────────────────────────
-    withdrawals_today = Withdrawal.objects.filter(
-        hotel=hotel,
-        withdrawn_at__gte=today_start_utc,
-        withdrawn_at__lt=today_end_utc,
-    )
-    withdrawals_by_method = {}
-    withdrawals_total = 0
-    for w in withdrawals_today:
-        withdrawals_by_method[w.method] = withdrawals_by_method.get(w.method, 0) + float(w.amount)
-        withdrawals_total += float(w.amount)
-
-    profit = income_total - expenses_total
+    profit = figures['profit']
     lines += ['', f'📈 Прибыль за день: {profit:,.0f}']
 
     if withdrawals_by_method:
@@ -162,6 +113,10 @@ class Command(BaseCommand):
     help = 'Отправляет ежедневный отчёт в Telegram для каждого отеля'
 
     def handle(self, *args, **options):
+        pruned = events.prune()
+        if pruned:
+            self.stdout.write(f'Лента изменений: удалено {pruned} старых событий')
+
         hotel_settings = HotelSettings.objects.exclude(telegram_group_id='')
 
         if not hotel_settings.exists():
@@ -175,17 +130,7 @@ class Command(BaseCommand):
             except Hotel.DoesNotExist:
                 continue
 
-            tz = ZoneInfo(hotel.timezone or 'UTC')
-            now_local = datetime.now(tz)
-            today_start_local = now_local.replace(hour=0, minute=0, second=0, microsecond=0)
-            today_end_local = today_start_local + timedelta(days=1)
-
-            today_start_utc = today_start_local.astimezone(timezone.utc)
-            today_end_utc = today_end_local.astimezone(timezone.utc)
-
-            today_label = today_start_local.strftime('%d.%m.%Y')
-
-            text = build_report(hotel, today_start_utc, today_end_utc, today_label)
+            text = build_report(hotel, datetime.now(hotel_zone(hotel.id)).date())
 
             if _send_telegram(hs.telegram_group_id, text):
                 sent += 1
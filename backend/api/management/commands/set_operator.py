@@ -0,0 +1,29 @@
+"""
+Права оператора платформы (GET /portfolio — отчёт по всем отелям).
+
+Запуск:
+    python manage.py set_operator <username>            # выдать
+    python manage.py set_operator <username> --revoke   # снять
+
+Флаг хранится в User.is_operator и проверяется по id пользователя, а не по
+имени из JWT: имя может выбрать кто угодно при регистрации.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import User
+
+
+class Command(BaseCommand):
+    help = 'Выдаёт или снимает права оператора платформы'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--revoke', action='store_true', help='снять права')
+
+    def handle(self, *args, **options):
+        grant = not options['revoke']
+        # проверяется на каждом запросе — выданные токены перевыпускать не нужно
+        updated = User.objects.filter(email__iexact=options['username']).update(is_operator=grant)
+        if not updated:
+            raise CommandError(f'нет пользователя {options["username"]}')
+        self.stdout.write(f'{options["username"]}: {"оператор" if grant else "права оператора сняты"}')
@@ -0,0 +1,38 @@
+"""
+Ежесуточный снимок темпа продаж (api_pace_snapshot) для GET /reports/pace.
+
+Запуск:
+    python manage.py snapshot_pace [--hotel <id>] [--days 365]
+
+Cron (раз в сутки, после полуночи по местному времени отелей):
+    30 0 * * * /path/to/venv/bin/python /path/to/backend/manage.py snapshot_pace
+
+Дата снимка — сегодняшняя местная дата отеля; повторный запуск в тот же день
+перезаписывает его снимок, а не дублирует.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.models import Hotel
+from api.reports import PACE_HORIZON_DAYS, snapshot_pace
+
+
+class Command(BaseCommand):
+    help = 'Сохраняет «на книгах» будущих ночей каждого отеля (темп продаж)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hotel', help='только этот отель')
+        parser.add_argument('--days', type=int, default=PACE_HORIZON_DAYS, help='горизонт снимка в ночах')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        hotels = Hotel.objects.order_by('name')
+        if options['hotel']:
+            hotels = hotels.filter(id=options['hotel'])
+        total = 0
+        for hotel_id, name in hotels.values_list('id', 'name'):
+            as_of, rows = snapshot_pace(hotel_id, max(options['days'], 1))
+            total += rows
+            self.stdout.write(f'✓ {name}: снимок на {as_of:%d.%m.%Y}, ночей: {rows}')
+        self.stdout.write(f'Готово. Строк: {total} ({time.monotonic() - started:.1f} с)')
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.4 on 2026-10-19 01:53
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_row_version'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='guest',
+            name='phone_digits',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+        migrations.RunSQL(
+            "UPDATE api_guest SET phone_digits = regexp_replace(phone, '\\D', '', 'g') WHERE phone <> ''",
+            migrations.RunSQL.noop,
+        ),
+        migrations.AlterField(
+            model_name='stay',
+            name='guest_id',
+            field=models.CharField(blank=True, db_column='guestId', db_index=True, max_length=36, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='guest',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='api_guest_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='guest',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['phone_digits'], name='api_guest_phone_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 5.1.4 on 2026-10-19 01:55
+
+from django.db import migrations, models
+
+
+# дубли по нормализованному телефону сливаются в самого раннего гостя:
+# заезды перевешиваются на него, заметки дописываются.
+#
+# Если дубли есть, затронутые строки до слияния сохраняются в
+# api_guest_merge_backup (гости — и дубли, и основные, keep = id основного) и
+# api_stay_guest_backup (прежний гость заезда): откат миграции восстанавливает
+# их как были. В состоянии моделей Django этих таблиц нет; после проверки
+# слияния их удаляют вручную —
+#     DROP TABLE api_guest_merge_backup, api_stay_guest_backup;
+# — и тогда откат вернёт только ограничение. Нет дублей — нет и таблиц.
+MERGE_DUPLICATES = [
+    """
+    CREATE TEMP TABLE _guest_dup ON COMMIT DROP AS
+    SELECT id, keep FROM (
+        SELECT id, first_value(id) OVER (
+            PARTITION BY hotel_id, phone_digits ORDER BY created_at, id
+        ) AS keep
+        FROM api_guest WHERE phone_digits <> ''
+    ) r WHERE id <> keep
+    """,
+    """
+    DO $$
+    DECLARE
+        merged integer;
+    BEGIN
+        SELECT count(*) INTO merged FROM _guest_dup;
+        IF merged = 0 THEN
+            RETURN;
+        END IF;
+        CREATE TABLE api_guest_merge_backup AS
+        SELECT g.id, g.hotel_id, g.name, g.phone, g.phone_digits, g.notes, g.created_at, g.version, d.keep
+        FROM api_guest g
+        JOIN (SELECT id, keep FROM _guest_dup UNION SELECT DISTINCT keep, keep FROM _guest_dup) d ON d.id = g.id;
+        CREATE TABLE api_stay_guest_backup AS
+        SELECT s.id, s."guestId" AS guest_id FROM "Stay" s JOIN _guest_dup d ON s."guestId" = d.id;
+        RAISE NOTICE 'api_guest: % duplicate guests merged, backup in api_guest_merge_backup '
+                     'and api_stay_guest_backup (drop them after checking)', merged;
+    END $$
+    """,
+    'UPDATE "Stay" s SET "guestId" = d.keep FROM _guest_dup d WHERE s."guestId" = d.id',
+    """
+    UPDATE api_guest g SET notes = concat_ws(E'\\n', nullif(g.notes, ''), m.notes)
+    FROM (
+        SELECT d.keep, string_agg(nullif(x.notes, ''), E'\\n' ORDER BY x.created_at) AS notes
+        FROM _guest_dup d JOIN api_guest x ON x.id = d.id
+        GROUP BY d.keep
+    ) m
+    WHERE g.id = m.keep AND m.notes IS NOT NULL
+    """,
+    'DELETE FROM api_guest g USING _guest_dup d WHERE g.id = d.id',
+    'DROP TABLE _guest_dup',
+]
+
+UNMERGE_DUPLICATES = [
+    """
+    DO $$
+    BEGIN
+        IF to_regclass('api_guest_merge_backup') IS NULL THEN
+            RETURN;
+        END IF;
+        UPDATE api_guest g SET notes = b.notes
+        FROM api_guest_merge_backup b WHERE g.id = b.id AND b.id = b.keep;
+        INSERT INTO api_guest (id, hotel_id, name, phone, phone_digits, notes, created_at, version)
+        SELECT id, hotel_id, name, phone, phone_digits, notes, created_at, version
+        FROM api_guest_merge_backup WHERE id <> keep
+        ON CONFLICT (id) DO NOTHING;
+        UPDATE "Stay" s SET "guestId" = b.guest_id
+        FROM api_stay_guest_backup b WHERE s.id = b.id;
+        DROP TABLE api_guest_merge_backup;
+        DROP TABLE api_stay_guest_backup;
+    END $$
+    """,
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_guest_search'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='guest',
+            name='hotel_id',
+            field=models.CharField(db_index=True, max_length=36),
+        ),
+        migrations.RunSQL(MERGE_DUPLICATES, UNMERGE_DUPLICATES),
+        migrations.AddConstraint(
+            model_name='guest',
+            constraint=models.UniqueConstraint(condition=models.Q(('phone_digits', ''), _negated=True), fields=('hotel_id', 'phone_digits'), name='api_guest_hotel_phone_uniq'),
+        ),
+    ]
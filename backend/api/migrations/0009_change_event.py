@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-19 02:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_guest_phone_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('hotel_id', models.CharField(max_length=36)),
+                ('entity', models.CharField(max_length=30)),
+                ('object_id', models.CharField(blank=True, default='', max_length=36)),
+                ('op', models.CharField(max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'db_table': 'api_change_event',
+                'indexes': [models.Index(fields=['hotel_id', 'id'], name='api_change_event_feed')],
+            },
+        ),
+    ]
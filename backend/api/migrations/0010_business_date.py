@@ -0,0 +1,96 @@
+# Generated by Django 5.1.4 on 2026-10-19 02:12
+
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+BATCH = 5000
+SOURCES = [
+    ('Payment', 'paidAt'), ('Expense', 'spentAt'), ('Transfer', 'transferredAt'), ('Withdrawal', 'withdrawnAt'),
+]
+
+
+def backfill(apps, schema_editor):
+    """
+    Пачками по id, каждая пачка — своя транзакция (миграция неатомарная):
+    большие таблицы не блокируются целиком, прерванный прогон продолжается
+    с незаполненных строк.
+    """
+    zones = {}
+    for hid, name in apps.get_model('api', 'Hotel').objects.values_list('id', 'timezone'):
+        try:
+            ZoneInfo(name or '')
+            zones[hid] = name
+        except (ZoneInfoNotFoundError, ValueError):
+            zones[hid] = 'UTC'
+    if not zones:
+        return
+    with schema_editor.connection.cursor() as cur:
+        for table, column in SOURCES:
+            last = ''
+            while True:
+                cur.execute(
+                    f'SELECT max(id) FROM (SELECT id FROM "{table}" WHERE id > %s ORDER BY id LIMIT %s) b',
+                    [last, BATCH],
+                )
+                upper = cur.fetchone()[0]
+                if upper is None:
+                    break
+                cur.execute(
+                    f'UPDATE "{table}" t SET "businessDate" = (t."{column}" AT TIME ZONE z.tz)::date '
+                    'FROM unnest(%s::varchar[], %s::text[]) AS z(hotel, tz) '
+                    'WHERE z.hotel = t."hotelId" AND t.id > %s AND t.id <= %s AND t."businessDate" IS NULL',
+                    [list(zones), list(zones.values()), last, upper],
+                )
+                last = upper
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('api', '0009_change_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expense',
+            name='business_date',
+            field=models.DateField(blank=True, db_column='businessDate', null=True),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='business_date',
+            field=models.DateField(blank=True, db_column='businessDate', null=True),
+        ),
+        migrations.AddField(
+            model_name='transfer',
+            name='business_date',
+            field=models.DateField(blank=True, db_column='businessDate', null=True),
+        ),
+        migrations.AddField(
+            model_name='withdrawal',
+            name='business_date',
+            field=models.DateField(blank=True, db_column='businessDate', null=True),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        # индексы — после заполнения: строятся один раз и без блокировки записи
+        AddIndexConcurrently(
+            model_name='expense',
+            index=models.Index(fields=['hotel', 'business_date'], name='expense_hotel_bdate'),
+        ),
+        AddIndexConcurrently(
+            model_name='payment',
+            index=models.Index(fields=['hotel', 'business_date'], name='payment_hotel_bdate'),
+        ),
+        AddIndexConcurrently(
+            model_name='transfer',
+            index=models.Index(fields=['hotel', 'business_date'], name='transfer_hotel_bdate'),
+        ),
+        AddIndexConcurrently(
+            model_name='withdrawal',
+            index=models.Index(fields=['hotel', 'business_date'], name='withdrawal_hotel_bdate'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.1.4 on 2026-10-19 02:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# ночи уже закрытых и текущих заездов — то же, что reports.ROOM_NIGHTS_SQL
+BACKFILL = """
+    INSERT INTO api_room_night (hotel_id, room_id, stay_id, night, revenue)
+    SELECT s."hotelId", s."roomId", s.id, d.night::date,
+           CASE WHEN d.i = t.nights THEN t.total - t.share * (t.nights - 1) ELSE t.share END
+    FROM "Stay" s
+    CROSS JOIN LATERAL (
+        SELECT c.nights, c.total, round(c.total / NULLIF(c.nights, 0), 2) AS share
+        FROM (SELECT s."checkOutDate"::date - s."checkInDate"::date AS nights,
+                     (s."checkOutDate"::date - s."checkInDate"::date) * s."pricePerNight"
+                     - s."weeklyDiscountAmount" + s."manualAdjustmentAmount" AS total) c
+    ) t
+    CROSS JOIN LATERAL generate_series(
+        s."checkInDate"::date::timestamp, s."checkOutDate"::date::timestamp - interval '1 day', interval '1 day'
+    ) WITH ORDINALITY AS d (night, i)
+    WHERE s.status IN ('CHECKED_IN', 'CHECKED_OUT')
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_business_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomNight',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('hotel_id', models.CharField(max_length=36)),
+                ('room_id', models.CharField(max_length=36)),
+                ('night', models.DateField()),
+                ('revenue', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('stay', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.stay')),
+            ],
+            options={
+                'db_table': 'api_room_night',
+                'indexes': [models.Index(fields=['hotel_id', 'night'], name='api_room_night_hotel'), models.Index(fields=['room_id', 'night'], name='api_room_night_room')],
+                'constraints': [models.UniqueConstraint(fields=('stay', 'night'), name='api_room_night_uniq')],
+            },
+        ),
+        migrations.RunSQL(BACKFILL, migrations.RunSQL.noop),
+    ]
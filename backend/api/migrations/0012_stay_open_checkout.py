@@ -0,0 +1,20 @@
+# Generated by Django 5.1.4 on 2026-10-19 02:25
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('api', '0011_room_night'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='stay',
+            index=models.Index(condition=models.Q(('status__in', ['BOOKED', 'CHECKED_IN'])), fields=['hotel', 'check_out_date'], name='stay_open_checkout'),
+        ),
+    ]
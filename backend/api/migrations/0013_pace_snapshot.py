@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-19 02:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_stay_open_checkout'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('hotel_id', models.CharField(max_length=36)),
+                ('as_of', models.DateField()),
+                ('target', models.DateField()),
+                ('room_nights', models.IntegerField()),
+                ('revenue', models.DecimalField(decimal_places=2, max_digits=20)),
+            ],
+            options={
+                'db_table': 'api_pace_snapshot',
+                'constraints': [models.UniqueConstraint(fields=('hotel_id', 'target', 'as_of'), name='api_pace_snapshot_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 02:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_pace_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='is_operator',
+            field=models.BooleanField(db_column='isOperator', default=False),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.4 on 2026-10-19 02:46
+
+from django.db import migrations, models
+
+# уже записанные события: ревизия остаётся прежней (seq = id), новые номера —
+# из своей последовательности после них
+CREATE_SEQUENCE = """
+    CREATE SEQUENCE api_change_event_seq;
+    SELECT setval('api_change_event_seq', COALESCE((SELECT max(id) FROM api_change_event), 0) + 1, false);
+    UPDATE api_change_event SET seq = id;
+"""
+DROP_SEQUENCE = 'DROP SEQUENCE api_change_event_seq;'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_user_is_operator'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='changeevent',
+            name='api_change_event_feed',
+        ),
+        migrations.AddField(
+            model_name='changeevent',
+            name='seq',
+            field=models.BigIntegerField(db_index=True, null=True),
+        ),
+        migrations.RunSQL(CREATE_SEQUENCE, DROP_SEQUENCE),
+        migrations.AddIndex(
+            model_name='changeevent',
+            index=models.Index(fields=['hotel_id', 'seq'], name='api_change_event_feed'),
+        ),
+        migrations.AddIndex(
+            model_name='changeevent',
+            index=models.Index(condition=models.Q(('seq__isnull', True)), fields=['hotel_id'], name='api_change_event_unsequenced'),
+        ),
+    ]
@@ -1,3 +1,7 @@
+import re
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 
 
@@ -8,6 +12,9 @@ class User(models.Model):
     created_at = models.DateTimeField(db_column='createdAt')
     # инкремент отзывает все выданные JWT (смена пароля/роли, удаление)
     token_version = models.IntegerField(default=0, db_column='tokenVersion')
+    # оператор платформы (GET /portfolio по всем отелям); ставится только
+    # командой set_operator, не через API
+    is_operator = models.BooleanField(default=False, db_column='isOperator')
 
     class Meta:
         db_table = 'User'
@@ -53,6 +60,8 @@ class Room(models.Model):
     active = models.BooleanField(default=True)
     notes = models.TextField(null=True, blank=True)
     created_at = models.DateTimeField(db_column='createdAt')
+    # оптимистическая блокировка: растёт на каждой правке, клиент шлёт её в If-Match
+    version = models.IntegerField(default=1)
 
     class Meta:
         db_table = 'Room'
@@ -73,10 +82,18 @@ class Stay(models.Model):
     deposit_expected = models.DecimalField(max_digits=20, decimal_places=2, default=0, db_column='depositExpected')
     comment = models.TextField(null=True, blank=True)
     created_at = models.DateTimeField(db_column='createdAt')
-    guest_id = models.CharField(max_length=36, null=True, blank=True, db_column='guestId')
+    guest_id = models.CharField(max_length=36, null=True, blank=True, db_column='guestId', db_index=True)
+    version = models.IntegerField(default=1)
 
     class Meta:
         db_table = 'Stay'
+        indexes = [
+            # будущее «на книгах» (прогноз): только бронирования и проживающие
+            models.Index(
+                fields=['hotel', 'check_out_date'], name='stay_open_checkout',
+                condition=models.Q(status__in=['BOOKED', 'CHECKED_IN']),
+            ),
+        ]
 
 
 class Payment(models.Model):
@@ -84,20 +101,30 @@ class Payment(models.Model):
     hotel = models.ForeignKey(Hotel, on_delete=models.CASCADE, db_column='hotelId')
     stay = models.ForeignKey(Stay, on_delete=models.CASCADE, db_column='stayId')
     paid_at = models.DateTimeField(db_column='paidAt')
+    # дата операции в часовом поясе отеля — для отчётов по дням; заполняется в save()
+    business_date = models.DateField(null=True, blank=True, db_column='businessDate')
     method = models.CharField(max_length=20)
     custom_method_label = models.CharField(max_length=100, null=True, blank=True, db_column='customMethodLabel')
     amount = models.DecimalField(max_digits=20, decimal_places=2)
     comment = models.TextField(null=True, blank=True)
     created_at = models.DateTimeField(db_column='createdAt')
+    version = models.IntegerField(default=1)
 
     class Meta:
         db_table = 'Payment'
+        indexes = [models.Index(fields=['hotel', 'business_date'], name='payment_hotel_bdate')]
+
+    def save(self, *args, **kwargs):
+        set_business_date(self, 'paid_at', kwargs)
+        super().save(*args, **kwargs)
 
 
 class Expense(models.Model):
     id = models.CharField(max_length=36, primary_key=True)
     hotel = models.ForeignKey(Hotel, on_delete=models.CASCADE, db_column='hotelId')
     spent_at = models.DateTimeField(db_column='spentAt')
+    # местная дата операции, как у Payment
+    business_date = models.DateField(null=True, blank=True, db_column='businessDate')
     category = models.CharField(max_length=20)
     method = models.CharField(max_length=20)
     custom_method_label = models.CharField(max_length=100, null=True, blank=True, db_column='customMethodLabel')
@@ -105,9 +132,15 @@ class Expense(models.Model):
     comment = models.TextField(null=True, blank=True)
     created_at = models.DateTimeField(db_column='createdAt')
     created_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, db_column='createdBy', related_name='expenses')
+    version = models.IntegerField(default=1)
 
     class Meta:
         db_table = 'Expense'
+        indexes = [models.Index(fields=['hotel', 'business_date'], name='expense_hotel_bdate')]
+
+    def save(self, *args, **kwargs):
+        set_business_date(self, 'spent_at', kwargs)
+        super().save(*args, **kwargs)
 
 
 class MonthClosing(models.Model):
@@ -137,42 +170,103 @@ class Transfer(models.Model):
     id = models.CharField(max_length=36, primary_key=True)
     hotel = models.ForeignKey(Hotel, on_delete=models.CASCADE, db_column='hotelId')
     transferred_at = models.DateTimeField(db_column='transferredAt')
+    # местная дата операции, как у Payment
+    business_date = models.DateField(null=True, blank=True, db_column='businessDate')
     from_method = models.CharField(max_length=100, db_column='fromMethod')
     to_method = models.CharField(max_length=100, db_column='toMethod')
     amount = models.DecimalField(max_digits=20, decimal_places=2)
     comment = models.TextField(null=True, blank=True)
     created_at = models.DateTimeField(db_column='createdAt')
+    version = models.IntegerField(default=1)
 
     class Meta:
         db_table = 'Transfer'
+        indexes = [models.Index(fields=['hotel', 'business_date'], name='transfer_hotel_bdate')]
+
+    def save(self, *args, **kwargs):
+        set_business_date(self, 'transferred_at', kwargs)
+        super().save(*args, **kwargs)
 
 
 class Withdrawal(models.Model):
     id = models.CharField(max_length=36, primary_key=True)
     hotel = models.ForeignKey(Hotel, on_delete=models.CASCADE, db_column='hotelId')
     withdrawn_at = models.DateTimeField(db_column='withdrawnAt')
+    # местная дата операции, как у Payment
+    business_date = models.DateField(null=True, blank=True, db_column='businessDate')
     method = models.CharField(max_length=100)
     amount = models.DecimalField(max_digits=20, decimal_places=2)
     comment = models.TextField(null=True, blank=True)
     created_at = models.DateTimeField(db_column='createdAt')
     created_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, db_column='createdById', related_name='withdrawals')
+    version = models.IntegerField(default=1)
 
     class Meta:
         db_table = 'Withdrawal'
+        indexes = [models.Index(fields=['hotel', 'business_date'], name='withdrawal_hotel_bdate')]
+
+    def save(self, *args, **kwargs):
+        set_business_date(self, 'withdrawn_at', kwargs)
+        super().save(*args, **kwargs)
 
 
 class Guest(models.Model):
     """Клиентская база отеля."""
     id = models.CharField(max_length=36, primary_key=True)
-    hotel_id = models.CharField(max_length=36)
+    hotel_id = models.CharField(max_length=36, db_index=True)
     name = models.CharField(max_length=255)
     phone = models.CharField(max_length=50, blank=True, default='')
+    # только цифры телефона — для поиска по caller ID; заполняется в save()
+    phone_digits = models.CharField(max_length=50, blank=True, default='')
     notes = models.TextField(blank=True, default='')
     created_at = models.DateTimeField(auto_now_add=True)
+    version = models.IntegerField(default=1)
 
     class Meta:
         db_table = 'api_guest'
         ordering = ['name']
+        indexes = [
+            GinIndex(fields=['name'], name='api_guest_name_trgm', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['phone_digits'], name='api_guest_phone_trgm', opclasses=['gin_trgm_ops']),
+        ]
+        constraints = [
+            # один телефон — один гость в отеле; гости без телефона не ограничены
+            models.UniqueConstraint(
+                fields=['hotel_id', 'phone_digits'], condition=~models.Q(phone_digits=''),
+                name='api_guest_hotel_phone_uniq',
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.phone_digits = normalize_phone(self.phone)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'phone' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'phone_digits'}
+        super().save(*args, **kwargs)
+
+
+def hotel_zone(hotel_id):
+    """Часовой пояс отеля (UTC, если не задан или неизвестен)."""
+    from .cache import hotel_info  # cache импортирует модели
+    name = (hotel_info(hotel_id) or {}).get('timezone') or 'UTC'
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo('UTC')
+
+
+def set_business_date(obj, source, kwargs):
+    """business_date = местная дата поля source; при save(update_fields=...) — вместе с ним."""
+    moment = getattr(obj, source)
+    obj.business_date = moment.astimezone(hotel_zone(obj.hotel_id)).date() if moment else None
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and source in update_fields:
+        kwargs['update_fields'] = {*update_fields, 'business_date'}
+
+
+def normalize_phone(phone):
+    """'+998 (90) 123-45-67' → '998901234567'."""
+    return re.sub(r'\D', '', phone or '')
 
 
 class HotelSettings(models.Model):
@@ -182,3 +276,72 @@ class HotelSettings(models.Model):
 
     class Meta:
         db_table = 'api_hotel_settings'
+
+
+class ChangeEvent(models.Model):
+    """
+    Лента изменений отеля для GET /events. seq — сквозная ревизия в порядке
+    коммитов: выдаётся после COMMIT (events.sequence), до того NULL.
+    """
+    id = models.BigAutoField(primary_key=True)
+    hotel_id = models.CharField(max_length=36)
+    entity = models.CharField(max_length=30)
+    object_id = models.CharField(max_length=36, blank=True, default='')
+    op = models.CharField(max_length=10)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    seq = models.BigIntegerField(null=True, db_index=True)
+
+    class Meta:
+        db_table = 'api_change_event'
+        indexes = [
+            models.Index(fields=['hotel_id', 'seq'], name='api_change_event_feed'),
+            models.Index(fields=['hotel_id'], condition=models.Q(seq__isnull=True), name='api_change_event_unsequenced'),
+        ]
+
+
+class RoomNight(models.Model):
+    """
+    Проданная ночь номера: заезд CHECKED_IN/CHECKED_OUT раскладывается по
+    ночам (ночь d — с d на d+1) с равной долей его стоимости. Пересобирается
+    при каждой записи заезда (reports.sync_room_nights).
+    """
+    id = models.BigAutoField(primary_key=True)
+    hotel_id = models.CharField(max_length=36)
+    room_id = models.CharField(max_length=36)
+    stay = models.ForeignKey(Stay, on_delete=models.CASCADE, related_name='+')
+    night = models.DateField()
+    revenue = models.DecimalField(max_digits=20, decimal_places=2)
+
+    class Meta:
+        db_table = 'api_room_night'
+        indexes = [
+            models.Index(fields=['hotel_id', 'night'], name='api_room_night_hotel'),
+            models.Index(fields=['room_id', 'night'], name='api_room_night_room'),
+        ]
+        constraints = [models.UniqueConstraint(fields=['stay', 'night'], name='api_room_night_uniq')]
+
+
+class PaceSnapshot(models.Model):
+    """
+    «На книгах» будущей ночи target по состоянию на местную дату as_of:
+    занятые номера и ожидаемая выручка (reports.FORECAST_SQL). Пишется раз в
+    сутки командой snapshot_pace — по строке на отель × ночь горизонта.
+    """
+    id = models.BigAutoField(primary_key=True)
+    hotel_id = models.CharField(max_length=36)
+    as_of = models.DateField()
+    target = models.DateField()
+    room_nights = models.IntegerField()
+    revenue = models.DecimalField(max_digits=20, decimal_places=2)
+
+    class Meta:
+        db_table = 'api_pace_snapshot'
+        constraints = [
+            models.UniqueConstraint(fields=['hotel_id', 'target', 'as_of'], name='api_pace_snapshot_uniq'),
+        ]
+
+
+# модель → поле момента операции, от которого считается business_date
+BUSINESS_DATE_SOURCES = {
+    Payment: 'paid_at', Expense: 'spent_at', Transfer: 'transferred_at', Withdrawal: 'withdrawn_at',
+}
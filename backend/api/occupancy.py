@@ -0,0 +1,244 @@
+"""
+Занятость номеров в памяти процесса: по каждому номеру отеля —
+отсортированные по заезду интервалы блокирующих заездов (BOOKED,
+CHECKED_IN). Пересечение с [check_in, check_out) ищется bisect'ом:
+O(log n) плюс число найденных интервалов.
+
+Свежесть — поколение namespace 'occupancy' в api/cache.py, которое
+поднимает каждая запись заезда (signals.py) и импорт. Пока поколение то же,
+чтение не ходит в Postgres (только точечный SELECT к SQLite кэша). Сменилось —
+индекс догоняет базу по ленте изменений (api/events.py), перечитывая
+затронутые заезды по id, как снимок api/analytics.py; 'bulk' по заездам или
+индекс, не сверявшийся дольше срока хранения ленты, — полная перезагрузка.
+
+Внутри транзакции (проверка пересечений при записи) общий индекс не
+меняется: события после его ревизии и ещё без номера — и свои
+незакоммиченные, и чужие, закоммиченные после снятия блокировки номера, —
+перечитываются поверх индекса только для этого вопроса. Так проверка под FOR UPDATE номера видит
+то же, что видел бы запрос к Stay, а откат не оставляет следов в памяти.
+Индекса ещё нет — вопрос уходит в Postgres обычным запросом.
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+
+from . import cache, events
+from .models import ChangeEvent, Stay
+
+NAMESPACE = 'occupancy'
+MAX_HOTELS = 32
+BLOCKING = ('CHECKED_IN', 'BOOKED')
+
+LOAD_SQL = """
+    SELECT id, "roomId", "checkInDate", "checkOutDate"
+    FROM "Stay" WHERE "hotelId" = %s AND status IN ('CHECKED_IN', 'BOOKED')
+"""
+# и неблокирующие: заезд, отменённый после загрузки, из индекса надо убрать
+REREAD_SQL = """
+    SELECT id, "roomId", "checkInDate", "checkOutDate", status IN ('CHECKED_IN', 'BOOKED')
+    FROM "Stay" WHERE "hotelId" = %s AND id = ANY(%s)
+"""
+
+_lock = threading.Lock()
+_indexes = OrderedDict()   # hotel_id → _Index
+
+
+class _Room:
+    """Интервалы одного номера по возрастанию заезда; top[i] — max(ends[:i + 1])."""
+    __slots__ = ('starts', 'ends', 'ids', 'top')
+
+    def __init__(self):
+        self.starts, self.ends, self.ids, self.top = [], [], [], []
+
+    def add(self, stay_id, start, end):
+        i = bisect_left(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.ids.insert(i, stay_id)
+        self._retop(i)
+
+    def remove(self, stay_id, start):
+        i = bisect_left(self.starts, start)
+        while self.ids[i] != stay_id:
+            i += 1
+        del self.starts[i], self.ends[i], self.ids[i]
+        self._retop(i)
+
+    def _retop(self, i):
+        del self.top[i:]
+        top = self.top[-1] if self.top else None
+        for end in self.ends[i:]:
+            top = end if top is None or end > top else top
+            self.top.append(top)
+
+    def overlapping(self, start, end):
+        """id интервалов, пересекающих [start, end)."""
+        out = []
+        # начавшиеся до end; идём назад, пока хоть один из оставшихся тянется за start
+        i = bisect_left(self.starts, end) - 1
+        while i >= 0 and self.top[i] > start:
+            if self.ends[i] > start:
+                out.append(self.ids[i])
+            i -= 1
+        return out
+
+
+class _Index:
+    def __init__(self, hotel_id):
+        self.hotel_id = hotel_id
+        self.lock = threading.Lock()
+        self.revision = None   # последнее применённое событие ленты
+        self.gen = None        # поколение кэша, при котором индекс сверен
+        self.checked = 0.0
+        self.rooms = {}        # room_id → _Room
+        self.stays = {}        # stay_id → (room_id, start, end)
+
+    def _put(self, stay_id, room_id, start, end):
+        self._drop(stay_id)
+        self.rooms.setdefault(room_id, _Room()).add(stay_id, start, end)
+        self.stays[stay_id] = (room_id, start, end)
+
+    def _drop(self, stay_id):
+        old = self.stays.pop(stay_id, None)
+        if old:
+            self.rooms[old[0]].remove(stay_id, old[1])
+
+    def load(self):
+        checked = time.monotonic()
+        self.rooms, self.stays = {}, {}
+        with transaction.atomic():
+            with connection.cursor() as cur:
+                cur.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+            # seq выдаётся в порядке коммитов (events.sequence)
+            self.revision = ChangeEvent.objects.filter(hotel_id=self.hotel_id, seq__isnull=False) \
+                .order_by('-seq').values_list('seq', flat=True).first() or 0
+            with connection.cursor() as cur:
+                cur.execute(LOAD_SQL, [self.hotel_id])
+                rows = sorted(cur.fetchall(), key=lambda row: row[2])
+        # по возрастанию заезда — вставки в конец списков
+        for stay_id, room_id, start, end in rows:
+            self._put(stay_id, room_id, start, end)
+        self.checked = checked
+
+    def refresh(self):
+        """Догнать базу, если поколение сменилось (вне транзакции)."""
+        gens = cache.generations(self.hotel_id, NAMESPACE, NAMESPACE)
+        gen = None if gens is None else gens.get(NAMESPACE, 0)
+        horizon = settings.EVENTS_RETENTION_DAYS * 86400 - 3600
+        if self.revision is None or time.monotonic() - self.checked > horizon:
+            self.load()
+        elif gen is None or gen != self.gen:
+            checked = time.monotonic()
+            events.sequence(self.hotel_id)
+            changes, bulk = self._events()
+            if bulk:
+                self.load()
+            else:
+                if changes:
+                    for stay_id, row in self._reread({object_id for _, object_id in changes}).items():
+                        self._drop(stay_id)
+                        if row:
+                            self._put(stay_id, *row)
+                    self.revision = changes[-1][0]
+                self.checked = checked
+        # поколение взято до чтения: правка во время сверки его сменит
+        self.gen = gen
+
+    def _events(self, pending=False):
+        """
+        ([(seq, stay_id)], bulk) — события по заездам после ревизии индекса;
+        pending — и ещё без номера (свои незакоммиченные, чужие до sequence).
+        """
+        after = Q(seq__gt=self.revision)
+        if pending:
+            after |= Q(seq__isnull=True)
+        rows = list(
+            ChangeEvent.objects.filter(after, hotel_id=self.hotel_id, entity='stays')
+            .order_by('seq').values_list('seq', 'object_id', 'op')
+        )
+        return [(seq, object_id) for seq, object_id, _ in rows], any(op == 'bulk' for _, _, op in rows)
+
+    def _reread(self, ids):
+        """{stay_id: (room_id, start, end) или None — удалён или не блокирует}."""
+        out = dict.fromkeys(ids)
+        with connection.cursor() as cur:
+            cur.execute(REREAD_SQL, [self.hotel_id, list(ids)])
+            for stay_id, room_id, start, end, blocking in cur.fetchall():
+                out[stay_id] = (room_id, start, end) if blocking else None
+        return out
+
+    def busy(self, room_ids, start, end, exclude_id=None, overlay=None):
+        overlay = overlay or {}
+        busy = set()
+        for room_id in room_ids:
+            room = self.rooms.get(room_id)
+            if room is None:
+                continue
+            for stay_id in room.overlapping(start, end):
+                if stay_id != exclude_id and stay_id not in overlay:
+                    busy.add(room_id)
+                    break
+        for stay_id, row in overlay.items():
+            if row and stay_id != exclude_id and row[0] in room_ids and row[1] < end and row[2] > start:
+                busy.add(row[0])
+        return busy
+
+
+def _index(hotel_id):
+    with _lock:
+        index = _indexes.get(hotel_id)
+        if index is None:
+            index = _indexes[hotel_id] = _Index(hotel_id)
+        _indexes.move_to_end(hotel_id)
+        while len(_indexes) > MAX_HOTELS:
+            _indexes.popitem(last=False)
+    return index
+
+
+def _busy_in_db(hotel_id, room_ids, start, end, exclude_id):
+    qs = Stay.objects.filter(
+        hotel_id=hotel_id, room_id__in=room_ids, status__in=BLOCKING,
+        check_in_date__lt=end, check_out_date__gt=start,
+    )
+    if exclude_id:
+        qs = qs.exclude(id=exclude_id)
+    return set(qs.values_list('room_id', flat=True).distinct())
+
+
+def busy_rooms(hotel_id, room_ids, start, end, exclude_id=None):
+    """Номера из room_ids, занятые блокирующим заездом в [start, end)."""
+    room_ids = set(room_ids)
+    index = _index(hotel_id)
+    if not connection.in_atomic_block:
+        with index.lock:
+            index.refresh()
+            return index.busy(room_ids, start, end, exclude_id)
+
+    with index.lock:
+        revision = index.revision
+    if revision is None:
+        return _busy_in_db(hotel_id, room_ids, start, end, exclude_id)
+    # поверх индекса — всё, что случилось после его ревизии, включая своё
+    # незакоммиченное; общий индекс при этом не трогаем
+    view = _Index(hotel_id)
+    view.revision = revision
+    changes, bulk = view._events(pending=True)
+    if bulk:
+        return _busy_in_db(hotel_id, room_ids, start, end, exclude_id)
+    overlay = view._reread({object_id for _, object_id in changes}) if changes else {}
+    with index.lock:
+        # индекс мог уйти вперёд — лишнее в overlay всё равно перечитано свежее
+        return index.busy(room_ids, start, end, exclude_id, overlay)
+
+
+def evict(hotel_id=None):
+    with _lock:
+        if hotel_id is None:
+            _indexes.clear()
+        else:
+            _indexes.pop(hotel_id, None)
@@ -1,5 +1,7 @@
 from rest_framework.permissions import BasePermission
 
+from .models import User
+
 
 class IsAuthenticatedCustom(BasePermission):
     def has_permission(self, request, view):
@@ -9,3 +11,10 @@ class IsAuthenticatedCustom(BasePermission):
 class IsAdmin(BasePermission):
     def has_permission(self, request, view):
         return bool(request.user and getattr(request.user, 'is_admin', False))
+
+
+class IsOperator(BasePermission):
+    """Оператор платформы (User.is_operator) — видит все отели развёртывания."""
+    def has_permission(self, request, view):
+        user_id = getattr(request.user, 'id', None)
+        return bool(user_id) and User.objects.filter(id=user_id, is_operator=True).exists()
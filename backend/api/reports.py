@@ -0,0 +1,916 @@
+"""
+Отчёт за период (TotalsSnapshot) с кэшем и схлопыванием одинаковых расчётов.
+
+Результат лежит в кэше (api/cache.py, namespace 'reports') под ключом
+(отель, from, to) вместе с ревизией данных периода — поколениями
+namespace'ов 'report:YYYY-MM' его месяцев. Запись или удаление платежа,
+расхода, снятия или заезда поднимает поколение своих месяцев (signals.py):
+отчёты за периоды с этим месяцем перестают совпадать по ревизии, остальные
+остаются в кэше. Номера меняют доступные ночи любого периода — их правка
+сбрасывает namespace 'reports' целиком.
+
+Платежи, расходы и снятия относятся к дню по business_date — местной дате
+операции (models.set_business_date); смена часового пояса отеля её
+пересчитывает (rebuild_business_dates).
+
+Одинаковые запросы, пришедшие одновременно, считаются один раз: внутри
+процесса остальные потоки ждут первого, между воркерами — advisory lock
+Postgres на ключ, и дождавшийся берёт готовое из кэша.
+
+stale=True (stale-while-revalidate): если ревизия сменилась, но прошлый
+результат за тот же период есть — он отдаётся сразу, а пересчёт идёт в
+фоновом потоке.
+"""
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from django.db import connection, connections
+
+from . import analytics, cache, events
+from .models import (
+    BUSINESS_DATE_SOURCES, PaceSnapshot, Payment, Expense, Room, RoomNight, Transfer, Withdrawal, hotel_zone,
+)
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = 'reports'
+REVISION_PREFIX = 'report:'
+REPORT_TTL = 24 * 3600
+# ждём чужой расчёт не дольше — дальше считаем сами
+FLIGHT_TIMEOUT = 120
+# pg_advisory_lock(класс, hashtext(ключ)); класс 1 — лента событий (events.py)
+REPORT_LOCK_CLASS = 2
+
+_flights_lock = threading.Lock()
+_flights = {}   # (отель, период) → _Flight
+
+
+def compute_totals(hotel_id_val, from_date, to_date):
+    """Compute TotalsSnapshot for a date range."""
+    payments = Payment.objects.filter(
+        hotel_id=hotel_id_val,
+        business_date__gte=from_date,
+        business_date__lte=to_date,
+    )
+    expenses = Expense.objects.filter(
+        hotel_id=hotel_id_val,
+        business_date__gte=from_date,
+        business_date__lte=to_date,
+    )
+
+    revenue_by_method = {}
+    for p in payments:
+        key = p.custom_method_label if p.method == 'OTHER' and p.custom_method_label else p.method
+        revenue_by_method[key] = revenue_by_method.get(key, 0) + float(p.amount)
+
+    expenses_by_category = {}
+    for e in expenses:
+        expenses_by_category[e.category] = expenses_by_category.get(e.category, 0) + float(e.amount)
+
+    # Occupancy
+    rooms = Room.objects.filter(hotel_id=hotel_id_val, active=True)
+    days = (to_date - from_date).days + 1
+    available_nights = rooms.count() * days
+
+    sold_nights = RoomNight.objects.filter(
+        hotel_id=hotel_id_val, night__gte=from_date, night__lte=to_date,
+    ).count()
+
+    withdrawals = Withdrawal.objects.filter(
+        hotel_id=hotel_id_val,
+        business_date__gte=from_date,
+        business_date__lte=to_date,
+    )
+    withdrawals_by_method = {}
+    for w in withdrawals:
+        withdrawals_by_method[w.method] = withdrawals_by_method.get(w.method, 0) + float(w.amount)
+
+    return totals_snapshot(revenue_by_method, expenses_by_category, withdrawals_by_method, sold_nights, available_nights)
+
+
+def totals_snapshot(revenue_by_method, expenses_by_category, withdrawals_by_method, sold_nights, available_nights):
+    """TotalsSnapshot из сумм по способам и категориям и числа ночей."""
+    total_revenue = sum(revenue_by_method.values())
+    profit = total_revenue - sum(expenses_by_category.values())
+    total_withdrawals = sum(withdrawals_by_method.values())
+    occupancy_rate = (sold_nights / available_nights * 100) if available_nights > 0 else 0
+    adr = (total_revenue / sold_nights) if sold_nights > 0 else 0
+    revpar = (total_revenue / available_nights) if available_nights > 0 else 0
+    return {
+        'revenue_by_method': revenue_by_method,
+        'expenses_by_category': expenses_by_category,
+        'profit': profit,
+        'withdrawals_by_method': withdrawals_by_method,
+        'total_withdrawals': total_withdrawals,
+        'occupancy_rate': occupancy_rate,
+        'adr': adr,
+        'revpar': revpar,
+        'sold_nights': sold_nights,
+        'available_nights': available_nights,
+        'total_room_revenue': total_revenue,
+    }
+
+
+# ─── ревизии ──────────────────────────────────────────────────────────────────
+
+def month_key(value):
+    """'YYYY-MM' даты (business_date) или момента — по UTC, как ::date у дат заезда."""
+    if hasattr(value, 'tzinfo') and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return f'{value.year:04d}-{value.month:02d}'
+
+
+def months_between(start, end):
+    """Месяцы от start до end включительно."""
+    first, last = month_key(start), month_key(end)
+    year, month = int(first[:4]), int(first[5:])
+    out = []
+    while f'{year:04d}-{month:02d}' <= last:
+        out.append(f'{year:04d}-{month:02d}')
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return out
+
+
+def invalidate_months(hotel_id, months):
+    for month in sorted(months):
+        cache.invalidate_on_commit(hotel_id, REVISION_PREFIX + month)
+
+
+def revision(hotel_id, from_date, to_date):
+    """Ревизия данных периода (None — кэш недоступен)."""
+    gens = cache.generations(hotel_id, REVISION_PREFIX + month_key(from_date), REVISION_PREFIX + month_key(to_date))
+    return None if gens is None else tuple(sorted(gens.items()))
+
+
+def rebuild_business_dates(hotel_id):
+    """Сменился часовой пояс отеля — business_date всех его операций заново."""
+    tz = hotel_zone(hotel_id).key
+    entities = {Payment: 'payments', Expense: 'expenses', Transfer: 'transfers', Withdrawal: 'withdrawals'}
+    changed = []
+    with connection.cursor() as cur:
+        for model, source in BUSINESS_DATE_SOURCES.items():
+            column = model._meta.get_field(source).column
+            cur.execute(
+                f'UPDATE "{model._meta.db_table}" SET "businessDate" = ("{column}" AT TIME ZONE %s)::date '
+                f'WHERE "hotelId" = %s AND "businessDate" IS DISTINCT FROM ("{column}" AT TIME ZONE %s)::date',
+                [tz, hotel_id, tz],
+            )
+            if cur.rowcount:
+                changed.append(entities[model])
+    if changed:
+        cache.invalidate_on_commit(hotel_id, NAMESPACE)
+        events.record_bulk(hotel_id, changed)
+    return changed
+
+
+# ─── проданные ночи ───────────────────────────────────────────────────────────
+
+# поля заезда, от которых зависят его ночи
+NIGHT_FIELDS = {
+    'room', 'room_id', 'check_in_date', 'check_out_date', 'status',
+    'price_per_night', 'weekly_discount_amount', 'manual_adjustment_amount',
+}
+
+# стоимость заезда (как getStayTotal на фронте) поровну на ночи, остаток
+# округления — последней ночи, чтобы сумма по ночам сходилась до копейки
+ROOM_NIGHTS_SQL = """
+    INSERT INTO api_room_night (hotel_id, room_id, stay_id, night, revenue)
+    SELECT s."hotelId", s."roomId", s.id, d.night::date,
+           CASE WHEN d.i = t.nights THEN t.total - t.share * (t.nights - 1) ELSE t.share END
+    FROM "Stay" s
+    CROSS JOIN LATERAL (
+        SELECT c.nights, c.total, round(c.total / NULLIF(c.nights, 0), 2) AS share
+        FROM (SELECT s."checkOutDate"::date - s."checkInDate"::date AS nights,
+                     (s."checkOutDate"::date - s."checkInDate"::date) * s."pricePerNight"
+                     - s."weeklyDiscountAmount" + s."manualAdjustmentAmount" AS total) c
+    ) t
+    CROSS JOIN LATERAL generate_series(
+        s."checkInDate"::date::timestamp, s."checkOutDate"::date::timestamp - interval '1 day', interval '1 day'
+    ) WITH ORDINALITY AS d (night, i)
+    WHERE s.id = ANY(%s) AND s.status IN ('CHECKED_IN', 'CHECKED_OUT')
+"""
+
+
+def sync_room_nights(stay_ids):
+    """Пересобрать ночи заездов (удалённые/отменённые остаются без ночей)."""
+    stay_ids = list(stay_ids)
+    if not stay_ids:
+        return
+    with connection.cursor() as cur:
+        cur.execute('DELETE FROM api_room_night WHERE stay_id = ANY(%s)', [stay_ids])
+        cur.execute(ROOM_NIGHTS_SQL, [stay_ids])
+
+
+# ─── single-flight ────────────────────────────────────────────────────────────
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.ok = False
+
+
+def _single_flight(key, compute):
+    """Один compute() на key в процессе; остальные вызовы получают его результат."""
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+    if not leader:
+        if flight.done.wait(FLIGHT_TIMEOUT) and flight.ok:
+            return flight.value
+        return compute()
+    try:
+        flight.value = compute()
+        flight.ok = True
+        return flight.value
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+
+
+@contextmanager
+def _advisory_lock(key):
+    with connection.cursor() as cur:
+        cur.execute('SELECT pg_advisory_lock(%s, hashtext(%s))', [REPORT_LOCK_CLASS, key])
+        try:
+            yield
+        finally:
+            cur.execute('SELECT pg_advisory_unlock(%s, hashtext(%s))', [REPORT_LOCK_CLASS, key])
+
+
+# ─── кэш отчётов ──────────────────────────────────────────────────────────────
+
+def _compute(hotel_id, key, first, last, compute, ttl=REPORT_TTL):
+    """Расчёт под межпроцессной блокировкой: кто дождался — берёт готовое из кэша."""
+    with _advisory_lock(f'{hotel_id}:{key}'):
+        # ревизия — до чтения данных: правка во время расчёта её поднимет,
+        # и результат, посчитанный по смеси старого и нового, не совпадёт
+        rev = revision(hotel_id, first, last)
+        entry, token = cache.lookup(hotel_id, NAMESPACE, key)
+        if entry is not cache.MISSING and entry[0] == rev:
+            return entry[1]
+        result = compute()
+        if rev is not None:
+            cache.store(hotel_id, NAMESPACE, key, (rev, result), token, ttl=ttl)
+        return result
+
+
+def _refresh(hotel_id, key, first, last, compute, ttl):
+    try:
+        _single_flight((hotel_id, key), lambda: _compute(hotel_id, key, first, last, compute, ttl))
+    except Exception:
+        logger.exception('report refresh failed for %s', hotel_id)
+    finally:
+        connection.close()
+
+
+def cached_report(hotel_id, key, first, last, compute, stale=False, ttl=REPORT_TTL):
+    """
+    (результат compute(), источник) для отчёта по данным с first по last:
+    'hit' — из кэша по текущей ревизии, 'miss' — посчитано (или дождались
+    чужого расчёта), 'stale' — прошлый результат, свежий считается в фоне.
+    """
+    entry, _ = cache.lookup(hotel_id, NAMESPACE, key)
+    if entry is not cache.MISSING:
+        if entry[0] == revision(hotel_id, first, last):
+            return entry[1], 'hit'
+        if stale:
+            with _flights_lock:
+                running = (hotel_id, key) in _flights
+            if not running:
+                threading.Thread(
+                    target=_refresh, args=(hotel_id, key, first, last, compute, ttl),
+                    name='report-refresh', daemon=True,
+                ).start()
+            return entry[1], 'stale'
+    result = _single_flight((hotel_id, key), lambda: _compute(hotel_id, key, first, last, compute, ttl))
+    return result, 'miss'
+
+
+def _period(from_date, to_date):
+    return f'{from_date:%Y-%m-%d}:{to_date:%Y-%m-%d}'
+
+
+def totals(hotel_id, from_date, to_date):
+    """compute_totals — через движок в памяти, если он включён."""
+    if analytics.available():
+        return analytics.totals(hotel_id, from_date, to_date)
+    return compute_totals(hotel_id, from_date, to_date)
+
+
+def report_totals(hotel_id, from_date, to_date, stale=False):
+    """TotalsSnapshot за период через кэш: (totals, источник)."""
+    return cached_report(
+        hotel_id, _period(from_date, to_date), from_date, to_date,
+        lambda: totals(hotel_id, from_date, to_date), stale=stale,
+    )
+
+
+# ─── куб ──────────────────────────────────────────────────────────────────────
+
+CUBE_DIMS = ['room_type', 'floor', 'room', 'weekday', 'method']
+COMPARE_MODES = ['prev_period']
+
+# факты обоих периодов одним проходом: платежи (выручка), проданные ночи
+# (api_room_night) и доступные ночи (активные номера × дни) — правила те же,
+# что в compute_totals; room — номер комнаты (загрузка по номерам)
+CUBE_SQL = """
+    WITH periods (period, start_d, end_d) AS (
+        SELECT * FROM (VALUES ('cur', %(start)s::date, %(end)s::date),
+                              ('prev', %(prev_start)s::date, %(prev_end)s::date)) v
+        WHERE v.column2 IS NOT NULL
+    ), facts AS (
+        SELECT pr.period, r."roomType" AS room_type, r.floor, r.number AS room,
+               EXTRACT(ISODOW FROM p."businessDate")::int AS weekday,
+               CASE WHEN p.method = 'OTHER' AND p."customMethodLabel" <> '' THEN p."customMethodLabel"
+                    ELSE p.method END AS method,
+               p.amount AS revenue, 0 AS sold, 0 AS available
+        FROM "Payment" p
+        JOIN periods pr ON p."businessDate" BETWEEN pr.start_d AND pr.end_d
+        JOIN "Stay" s ON s.id = p."stayId"
+        JOIN "Room" r ON r.id = s."roomId"
+        WHERE p."hotelId" = %(hotel)s
+      UNION ALL
+        SELECT pr.period, r."roomType", r.floor, r.number, EXTRACT(ISODOW FROM n.night)::int, NULL, 0, 1, 0
+        FROM api_room_night n
+        JOIN periods pr ON n.night BETWEEN pr.start_d AND pr.end_d
+        JOIN "Room" r ON r.id = n.room_id
+        WHERE n.hotel_id = %(hotel)s
+      UNION ALL
+        SELECT pr.period, r."roomType", r.floor, r.number, EXTRACT(ISODOW FROM d.day)::int, NULL, 0, 0, 1
+        FROM "Room" r
+        CROSS JOIN periods pr
+        CROSS JOIN LATERAL generate_series(pr.start_d::timestamp, pr.end_d::timestamp, interval '1 day') AS d (day)
+        WHERE r."hotelId" = %(hotel)s AND r.active
+    )
+    SELECT period, {columns}, {grouped} AS grouped,
+           SUM(revenue) AS revenue, SUM(sold) AS sold, SUM(available) AS available
+    FROM facts
+    GROUP BY GROUPING SETS ({sets})
+"""
+
+
+def parse_cube_dims(value):
+    """
+    'room_type,floor+weekday' → [('room_type',), ('floor', 'weekday')]:
+    через запятую — отдельные разрезы, через + — совместный. ValueError — неизвестное.
+    """
+    out = []
+    for item in (value or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        dims = tuple(d.strip() for d in item.split('+'))
+        unknown = [d for d in dims if d not in CUBE_DIMS]
+        if unknown:
+            raise ValueError(f'Unknown dimension: {unknown[0]}')
+        dims = tuple(sorted(set(dims), key=CUBE_DIMS.index))
+        if dims not in out:
+            out.append(dims)
+    return out
+
+
+def _metrics(revenue, sold, available, nights=True):
+    revenue = float(revenue or 0)
+    if not nights:
+        return {'revenue': revenue}
+    return {
+        'revenue': revenue,
+        'sold_nights': sold,
+        'available_nights': available,
+        'occupancy_rate': (sold / available * 100) if available > 0 else 0,
+        'adr': (revenue / sold) if sold > 0 else 0,
+        'revpar': (revenue / available) if available > 0 else 0,
+    }
+
+
+def compute_cube(hotel_id, from_date, to_date, groupings, prev=None):
+    """
+    Итог и разрезы по groupings (см. parse_cube_dims) за период и, если
+    prev=(from, to), за период сравнения — одним запросом с GROUPING SETS.
+    В разрезах по способу оплаты только выручка: ночи к платежу не привязаны.
+    """
+    # GROUPING() принимает только измерения из наборов — остальные просто NULL
+    used = [d for d in CUBE_DIMS if any(d in dims for dims in groupings)]
+    columns = ', '.join(d if d in used else f'NULL AS {d}' for d in CUBE_DIMS)
+    grouped = f'GROUPING({", ".join(used)})' if used else '0'
+    sets = ['(period)'] + [f'(period, {", ".join(dims)})' for dims in groupings]
+    rows = _fetch(CUBE_SQL.format(columns=columns, grouped=grouped, sets=', '.join(sets)), {
+        'hotel': hotel_id, 'start': from_date, 'end': to_date,
+        'prev_start': prev[0] if prev else None, 'prev_end': prev[1] if prev else None,
+    })
+
+    by_set = {(): {}}
+    by_set.update({dims: {} for dims in groupings})
+    for row in rows:
+        # бит GROUPING = 1 — измерение свёрнуто
+        dims = tuple(d for i, d in enumerate(used) if not row['grouped'] & (1 << (len(used) - 1 - i)))
+        if 'method' in dims and row['method'] is None:
+            continue  # ночи без способа оплаты
+        key = tuple(row[d] for d in dims)
+        by_set[dims].setdefault(key, {})[row['period']] = (row['revenue'], row['sold'], row['available'])
+    return cube_result(groupings, by_set, prev)
+
+
+def cube(hotel_id, from_date, to_date, groupings, prev=None):
+    """compute_cube — через движок в памяти, если он включён."""
+    if analytics.available():
+        periods = [('cur', from_date, to_date)] + ([('prev', *prev)] if prev else [])
+        return cube_result(groupings, analytics.cube(hotel_id, periods, groupings), prev)
+    return compute_cube(hotel_id, from_date, to_date, groupings, prev)
+
+
+def cube_result(groupings, by_set, prev):
+    """
+    Ответ куба из {измерения: {ключ: {период: (выручка, продано, доступно)}}}
+    — общий для SQL и движка analytics.
+    """
+    def entry(dims, key, periods):
+        nights = 'method' not in dims
+        out = dict(zip(dims, key))
+        out.update(_metrics(*periods.get('cur', (0, 0, 0)), nights=nights))
+        if prev:
+            out['prev'] = _metrics(*periods.get('prev', (0, 0, 0)), nights=nights)
+        return out
+
+    total = by_set[()].get((), {})
+    result = {'total': entry((), (), total), 'breakdowns': {}}
+    for dims in groupings:
+        keys = sorted(by_set[dims], key=lambda k: [(v is None, v) for v in k])
+        result['breakdowns']['+'.join(dims)] = [entry(dims, k, by_set[dims][k]) for k in keys]
+    return result
+
+
+def _fetch(sql, params):
+    with connection.cursor() as cur:
+        cur.execute(sql, params)
+        cols = [c[0] for c in cur.description]
+        return [dict(zip(cols, row)) for row in cur.fetchall()]
+
+
+def report_cube(hotel_id, from_date, to_date, groupings, compare=None, stale=False):
+    """Куб через кэш отчётов: (результат, источник)."""
+    prev = None
+    if compare == 'prev_period':
+        prev_end = from_date - timedelta(days=1)
+        prev = (prev_end - (to_date - from_date), prev_end)
+    key = 'cube:{}:{}:{}'.format(_period(from_date, to_date), ','.join('+'.join(d) for d in groupings), compare or '')
+    result, source = cached_report(
+        hotel_id, key, prev[0] if prev else from_date, to_date,
+        lambda: cube(hotel_id, from_date, to_date, groupings, prev), stale=stale,
+    )
+    return {
+        'from': f'{from_date:%Y-%m-%d}', 'to': f'{to_date:%Y-%m-%d}',
+        'compare': {'from': f'{prev[0]:%Y-%m-%d}', 'to': f'{prev[1]:%Y-%m-%d}'} if prev else None,
+        **result,
+    }, source
+
+
+# ─── временные ряды ───────────────────────────────────────────────────────────
+
+BUCKETS = ['day', 'week', 'month']
+SERIES_METRICS = ['revenue', 'expenses', 'profit', 'sold_nights', 'occupancy', 'adr', 'revpar']
+DEFAULT_SERIES_METRICS = ['revenue', 'expenses', 'occupancy', 'adr']
+
+# суммы по корзинам местных дат операций — диапазон по индексу (hotel, business_date)
+AMOUNT_SERIES_SQL = """
+    SELECT date_trunc(%(bucket)s, t."businessDate")::date AS bucket, SUM(t.amount) AS value
+    FROM "{table}" t
+    WHERE t."hotelId" = %(hotel)s AND t."businessDate" BETWEEN %(start)s AND %(end)s
+    GROUP BY 1
+"""
+
+NIGHTS_SERIES_SQL = """
+    SELECT date_trunc(%(bucket)s, n.night)::date AS bucket, count(*) AS value
+    FROM api_room_night n
+    WHERE n.hotel_id = %(hotel)s AND n.night BETWEEN %(start)s AND %(end)s
+    GROUP BY 1
+"""
+
+
+def parse_series_metrics(value):
+    """'revenue,adr' → ['revenue', 'adr']; пусто — DEFAULT_SERIES_METRICS. ValueError — неизвестная."""
+    metrics = [m.strip() for m in (value or '').split(',') if m.strip()]
+    for m in metrics:
+        if m not in SERIES_METRICS:
+            raise ValueError(f'Unknown metric: {m}')
+    return list(dict.fromkeys(metrics)) or list(DEFAULT_SERIES_METRICS)
+
+
+def bucket_start(day, bucket):
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def series_buckets(from_date, to_date, bucket):
+    """Начала корзин и число дней периода в каждой (крайние корзины — неполные)."""
+    out = {}
+    day = from_date
+    while day <= to_date:
+        start = bucket_start(day, bucket)
+        out[start] = out.get(start, 0) + 1
+        day += timedelta(days=1)
+    return list(out.items())
+
+
+def compute_series(hotel_id, from_date, to_date, bucket, metrics):
+    """Выровненные ряды метрик: один сгруппированный запрос на семейство (платежи, расходы, ночи)."""
+    need = set(metrics)
+    params = {'hotel': hotel_id, 'start': from_date, 'end': to_date, 'bucket': bucket}
+
+    def sums(sql):
+        return {row['bucket']: row['value'] for row in _fetch(sql, params)}
+
+    revenue = sums(AMOUNT_SERIES_SQL.format(table='Payment')) \
+        if need & {'revenue', 'profit', 'adr', 'revpar'} else {}
+    expenses = sums(AMOUNT_SERIES_SQL.format(table='Expense')) \
+        if need & {'expenses', 'profit'} else {}
+    nights = sums(NIGHTS_SERIES_SQL) if need & {'sold_nights', 'occupancy', 'adr'} else {}
+    rooms = Room.objects.filter(hotel_id=hotel_id, active=True).count() \
+        if need & {'occupancy', 'revpar'} else 0
+
+    buckets = series_buckets(from_date, to_date, bucket)
+    series = {m: [] for m in metrics}
+    for start, days in buckets:
+        rev = float(revenue.get(start) or 0)
+        exp = float(expenses.get(start) or 0)
+        sold = nights.get(start, 0)
+        available = rooms * days
+        values = {
+            'revenue': rev,
+            'expenses': exp,
+            'profit': rev - exp,
+            'sold_nights': sold,
+            'occupancy': (sold / available * 100) if available > 0 else 0,
+            'adr': (rev / sold) if sold > 0 else 0,
+            'revpar': (rev / available) if available > 0 else 0,
+        }
+        for m in metrics:
+            series[m].append(values[m])
+    return {'buckets': [f'{start:%Y-%m-%d}' for start, _ in buckets], 'series': series}
+
+
+def report_series(hotel_id, from_date, to_date, bucket, metrics, stale=False):
+    """Ряды через кэш отчётов: (результат, источник)."""
+    key = f'series:{_period(from_date, to_date)}:{bucket}:{",".join(metrics)}'
+    result, source = cached_report(
+        hotel_id, key, from_date, to_date,
+        lambda: compute_series(hotel_id, from_date, to_date, bucket, metrics), stale=stale,
+    )
+    tz = (cache.hotel_info(hotel_id) or {}).get('timezone') or 'UTC'
+    return {
+        'from': f'{from_date:%Y-%m-%d}', 'to': f'{to_date:%Y-%m-%d}',
+        'bucket': bucket, 'timezone': tz, **result,
+    }, source
+
+
+# ─── прогноз (on the books) ───────────────────────────────────────────────────
+
+DEFAULT_FORECAST_DAYS = 90
+MAX_FORECAST_DAYS = 366
+
+# ночи от сегодня вперёд по бронированиям и проживающим (BLOCKING_STATUSES):
+# занятые номера, ожидаемая выручка (стоимость заезда поровну на ночи, как в
+# ROOM_NIGHTS_SQL), заезды и выезды дня; заезды берутся по частичному индексу
+FORECAST_SQL = """
+    WITH nights AS (
+        SELECT d::date AS night
+        FROM generate_series(%(start)s::timestamp, %(end)s::timestamp, interval '1 day') AS d
+    ), stays AS (
+        SELECT s."roomId" AS room_id, s."checkInDate"::date AS ci, s."checkOutDate"::date AS co,
+               ((s."checkOutDate"::date - s."checkInDate"::date) * s."pricePerNight"
+                - s."weeklyDiscountAmount" + s."manualAdjustmentAmount")
+               / NULLIF(s."checkOutDate"::date - s."checkInDate"::date, 0) AS per_night
+        FROM "Stay" s
+        WHERE s."hotelId" = %(hotel)s AND s.status IN ('BOOKED', 'CHECKED_IN')
+          AND s."checkOutDate" >= %(start)s::date AND s."checkInDate" < %(end)s::date + 1
+    )
+    SELECT n.night,
+           count(DISTINCT st.room_id) FILTER (WHERE st.co > n.night) AS booked,
+           COALESCE(SUM(st.per_night) FILTER (WHERE st.co > n.night), 0) AS revenue,
+           count(st.room_id) FILTER (WHERE st.ci = n.night) AS arrivals,
+           count(st.room_id) FILTER (WHERE st.co = n.night) AS departures,
+           (SELECT count(*) FROM "Room" r WHERE r."hotelId" = %(hotel)s AND r.active) AS rooms
+    FROM nights n
+    LEFT JOIN stays st ON st.ci <= n.night AND st.co >= n.night
+    GROUP BY n.night
+    ORDER BY n.night
+"""
+
+
+def compute_forecast(hotel_id, start, days):
+    rows = _fetch(FORECAST_SQL, {'hotel': hotel_id, 'start': start, 'end': start + timedelta(days=days - 1)})
+    rooms = rows[0]['rooms'] if rows else 0
+    nights = []
+    for row in rows:
+        nights.append({
+            'date': f'{row["night"]:%Y-%m-%d}',
+            'booked_rooms': row['booked'],
+            'occupancy_rate': (row['booked'] / rooms * 100) if rooms > 0 else 0,
+            'expected_revenue': round(float(row['revenue']), 2),
+            'arrivals': row['arrivals'],
+            'departures': row['departures'],
+        })
+    room_nights = sum(n['booked_rooms'] for n in nights)
+    return {
+        'rooms': rooms,
+        'nights': nights,
+        'total': {
+            'room_nights': room_nights,
+            'occupancy_rate': (room_nights / (rooms * days) * 100) if rooms > 0 else 0,
+            'expected_revenue': round(sum(n['expected_revenue'] for n in nights), 2),
+        },
+    }
+
+
+def report_forecast(hotel_id, days=DEFAULT_FORECAST_DAYS, stale=False):
+    """Прогноз на days ночей от сегодняшней местной даты через кэш: (результат, источник)."""
+    start = datetime.now(hotel_zone(hotel_id)).date()
+    end = start + timedelta(days=days - 1)
+    result, source = cached_report(
+        hotel_id, f'forecast:{start:%Y-%m-%d}:{days}', start, end,
+        lambda: compute_forecast(hotel_id, start, days), stale=stale,
+    )
+    return {
+        'from': f'{start:%Y-%m-%d}', 'to': f'{end:%Y-%m-%d}',
+        'timezone': hotel_zone(hotel_id).key, **result,
+    }, source
+
+
+# ─── темп продаж (pace) ───────────────────────────────────────────────────────
+
+PACE_HORIZON_DAYS = 365
+
+# кривые только из снимков: по дате снимка и по числу дней до ночи
+PACE_SQL = """
+    SELECT {key} AS key, SUM(p.room_nights) AS room_nights, SUM(p.revenue) AS revenue, count(*) AS nights
+    FROM api_pace_snapshot p
+    WHERE p.hotel_id = %(hotel)s AND p.target BETWEEN %(start)s AND %(end)s
+    GROUP BY 1
+    ORDER BY 1
+"""
+
+
+def snapshot_pace(hotel_id, days=PACE_HORIZON_DAYS):
+    """Снимок «на книгах» ночей от сегодняшней местной даты; повторный запуск за день перезаписывает."""
+    as_of = datetime.now(hotel_zone(hotel_id)).date()
+    rows = _fetch(FORECAST_SQL, {'hotel': hotel_id, 'start': as_of, 'end': as_of + timedelta(days=days - 1)})
+    PaceSnapshot.objects.bulk_create(
+        [PaceSnapshot(hotel_id=hotel_id, as_of=as_of, target=row['night'],
+                      room_nights=row['booked'], revenue=round(row['revenue'], 2)) for row in rows],
+        update_conflicts=True, unique_fields=['hotel_id', 'target', 'as_of'],
+        update_fields=['room_nights', 'revenue'],
+    )
+    return as_of, len(rows)
+
+
+def pace(hotel_id, target_from, target_to):
+    """Как набирались ночи target_from..target_to: по дате снимка и по дням до ночи."""
+    params = {'hotel': hotel_id, 'start': target_from, 'end': target_to}
+
+    def curve(key, label, fmt):
+        return [{
+            label: fmt(row['key']),
+            'room_nights': row['room_nights'],
+            'revenue': float(row['revenue']),
+            'nights': row['nights'],
+        } for row in _fetch(PACE_SQL.format(key=key), params)]
+
+    return {
+        'target_from': f'{target_from:%Y-%m-%d}', 'target_to': f'{target_to:%Y-%m-%d}',
+        # nights — сколько ночей периода попало в снимок (прошедшие в него уже не входят)
+        'by_as_of': curve('p.as_of', 'as_of', lambda d: f'{d:%Y-%m-%d}'),
+        'by_days_before': curve('p.target - p.as_of', 'days_before', int),
+    }
+
+
+# ─── сегодня (стойка и ежедневный отчёт) ──────────────────────────────────────
+
+# оплаченное по заезду зависит и от платежей прошлых месяцев, их ревизию
+# сегодняшний ключ не видит — поэтому кэш стойки живёт недолго
+DASHBOARD_TTL = 60
+
+# всё о местном «сегодня» отеля одним запросом: деньги дня по business_date,
+# незакрытые заезды вокруг сегодняшней даты (с оплаченным), активные номера
+# занятость считается по этим же заездам в compute_dashboard
+DASHBOARD_SQL = """
+    WITH stays AS (
+        SELECT s.id, s."roomId" AS room_id, s."guestName" AS guest_name, s."guestPhone" AS guest_phone,
+               s.status, s."checkInDate"::date AS ci, s."checkOutDate"::date AS co,
+               (s."checkOutDate"::date - s."checkInDate"::date) * s."pricePerNight"
+               - s."weeklyDiscountAmount" + s."manualAdjustmentAmount" AS total
+        FROM "Stay" s
+        WHERE s."hotelId" = %(hotel)s AND s.status <> 'CANCELLED'
+          AND s."checkOutDate" >= %(today)s::date AND s."checkInDate" < %(today)s::date + 1
+    ), paid AS (
+        SELECT p."stayId" AS stay_id, SUM(p.amount) AS paid
+        FROM "Payment" p JOIN stays st ON st.id = p."stayId"
+        GROUP BY 1
+    ), money AS (
+        SELECT 'income' AS kind, p.method AS key, SUM(p.amount) AS amount
+        FROM "Payment" p WHERE p."hotelId" = %(hotel)s AND p."businessDate" = %(today)s GROUP BY 2
+      UNION ALL
+        SELECT 'expenses', e.category, SUM(e.amount)
+        FROM "Expense" e WHERE e."hotelId" = %(hotel)s AND e."businessDate" = %(today)s GROUP BY 2
+      UNION ALL
+        SELECT 'withdrawals', w.method, SUM(w.amount)
+        FROM "Withdrawal" w WHERE w."hotelId" = %(hotel)s AND w."businessDate" = %(today)s GROUP BY 2
+    )
+    SELECT
+        (SELECT COALESCE(json_agg(json_build_object('kind', kind, 'key', key, 'amount', amount)), '[]')
+         FROM money) AS money,
+        (SELECT COALESCE(json_agg(json_build_object(
+                    'id', r.id, 'number', r.number, 'floor', r.floor, 'room_type', r."roomType",
+                    'capacity', r.capacity) ORDER BY r.floor, r.number), '[]')
+         FROM "Room" r WHERE r."hotelId" = %(hotel)s AND r.active) AS rooms,
+        (SELECT COALESCE(json_agg(json_build_object(
+                    'id', st.id, 'room_id', st.room_id, 'guest_name', st.guest_name,
+                    'guest_phone', st.guest_phone, 'status', st.status,
+                    'check_in_date', to_char(st.ci, 'YYYY-MM-DD'), 'check_out_date', to_char(st.co, 'YYYY-MM-DD'),
+                    'total', st.total, 'paid', COALESCE(pd.paid, 0)) ORDER BY st.ci, st.guest_name), '[]')
+         FROM stays st LEFT JOIN paid pd ON pd.stay_id = st.id) AS stays
+"""
+
+
+def compute_dashboard(hotel_id, today):
+    """
+    Цифры дня (то, что шлёт send_daily_report) и живые списки стойки: заезды,
+    выезды, проживающие, статус каждого активного номера. today — местная дата.
+    """
+    row = _fetch(DASHBOARD_SQL, {'hotel': hotel_id, 'today': today})[0]
+    day = f'{today:%Y-%m-%d}'
+
+    money = {'income': {}, 'expenses': {}, 'withdrawals': {}}
+    for item in row['money']:
+        money[item['kind']][item['key']] = float(item['amount'])
+
+    numbers = {r['id']: r['number'] for r in row['rooms']}
+    arrivals, departures, in_house = [], [], []
+    for stay in row['stays']:
+        stay['room_number'] = numbers.get(stay['room_id'])
+        stay['due'] = stay['total'] - stay['paid']
+        if stay['check_in_date'] == day:
+            arrivals.append(stay)
+        if stay['check_out_date'] == day:
+            departures.append(stay)
+        elif stay['check_in_date'] <= day:
+            in_house.append(stay)
+
+    # как на стойке: выезд сегодня важнее заезда, заезд — важнее «занят»
+    leaving = {s['room_id']: s for s in departures if s['status'] != 'CHECKED_OUT'}
+    coming = {s['room_id']: s for s in arrivals}
+    staying = {s['room_id']: s for s in in_house}
+    for room in row['rooms']:
+        rid = room['id']
+        room['status'] = ('checkOutToday' if rid in leaving else 'checkInToday' if rid in coming
+                          else 'occupied' if rid in staying else 'free')
+        guest = staying.get(rid)
+        room['guest_name'] = guest['guest_name'] if guest else None
+
+    income_total = sum(money['income'].values())
+    expenses_total = sum(money['expenses'].values())
+    total_rooms = len(row['rooms'])
+    # занят — активный номер, чью сегодняшнюю ночь покрывает неотменённый заезд
+    # (и BOOKED: номер под бронью не свободен); то же, что 'occupied' у плитки
+    occupied = len(staying.keys() & numbers.keys())
+    figures = {
+        'checked_in': sum(s['status'] in ('CHECKED_IN', 'CHECKED_OUT') for s in arrivals),
+        'checked_out': sum(s['status'] == 'CHECKED_OUT' for s in departures),
+        'income_by_method': money['income'],
+        'income_total': income_total,
+        'expenses_by_category': money['expenses'],
+        'expenses_total': expenses_total,
+        'profit': income_total - expenses_total,
+        'withdrawals_by_method': money['withdrawals'],
+        'withdrawals_total': sum(money['withdrawals'].values()),
+        'total_rooms': total_rooms,
+        'occupied_rooms': occupied,
+        'free_rooms': total_rooms - occupied,
+    }
+    return {
+        'date': day, 'figures': figures, 'rooms': row['rooms'],
+        'arrivals': arrivals, 'departures': departures, 'in_house': in_house,
+    }
+
+
+def report_dashboard(hotel_id, stale=False):
+    """Сегодня отеля через кэш отчётов: любая правка дня сбрасывает его ревизию."""
+    zone = hotel_zone(hotel_id)
+    today = datetime.now(zone).date()
+    result, source = cached_report(
+        hotel_id, f'dashboard:{today:%Y-%m-%d}', today, today,
+        lambda: compute_dashboard(hotel_id, today), stale=stale, ttl=DASHBOARD_TTL,
+    )
+    return {'timezone': zone.key, **result}, source
+
+
+# ─── портфель отелей ──────────────────────────────────────────────────────────
+
+# отрезок периода на процесс пула; короче — один запрос без пула
+PORTFOLIO_CHUNK_DAYS = 92
+
+# compute_totals всех отелей одним проходом: суммы по (отель, ключ) —
+# правила те же; rooms — активные номера (доступные ночи = rooms × дни)
+PORTFOLIO_SQL = """
+    SELECT p."hotelId", 'revenue',
+           CASE WHEN p.method = 'OTHER' AND p."customMethodLabel" <> '' THEN p."customMethodLabel"
+                ELSE p.method END, sum(p.amount)
+    FROM "Payment" p
+    WHERE p."hotelId" = ANY(%(hotels)s) AND p."businessDate" BETWEEN %(start)s AND %(end)s
+    GROUP BY 1, 3
+    UNION ALL
+    SELECT e."hotelId", 'expenses', e.category, sum(e.amount)
+    FROM "Expense" e
+    WHERE e."hotelId" = ANY(%(hotels)s) AND e."businessDate" BETWEEN %(start)s AND %(end)s
+    GROUP BY 1, 3
+    UNION ALL
+    SELECT w."hotelId", 'withdrawals', w.method, sum(w.amount)
+    FROM "Withdrawal" w
+    WHERE w."hotelId" = ANY(%(hotels)s) AND w."businessDate" BETWEEN %(start)s AND %(end)s
+    GROUP BY 1, 3
+    UNION ALL
+    SELECT n.hotel_id, 'sold', '', count(*)
+    FROM api_room_night n
+    WHERE n.hotel_id = ANY(%(hotels)s) AND n.night BETWEEN %(start)s AND %(end)s
+    GROUP BY 1
+    UNION ALL
+    SELECT r."hotelId", 'rooms', '', count(*)
+    FROM "Room" r
+    WHERE r."hotelId" = ANY(%(hotels)s) AND r.active
+    GROUP BY 1
+"""
+
+
+def _empty_part():
+    return {'revenue': {}, 'expenses': {}, 'withdrawals': {}, 'sold': 0, 'available': 0}
+
+
+def _portfolio_parts(hotel_ids, from_date, to_date):
+    """{отель: {'revenue': {...}, 'expenses': {...}, 'withdrawals': {...}, 'sold': n, 'available': n}}."""
+    days = (to_date - from_date).days + 1
+    parts = {hid: _empty_part() for hid in hotel_ids}
+    with connection.cursor() as cur:
+        cur.execute(PORTFOLIO_SQL, {'hotels': list(hotel_ids), 'start': from_date, 'end': to_date})
+        for hid, kind, key, value in cur.fetchall():
+            # в UNION count(*) приходит numeric, как и суммы
+            if kind == 'sold':
+                parts[hid]['sold'] = int(value)
+            elif kind == 'rooms':
+                parts[hid]['available'] = int(value) * days
+            else:
+                parts[hid][kind][key] = float(value)
+    return parts
+
+
+def _merge_parts(into, parts):
+    for hid, part in parts.items():
+        acc = into.setdefault(hid, _empty_part())
+        for kind in ('revenue', 'expenses', 'withdrawals'):
+            for key, value in part[kind].items():
+                acc[kind][key] = acc[kind].get(key, 0) + value
+        acc['sold'] += part['sold']
+        acc['available'] += part['available']
+    return into
+
+
+def _snapshot(part):
+    return totals_snapshot(part['revenue'], part['expenses'], part['withdrawals'], part['sold'], part['available'])
+
+
+def portfolio(hotel_ids, from_date, to_date, workers=1):
+    """
+    compute_totals по каждому отелю и по всем вместе: (по отелям, итог).
+
+    Период длиннее PORTFOLIO_CHUNK_DAYS при workers > 1 режется на отрезки,
+    которые считаются в пуле процессов (у каждого своё соединение с
+    Postgres), и суммы складываются. Пул форкается — поэтому только из
+    команды, не из воркера gunicorn с его потоками.
+    """
+    days = (to_date - from_date).days + 1
+    if workers > 1 and days > PORTFOLIO_CHUNK_DAYS:
+        starts = [from_date + timedelta(days=i) for i in range(0, days, PORTFOLIO_CHUNK_DAYS)]
+        ends = [min(start + timedelta(days=PORTFOLIO_CHUNK_DAYS - 1), to_date) for start in starts]
+        # форкнутые процессы не должны делить сокет родителя
+        connections.close_all()
+        parts = {}
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=min(workers, len(starts)), mp_context=context) as pool:
+            for chunk in pool.map(_portfolio_parts, [list(hotel_ids)] * len(starts), starts, ends):
+                _merge_parts(parts, chunk)
+    else:
+        parts = _portfolio_parts(hotel_ids, from_date, to_date)
+
+    total = {'': _empty_part()}
+    for part in parts.values():
+        _merge_parts(total, {'': part})
+    return {hid: _snapshot(part) for hid, part in parts.items()}, _snapshot(total[''])
@@ -1,14 +1,18 @@
+import functools
 import json
 import logging
 import threading
 import urllib.request
 import urllib.error
+from contextlib import contextmanager
 
 from django.conf import settings
-from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 
-from .models import Expense, Payment, Transfer, Withdrawal, HotelSettings, Profile, Stay
+from . import cache, events, occupancy, reports
+from .models import Expense, Payment, Transfer, Withdrawal, HotelSettings, Hotel, Profile, Stay, Room, CustomPaymentMethod, Guest
 
 logger = logging.getLogger(__name__)
 
@@ -42,11 +46,7 @@ def _send_telegram(group_id, text):
 
 
 def _get_group_id(hotel_id):
-    try:
-        hs = HotelSettings.objects.get(hotel_id=hotel_id)
-        return hs.telegram_group_id or None
-    except HotelSettings.DoesNotExist:
-        return None
+    return cache.telegram_group_id(hotel_id) or None
 
 
 def _fmt_category(category):
@@ -69,9 +69,208 @@ def _guest_name(stay_id):
         return None
 
 
+# ─── Пакетные операции: тишина / одна сводка ─────────────────────────────────
+#
+# Стек режимов — свой у каждого потока, поэтому muted() в импорте не глушит
+# уведомления параллельных HTTP-запросов. Решает самый внутренний контекст.
+
+_local = threading.local()
+
+# до стольких событий deferred() шлёт обычные сообщения, больше — одну сводку
+DEFER_DETAIL_LIMIT = 3
+
+SUMMARY_LABELS = {
+    ('Payment', 'created'):    'Приходов добавлено',
+    ('Payment', 'updated'):    'Приходов изменено',
+    ('Payment', 'deleted'):    'Приходов удалено',
+    ('Expense', 'created'):    'Расходов добавлено',
+    ('Expense', 'updated'):    'Расходов изменено',
+    ('Expense', 'deleted'):    'Расходов удалено',
+    ('Transfer', 'created'):   'Переводов добавлено',
+    ('Transfer', 'updated'):   'Переводов изменено',
+    ('Transfer', 'deleted'):   'Переводов удалено',
+    ('Withdrawal', 'created'): 'Снятий добавлено',
+    ('Withdrawal', 'updated'): 'Снятий изменено',
+    ('Withdrawal', 'deleted'): 'Снятий удалено',
+}
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def notifier(func):
+    """Telegram-ресивер, который уважает muted()/deferred() текущего потока."""
+    @functools.wraps(func)
+    def wrapper(sender, instance, **kwargs):
+        stack = _stack()
+        if not stack:
+            return func(sender, instance, **kwargs)
+        if stack[-1] is not None:
+            stack[-1].append((func, sender, instance, kwargs))
+    return wrapper
+
+
+@contextmanager
+def muted():
+    """Внутри блока Telegram-ресиверы молчат (сиды, починки данных)."""
+    stack = _stack()
+    stack.append(None)
+    try:
+        yield
+    finally:
+        stack.pop()
+
+
+@contextmanager
+def deferred():
+    """
+    Копит события блока и после коммита отправляет их разом: немного —
+    обычными сообщениями, много — одной сводкой на отель. При исключении
+    события выбрасываются (данные всё равно откатились). Вложенный deferred
+    отдаёт события внешнему, вложенный в muted — молчит.
+    """
+    stack = _stack()
+    pending = []
+    stack.append(pending)
+    try:
+        yield
+    except BaseException:
+        stack.pop()
+        raise
+    stack.pop()
+    if not pending:
+        return
+    if stack:
+        if stack[-1] is not None:
+            stack[-1].extend(pending)
+        return
+    transaction.on_commit(lambda: _flush(pending))
+
+
+def _event_op(kwargs):
+    if kwargs.get('signal') is post_delete:
+        return 'deleted'
+    return 'created' if kwargs.get('created') else 'updated'
+
+
+def _flush(pending):
+    if len(pending) <= DEFER_DETAIL_LIMIT:
+        for func, sender, instance, kwargs in pending:
+            func(sender, instance, **kwargs)
+        return
+
+    by_hotel = {}
+    for _, sender, instance, kwargs in pending:
+        key = (sender.__name__, _event_op(kwargs))
+        counts = by_hotel.setdefault(instance.hotel_id, {})
+        count, total = counts.get(key, (0, 0))
+        counts[key] = (count + 1, total + abs(instance.amount))
+
+    for hid, counts in by_hotel.items():
+        group_id = _get_group_id(hid)
+        if not group_id:
+            continue
+        lines = ['📦 Пакетные изменения', f'Отель: {cache.hotel_name(hid)}']
+        for key, (count, total) in counts.items():
+            lines.append(f'{SUMMARY_LABELS.get(key, key[0])}: {count} на {total:,.0f}')
+        _send_telegram(group_id, '\n'.join(lines))
+
+
+# ─── Кэш справочников ─────────────────────────────────────────────────────────
+
+REFERENCE_NAMESPACES = {
+    Hotel: 'hotel', Room: 'rooms', HotelSettings: 'settings', CustomPaymentMethod: 'payment_methods',
+}
+
+
+@receiver([post_save, post_delete], sender=Hotel)
+@receiver([post_save, post_delete], sender=Room)
+@receiver([post_save, post_delete], sender=HotelSettings)
+@receiver([post_save, post_delete], sender=CustomPaymentMethod)
+def on_reference_changed(sender, instance, **kwargs):
+    hid = instance.id if sender is Hotel else instance.hotel_id
+    cache.invalidate_on_commit(hid, REFERENCE_NAMESPACES[sender])
+    if sender is Room:
+        # доступные ночи — в каждом периоде
+        cache.invalidate_on_commit(hid, reports.NAMESPACE)
+
+
+# ─── Ревизии отчётов (api/reports.py) ─────────────────────────────────────────
+
+# поля с датами, по которым запись попадает в отчёт; у заезда — диапазон
+REPORT_DATES = {
+    Payment: ('business_date',), Expense: ('business_date',), Withdrawal: ('business_date',),
+    Stay: ('check_in_date', 'check_out_date'),
+}
+
+
+def _report_months(dates):
+    dates = [d for d in dates if d is not None]
+    if not dates:
+        return set()
+    return set(reports.months_between(min(dates), max(dates)))
+
+
+def remember_report_dates(sender, instance, update_fields=None, **kwargs):
+    """Перенос даты убирает запись из старого месяца — его ревизию тоже поднять."""
+    fields = REPORT_DATES[sender]
+    if instance._state.adding or (update_fields is not None and not set(fields) & set(update_fields)):
+        return
+    instance._report_dates = sender.objects.filter(pk=instance.pk).values_list(*fields).first()
+
+
+def on_report_data_changed(sender, instance, **kwargs):
+    months = _report_months(getattr(instance, f) for f in REPORT_DATES[sender])
+    old = instance.__dict__.pop('_report_dates', None)
+    if old:
+        months |= _report_months(old)
+    reports.invalidate_months(instance.hotel_id, months)
+
+
+@receiver(post_save, sender=Stay)
+def on_stay_saved_nights(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not set(update_fields) & reports.NIGHT_FIELDS:
+        return
+    reports.sync_room_nights([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Stay)
+def on_stay_changed_occupancy(sender, instance, **kwargs):
+    cache.invalidate_on_commit(instance.hotel_id, occupancy.NAMESPACE)
+
+
+for _model in REPORT_DATES:
+    pre_save.connect(remember_report_dates, sender=_model, dispatch_uid=f'report-pre-{_model.__name__}')
+    post_save.connect(on_report_data_changed, sender=_model, dispatch_uid=f'report-save-{_model.__name__}')
+    post_delete.connect(on_report_data_changed, sender=_model, dispatch_uid=f'report-delete-{_model.__name__}')
+
+
+# ─── Лента изменений (GET /events) ────────────────────────────────────────────
+
+# имена сущностей — как ресурсы API (и /batch)
+FEED_ENTITIES = {
+    Room: 'rooms', Stay: 'stays', Payment: 'payments', Expense: 'expenses',
+    Transfer: 'transfers', Withdrawal: 'withdrawals', Guest: 'guests',
+    CustomPaymentMethod: 'custom-payment-methods',
+}
+
+
+def on_entity_changed(sender, instance, **kwargs):
+    events.record(instance.hotel_id, FEED_ENTITIES[sender], instance.pk, _event_op(kwargs))
+
+
+for _model in FEED_ENTITIES:
+    post_save.connect(on_entity_changed, sender=_model, dispatch_uid=f'feed-save-{_model.__name__}')
+    post_delete.connect(on_entity_changed, sender=_model, dispatch_uid=f'feed-delete-{_model.__name__}')
+
+
 # ─── Expense ──────────────────────────────────────────────────────────────────
 
 @receiver(post_save, sender=Expense)
+@notifier
 def on_expense_saved(sender, instance, created, **kwargs):
     group_id = _get_group_id(instance.hotel_id)
     if not group_id:
@@ -80,7 +279,7 @@ def on_expense_saved(sender, instance, created, **kwargs):
     icon = '💸 Новый расход' if created else '✏️ Расход изменён'
     lines = [
         icon,
-        f'Отель: {instance.hotel.name}',
+        f'Отель: {cache.hotel_name(instance.hotel_id)}',
         f'Сумма: {instance.amount:,.0f}',
         f'Метод: {instance.method}',
         f'Категория: {_fmt_category(instance.category)}',
@@ -95,6 +294,7 @@ def on_expense_saved(sender, instance, created, **kwargs):
 
 
 @receiver(post_delete, sender=Expense)
+@notifier
 def on_expense_deleted(sender, instance, **kwargs):
     group_id = _get_group_id(instance.hotel_id)
     if not group_id:
@@ -102,7 +302,7 @@ def on_expense_deleted(sender, instance, **kwargs):
 
     lines = [
         '🗑 Расход удалён',
-        f'Отель: {instance.hotel.name}',
+        f'Отель: {cache.hotel_name(instance.hotel_id)}',
         f'Сумма: {instance.amount:,.0f}',
         f'Метод: {instance.method}',
         f'Категория: {_fmt_category(instance.category)}',
@@ -119,6 +319,7 @@ def on_expense_deleted(sender, instance, **kwargs):
 # ─── Payment ──────────────────────────────────────────────────────────────────
 
 @receiver(post_save, sender=Payment)
+@notifier
 def on_payment_saved(sender, instance, created, **kwargs):
     group_id = _get_group_id(instance.hotel_id)
     if not group_id:
@@ -131,7 +332,7 @@ def on_payment_saved(sender, instance, created, **kwargs):
         icon = '✏️ Возврат изменён' if is_refund else '✏️ Приход изменён'
     lines = [
         icon,
-        f'Отель: {instance.hotel.name}',
+        f'Отель: {cache.hotel_name(instance.hotel_id)}',
         f'Сумма: {abs(instance.amount):,.0f}',
         f'Метод: {instance.method}',
     ]
@@ -145,6 +346,7 @@ def on_payment_saved(sender, instance, created, **kwargs):
 
 
 @receiver(post_delete, sender=Payment)
+@notifier
 def on_payment_deleted(sender, instance, **kwargs):
     group_id = _get_group_id(instance.hotel_id)
     if not group_id:
@@ -152,7 +354,7 @@ def on_payment_deleted(sender, instance, **kwargs):
 
     lines = [
         '🗑 Приход удалён',
-        f'Отель: {instance.hotel.name}',
+        f'Отель: {cache.hotel_name(instance.hotel_id)}',
         f'Сумма: {instance.amount:,.0f}',
         f'Метод: {instance.method}',
     ]
@@ -168,6 +370,7 @@ def on_payment_deleted(sender, instance, **kwargs):
 # ─── Transfer ─────────────────────────────────────────────────────────────────
 
 @receiver(post_save, sender=Transfer)
+@notifier
 def on_transfer_saved(sender, instance, created, **kwargs):
     group_id = _get_group_id(instance.hotel_id)
     if not group_id:
@@ -176,7 +379,7 @@ def on_transfer_saved(sender, instance, created, **kwargs):
     icon = '🔄 Новый перевод' if created else '✏️ Перевод изменён'
     lines = [
         icon,
-        f'Отель: {instance.hotel.name}',
+        f'Отель: {cache.hotel_name(instance.hotel_id)}',
         f'Сумма: {instance.amount:,.0f}',
         f'Откуда: {instance.from_method}',
         f'Куда: {instance.to_method}',
@@ -188,6 +391,7 @@ def on_transfer_saved(sender, instance, created, **kwargs):
 
 
 @receiver(post_delete, sender=Transfer)
+@notifier
 def on_transfer_deleted(sender, instance, **kwargs):
     group_id = _get_group_id(instance.hotel_id)
     if not group_id:
@@ -195,7 +399,7 @@ def on_transfer_deleted(sender, instance, **kwargs):
 
     lines = [
         '🗑 Перевод удалён',
-        f'Отель: {instance.hotel.name}',
+        f'Отель: {cache.hotel_name(instance.hotel_id)}',
         f'Сумма: {instance.amount:,.0f}',
         f'Откуда: {instance.from_method}',
         f'Куда: {instance.to_method}',
@@ -209,6 +413,7 @@ def on_transfer_deleted(sender, instance, **kwargs):
 # ─── Withdrawal ───────────────────────────────────────────────────────────────
 
 @receiver(post_save, sender=Withdrawal)
+@notifier
 def on_withdrawal_saved(sender, instance, created, **kwargs):
     group_id = _get_group_id(instance.hotel_id)
     if not group_id:
@@ -217,7 +422,7 @@ def on_withdrawal_saved(sender, instance, created, **kwargs):
     icon = '💵 Снятие прибыли' if created else '✏️ Снятие изменено'
     lines = [
         icon,
-        f'Отель: {instance.hotel.name}',
+        f'Отель: {cache.hotel_name(instance.hotel_id)}',
         f'Сумма: {instance.amount:,.0f}',
         f'Касса: {instance.method}',
     ]
@@ -231,6 +436,7 @@ def on_withdrawal_saved(sender, instance, created, **kwargs):
 
 
 @receiver(post_delete, sender=Withdrawal)
+@notifier
 def on_withdrawal_deleted(sender, instance, **kwargs):
     group_id = _get_group_id(instance.hotel_id)
     if not group_id:
@@ -238,7 +444,7 @@ def on_withdrawal_deleted(sender, instance, **kwargs):
 
     lines = [
         '🗑 Снятие удалено',
-        f'Отель: {instance.hotel.name}',
+        f'Отель: {cache.hotel_name(instance.hotel_id)}',
         f'Сумма: {instance.amount:,.0f}',
         f'Касса: {instance.method}',
     ]
@@ -0,0 +1,70 @@
+from django.test import SimpleTestCase
+
+from api.management.commands.dedupe_guests import UnionFind, find_groups, name_key, phone_key
+
+
+def groups(guests):
+    return sorted(sorted(g) for g in find_groups(guests))
+
+
+class KeyTests(SimpleTestCase):
+    def test_phone_key_last_digits(self):
+        self.assertEqual(phone_key('998901234567'), phone_key('901234567'))
+        self.assertIsNone(phone_key('12345'))
+
+    def test_name_key_translit_and_order(self):
+        self.assertEqual(name_key('Навоий Алишер'), name_key('Alisher Navoi'))
+        self.assertEqual(name_key("G'ulom Xo'jaev"), name_key('Гулом Хожаев'))
+        self.assertIsNone(name_key('—'))
+
+
+class UnionFindTests(SimpleTestCase):
+    def test_transitive(self):
+        uf = UnionFind()
+        uf.union('a', 'b')
+        uf.union('c', 'd')
+        uf.union('b', 'd')
+        self.assertEqual(len({uf.find(x) for x in 'abcd'}), 1)
+        self.assertEqual(uf.find('e'), 'e')
+
+
+class FindGroupsTests(SimpleTestCase):
+    def test_same_phone(self):
+        guests = {
+            'g1': ('h', 'Ali', '998901234567'),
+            'g2': ('h', 'Совсем другой', '901234567'),
+            'g3': ('h', 'Vali', '998907654321'),
+        }
+        self.assertEqual(groups(guests), [['g1', 'g2']])
+
+    def test_namesakes_with_different_phones_stay_apart(self):
+        guests = {
+            'g1': ('h', 'Ali Valiev', '998901234567'),
+            'g2': ('h', 'Валиев Али', '998907654321'),
+            'g3': ('h', 'Ali Valiev', ''),
+        }
+        self.assertEqual(groups(guests), [])
+
+    def test_phoneless_guest_joins_single_phone_namesake(self):
+        guests = {
+            'g1': ('h', 'Ali Valiev', '998901234567'),
+            'g2': ('h', 'Валиев Али', ''),
+            'g3': ('h', 'ali valiev', '901234567'),
+        }
+        self.assertEqual(groups(guests), [['g1', 'g2', 'g3']])
+
+    def test_chain_through_phone_and_name(self):
+        # g1–g2 по телефону, g2–g3 по имени: одна группа
+        guests = {
+            'g1': ('h', 'Bobur', '998901111111'),
+            'g2': ('h', 'Sardor', '901111111'),
+            'g3': ('h', 'Сардор', ''),
+        }
+        self.assertEqual(groups(guests), [['g1', 'g2', 'g3']])
+
+    def test_hotels_are_separate(self):
+        guests = {
+            'g1': ('h1', 'Ali', '998901234567'),
+            'g2': ('h2', 'Ali', '998901234567'),
+        }
+        self.assertEqual(groups(guests), [])
@@ -0,0 +1,97 @@
+import random
+from datetime import date, timedelta
+
+from django.test import SimpleTestCase
+
+from api.occupancy import _Index, _Room
+
+D = date(2026, 1, 1)
+
+
+def day(n):
+    return D + timedelta(days=n)
+
+
+class RoomOverlappingTests(SimpleTestCase):
+    def test_half_open_bounds(self):
+        room = _Room()
+        room.add('a', day(0), day(3))
+        self.assertEqual(room.overlapping(day(3), day(5)), [])   # выезд в день заезда
+        self.assertEqual(room.overlapping(day(-2), day(0)), [])
+        self.assertEqual(room.overlapping(day(2), day(4)), ['a'])
+
+    def test_long_stay_behind_short_ones(self):
+        # длинный заезд раньше коротких: его находит только prefix-max top
+        room = _Room()
+        room.add('long', day(0), day(30))
+        room.add('s1', day(2), day(3))
+        room.add('s2', day(5), day(6))
+        self.assertEqual(room.overlapping(day(10), day(11)), ['long'])
+        self.assertEqual(sorted(room.overlapping(day(5), day(11))), ['long', 's2'])
+
+    def test_remove_recomputes_top(self):
+        room = _Room()
+        room.add('long', day(0), day(30))
+        room.add('short', day(1), day(2))
+        room.remove('long', day(0))
+        self.assertEqual(room.top, [day(2)])
+        self.assertEqual(room.overlapping(day(10), day(11)), [])
+
+    def test_remove_same_start(self):
+        room = _Room()
+        room.add('a', day(0), day(2))
+        room.add('b', day(0), day(5))
+        room.remove('b', day(0))
+        self.assertEqual(room.ids, ['a'])
+        self.assertEqual(room.overlapping(day(3), day(4)), [])
+
+    def test_matches_linear_scan(self):
+        rnd = random.Random(49)
+        room, stays = _Room(), {}
+        for i in range(300):
+            start = day(rnd.randrange(0, 200))
+            end = start + timedelta(days=rnd.randrange(1, 40))
+            room.add(i, start, end)
+            stays[i] = (start, end)
+            if rnd.random() < 0.3:
+                gone = rnd.choice(list(stays))
+                room.remove(gone, stays.pop(gone)[0])
+        for _ in range(500):
+            start = day(rnd.randrange(-10, 250))
+            end = start + timedelta(days=rnd.randrange(1, 20))
+            expected = {i for i, (s, e) in stays.items() if s < end and e > start}
+            self.assertEqual(set(room.overlapping(start, end)), expected)
+
+
+class IndexBusyTests(SimpleTestCase):
+    def setUp(self):
+        self.index = _Index('h')
+        self.index._put('s1', 'r1', day(0), day(3))
+        self.index._put('s2', 'r2', day(5), day(7))
+
+    def test_busy_from_index(self):
+        self.assertEqual(self.index.busy({'r1', 'r2', 'r3'}, day(1), day(6)), {'r1', 'r2'})
+        self.assertEqual(self.index.busy({'r1', 'r2'}, day(3), day(5)), set())
+
+    def test_exclude_own_stay(self):
+        self.assertEqual(self.index.busy({'r1'}, day(1), day(2), exclude_id='s1'), set())
+
+    def test_put_moves_stay(self):
+        self.index._put('s1', 'r3', day(0), day(3))
+        self.assertEqual(self.index.busy({'r1', 'r3'}, day(1), day(2)), {'r3'})
+
+    def test_overlay_cancelled_stay_frees_room(self):
+        # незакоммиченная отмена: в индексе заезд ещё есть, в overlay — None
+        self.assertEqual(self.index.busy({'r1'}, day(1), day(2), overlay={'s1': None}), set())
+
+    def test_overlay_moved_stay(self):
+        overlay = {'s1': ('r2', day(10), day(12))}
+        self.assertEqual(self.index.busy({'r1', 'r2'}, day(1), day(2), overlay=overlay), set())
+        self.assertEqual(self.index.busy({'r1', 'r2'}, day(11), day(13), overlay=overlay), {'r2'})
+
+    def test_overlay_new_stay(self):
+        overlay = {'s3': ('r3', day(0), day(1))}
+        self.assertEqual(self.index.busy({'r3'}, day(0), day(1), overlay=overlay), {'r3'})
+        self.assertEqual(self.index.busy({'r3'}, day(1), day(2), overlay=overlay), set())
+        self.assertEqual(self.index.busy({'r3'}, day(0), day(1), exclude_id='s3', overlay=overlay), set())
+        self.assertEqual(self.index.busy({'r1'}, day(0), day(1), overlay=overlay), {'r1'})
@@ -0,0 +1,49 @@
+from django.test import SimpleTestCase
+
+from api.models import Room
+from api.views import pick_rooms
+
+
+def rooms(*numbers):
+    return [Room(id=n, number=n, floor=int(n[0]) if n[0].isdigit() else 0) for n in numbers]
+
+
+def numbers(picked):
+    return None if picked is None else [r.number for r in picked]
+
+
+class PickRoomsTests(SimpleTestCase):
+    def test_default_order_by_floor_and_number(self):
+        free = rooms('202', '101', '110', '102')
+        self.assertEqual(numbers(pick_rooms(free, 3)), ['101', '102', '110'])
+        self.assertIsNone(pick_rooms(free, 5))
+
+    def test_numeric_not_lexical_order(self):
+        free = rooms('110', '19', '109')
+        self.assertEqual(numbers(pick_rooms(free, 2)), ['19', '109'])
+
+    def test_adjacent_takes_shortest_fitting_run(self):
+        # 101-104 подряд, 201-202 подряд: двоим — короткий отрезок второго этажа
+        free = rooms('101', '102', '103', '104', '201', '202', '205')
+        self.assertEqual(numbers(pick_rooms(free, 2, adjacent=True)), ['201', '202'])
+        self.assertEqual(numbers(pick_rooms(free, 3, adjacent=True)), ['101', '102', '103'])
+        self.assertIsNone(pick_rooms(free, 5, adjacent=True))
+
+    def test_adjacent_breaks_on_gap_and_floor(self):
+        free = [Room(id='a', number='109', floor=1), Room(id='b', number='110', floor=2),
+                Room(id='c', number='112', floor=2)]
+        self.assertIsNone(pick_rooms(free, 2, adjacent=True))
+
+    def test_adjacent_skips_lettered_rooms(self):
+        free = rooms('101', '101A', '102')
+        self.assertEqual(numbers(pick_rooms(free, 2, adjacent=True)), ['101', '102'])
+
+    def test_same_floor_prefers_tightest_floor(self):
+        free = rooms('101', '102', '103', '201', '202', '301')
+        self.assertEqual(numbers(pick_rooms(free, 2, same_floor=True)), ['201', '202'])
+        self.assertEqual(numbers(pick_rooms(free, 1, same_floor=True)), ['301'])
+        self.assertIsNone(pick_rooms(free, 4, same_floor=True))
+
+    def test_adjacent_wins_over_same_floor(self):
+        free = rooms('101', '103', '201', '202', '203')
+        self.assertEqual(numbers(pick_rooms(free, 2, same_floor=True, adjacent=True)), ['201', '202'])
@@ -3,6 +3,8 @@ from . import views
 
 urlpatterns = [
     path('health',                              views.HealthView.as_view()),
+    path('cache-stats',                         views.CacheStatsView.as_view()),
+    path('events',                              views.EventsView.as_view()),
     path('auth/login',                          views.LoginView.as_view()),
     path('auth/register',                       views.RegisterView.as_view()),
     path('auth/logout',                         views.LogoutView.as_view()),
@@ -10,8 +12,10 @@ urlpatterns = [
     path('hotels/me',                           views.HotelMeView.as_view()),
     path('hotel-settings',                      views.HotelSettingsView.as_view()),
     path('rooms',                               views.RoomListCreateView.as_view()),
+    path('rooms/availability',                  views.RoomAvailabilityView.as_view()),
     path('rooms/<str:pk>',                      views.RoomDetailView.as_view()),
     path('stays',                               views.StayListCreateView.as_view()),
+    path('stays/allocate',                      views.StayAllocateView.as_view()),
     path('stays/<str:pk>',                      views.StayDetailView.as_view()),
     path('payments',                            views.PaymentListCreateView.as_view()),
     path('payments/<str:pk>',                   views.PaymentDetailView.as_view()),
@@ -21,6 +25,13 @@ urlpatterns = [
     path('month-closings/close-previous',       views.ClosePreviousMonthView.as_view()),
     path('month-closings/<str:month>',          views.ReopenMonthView.as_view()),
     path('reports',                             views.ReportsView.as_view()),
+    path('reports/cube',                        views.ReportCubeView.as_view()),
+    path('reports/timeseries',                  views.ReportSeriesView.as_view()),
+    path('reports/pace',                        views.ReportPaceView.as_view()),
+    path('dashboard',                           views.DashboardView.as_view()),
+    path('portfolio',                           views.PortfolioView.as_view()),
+    path('forecast',                            views.ForecastView.as_view()),
+    path('guest-stats',                         views.GuestStatsView.as_view()),
     path('users',                               views.UserListCreateView.as_view()),
     path('users/<str:pk>/role',                 views.UserRoleView.as_view()),
     path('users/<str:pk>',                      views.UserDetailView.as_view()),
@@ -31,5 +42,9 @@ urlpatterns = [
     path('withdrawals',                         views.WithdrawalListCreateView.as_view()),
     path('withdrawals/<str:pk>',                views.WithdrawalDetailView.as_view()),
     path('guests',                              views.GuestListCreateView.as_view()),
+    path('guests/search',                       views.GuestSearchView.as_view()),
     path('guests/<str:pk>',                     views.GuestDetailView.as_view()),
+    path('export/<str:kind>.csv',               views.ExportView.as_view()),
+    path('import',                              views.ImportView.as_view()),
+    path('batch',                               views.BatchView.as_view()),
 ]
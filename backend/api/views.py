@@ -1,3 +1,5 @@
+import csv
+import re
 import uuid
 import bcrypt
 from datetime import datetime, timezone, timedelta
@@ -6,17 +8,26 @@ from decimal import Decimal, InvalidOperation
 from django.conf import settings
 from django.core.exceptions import ValidationError as DjangoValidationError
 from django.core.validators import validate_email
-from django.db import IntegrityError, transaction
+from django.db import IntegrityError, connection, transaction
 from django.db.models import Sum, Q, F
+from django.db.models.signals import post_save
+from django.http import QueryDict, StreamingHttpResponse
+from django.utils.datastructures import CaseInsensitiveMapping
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import APIException, ValidationError
 from rest_framework_simplejwt.tokens import AccessToken
 
-from .models import User, Hotel, Profile, UserRole, Room, Stay, Payment, Expense, MonthClosing, CustomPaymentMethod, Transfer, HotelSettings, Withdrawal, Guest
-from .permissions import IsAdmin
+from . import cache, events, occupancy, signals
+from .models import User, Hotel, Profile, UserRole, Room, Stay, Payment, Expense, MonthClosing, CustomPaymentMethod, Transfer, HotelSettings, Withdrawal, Guest, BUSINESS_DATE_SOURCES, hotel_zone, normalize_phone
+from .importer import ENTITIES as IMPORT_ENTITIES, ImportFailed, detect_format, import_hotel_data
+from .permissions import IsAdmin, IsOperator
+from .reports import (
+    BUCKETS, COMPARE_MODES, DEFAULT_FORECAST_DAYS, MAX_FORECAST_DAYS, parse_cube_dims, parse_series_metrics,
+    pace, portfolio, rebuild_business_dates, report_cube, report_dashboard, report_forecast, report_series, report_totals,
+)
 
 
 # ─── helpers ─────────────────────────────────────────────────────────────────
@@ -101,6 +112,45 @@ def parse_int(val, field, default=0):
         raise ValidationError({field: 'Invalid integer'})
 
 
+def fetch_dicts(sql, params):
+    """Сырой SQL → список dict по именам колонок."""
+    with connection.cursor() as cur:
+        cur.execute(sql, params)
+        cols = [c[0] for c in cur.description]
+        return [dict(zip(cols, row)) for row in cur.fetchall()]
+
+
+def snapshot(obj):
+    """Значения колонок до правки — чтобы потом записать только изменённые."""
+    return {f.attname: getattr(obj, f.attname) for f in obj._meta.concrete_fields}
+
+
+def check_version(request, obj):
+    """If-Match: "<version>" от клиента; правка поверх чужой, более новой → 412."""
+    header = (request.headers.get('If-Match') or '').strip()
+    if not header or header == '*':
+        return None
+    tags = {t.strip().removeprefix('W/').strip('"') for t in header.split(',')}
+    if str(obj.version) not in tags:
+        return Response({'message': 'Version conflict', 'version': obj.version}, status=412)
+    return None
+
+
+def save_changed(obj, before):
+    """UPDATE только изменённых колонок + version; ничего не изменилось — ни записи, ни сигнала."""
+    changed = [attname for attname, val in before.items() if getattr(obj, attname) != val]
+    if not changed:
+        return False
+    obj.version += 1
+    obj.save(update_fields=changed + ['version'])
+    return True
+
+
+def with_etag(resp, obj):
+    resp['ETag'] = f'"{obj.version}"'
+    return resp
+
+
 def user_payload(user_id, email, full_name, role, hotel_id_val):
     """Единый контракт auth-ответов (login/register) — фронт читает AuthUser."""
     return {
@@ -236,14 +286,10 @@ class MeView(APIView):
 
 class HotelMeView(APIView):
     def get(self, request):
-        try:
-            h = Hotel.objects.get(id=hotel_id(request))
-        except Hotel.DoesNotExist:
+        h = cache.hotel_info(hotel_id(request))
+        if not h:
             return Response({'message': 'Hotel not found'}, status=404)
-        return Response({
-            'id': h.id, 'name': h.name,
-            'timezone': h.timezone, 'created_at': fmt_dt(h.created_at),
-        })
+        return Response({**h, 'created_at': fmt_dt(h['created_at'])})
 
     def patch(self, request):
         try:
@@ -252,9 +298,13 @@ class HotelMeView(APIView):
             return Response({'message': 'Hotel not found'}, status=404)
         if 'name' in request.data:
             h.name = request.data['name']
+        tz_changed = 'timezone' in request.data and request.data['timezone'] != h.timezone
         if 'timezone' in request.data:
             h.timezone = request.data['timezone']
-        h.save(update_fields=['name', 'timezone'])
+        with transaction.atomic():
+            h.save(update_fields=['name', 'timezone'])
+            if tz_changed:
+                rebuild_business_dates(h.id)
         return Response({
             'id': h.id, 'name': h.name,
             'timezone': h.timezone, 'created_at': fmt_dt(h.created_at),
@@ -269,8 +319,7 @@ class HotelSettingsView(APIView):
         return hs
 
     def get(self, request):
-        hs = self._get_or_create(request)
-        return Response({'telegram_group_id': hs.telegram_group_id})
+        return Response({'telegram_group_id': cache.telegram_group_id(hotel_id(request))})
 
     def patch(self, request):
         hs = self._get_or_create(request)
@@ -284,17 +333,22 @@ class HotelSettingsView(APIView):
 
 def room_data(r):
     return {
-        'id': r.id, 'hotel_id': r.hotel_id, 'number': r.number,
+        'id': r.id, 'version': r.version, 'hotel_id': r.hotel_id, 'number': r.number,
         'floor': r.floor, 'room_type': r.room_type, 'capacity': r.capacity,
         'base_price': to_float(r.base_price), 'active': r.active,
         'notes': r.notes, 'created_at': fmt_dt(r.created_at),
     }
 
 
+def cached_rooms(hid):
+    return cache.cached(hid, 'rooms', lambda: [
+        room_data(r) for r in Room.objects.filter(hotel_id=hid).order_by('-created_at')
+    ])
+
+
 class RoomListCreateView(APIView):
     def get(self, request):
-        rooms = Room.objects.filter(hotel_id=hotel_id(request)).order_by('-created_at')
-        return Response([room_data(r) for r in rooms])
+        return Response(cached_rooms(hotel_id(request)))
 
     def post(self, request):
         d = request.data
@@ -314,17 +368,46 @@ class RoomListCreateView(APIView):
         return Response(room_data(room), status=201)
 
 
+class RoomAvailabilityView(APIView):
+    """
+    Свободные активные номера на [check_in_date, check_out_date): справочник
+    номеров из кэша, занятость — из индекса в памяти, без запросов к Postgres.
+    """
+
+    def get(self, request):
+        q = request.query_params
+        check_in = parse_date(q.get('check_in_date'))
+        check_out = parse_date(q.get('check_out_date'))
+        if not check_in or not check_out or check_out <= check_in:
+            return Response({'message': 'check_in_date and check_out_date are required, check-out after check-in'}, status=400)
+        min_capacity = parse_int(q.get('min_capacity'), 'min_capacity')
+        hid = hotel_id(request)
+        rooms = [
+            r for r in cached_rooms(hid)
+            if r['active'] and r['capacity'] >= min_capacity
+            and (not q.get('room_type') or r['room_type'] == q['room_type'])
+        ]
+        busy = occupancy.busy_rooms(hid, [r['id'] for r in rooms], check_in, check_out)
+        return Response([r for r in rooms if r['id'] not in busy])
+
+
 class RoomDetailView(APIView):
-    def _get(self, request, pk):
+    def _get(self, request, pk, lock=False):
+        qs = Room.objects.select_for_update() if lock else Room.objects
         try:
-            return Room.objects.get(id=pk, hotel_id=hotel_id(request))
+            return qs.get(id=pk, hotel_id=hotel_id(request))
         except Room.DoesNotExist:
             return None
 
+    @transaction.atomic
     def patch(self, request, pk):
-        room = self._get(request, pk)
+        room = self._get(request, pk, lock=True)
         if not room:
             return Response({'message': 'Not found'}, status=404)
+        conflict = check_version(request, room)
+        if conflict:
+            return conflict
+        before = snapshot(room)
         d = request.data
         for field, val in [
             ('number', d.get('number')),
@@ -337,8 +420,8 @@ class RoomDetailView(APIView):
         ]:
             if val is not None:
                 setattr(room, field, val)
-        room.save()
-        return Response(room_data(room))
+        save_changed(room, before)
+        return with_etag(Response(room_data(room)), room)
 
     def delete(self, request, pk):
         room = self._get(request, pk)
@@ -351,11 +434,12 @@ class RoomDetailView(APIView):
 # ─── stays ────────────────────────────────────────────────────────────────────
 
 def stay_data(s, guest=None):
-    # Use linked guest's current name/phone if available
-    name  = guest.name  if guest else s.guest_name
-    phone = guest.phone if guest else s.guest_phone
+    # имя и телефон — как введены в заезде; у гостя по тому же телефону имя
+    # может быть записано иначе (опечатка, транслитерация, отчество)
+    name  = s.guest_name or (guest.name if guest else '')
+    phone = s.guest_phone or (guest.phone if guest else None)
     return {
-        'id': s.id, 'hotel_id': s.hotel_id, 'room_id': s.room_id,
+        'id': s.id, 'hotel_id': s.hotel_id, 'room_id': s.room_id, 'version': s.version,
         'guest_id': s.guest_id,
         'guest_name': name, 'guest_phone': phone,
         'check_in_date': fmt_date(s.check_in_date),
@@ -369,18 +453,43 @@ def stay_data(s, guest=None):
     }
 
 
+GUEST_COLUMNS = [f.attname for f in Guest._meta.concrete_fields]
+
+# один запрос: вставить гостя или вернуть записанного с тем же телефоном.
+# SET name = api_guest.name ничего не меняет — нужно ради RETURNING;
+# xmax = 0 только у только что вставленной строки
+GUEST_UPSERT_SQL = f"""
+    INSERT INTO api_guest (id, hotel_id, name, phone, phone_digits, notes, created_at, version)
+    VALUES (%s, %s, %s, %s, %s, '', now(), 1)
+    ON CONFLICT (hotel_id, phone_digits) WHERE phone_digits <> ''
+    DO UPDATE SET name = api_guest.name
+    RETURNING {', '.join(GUEST_COLUMNS)}, xmax = 0
+"""
+
+
 def _find_or_create_guest(hotel_id_val, name, phone):
-    """Find existing guest by name+phone or create new one. Returns Guest or None."""
+    """
+    Гость заезда: по нормализованному телефону (уникален в отеле) или, если
+    телефона нет, по имени. Returns Guest or None.
+    """
     name = (name or '').strip()
     if not name:
         return None
     phone = (phone or '').strip()
-    qs = Guest.objects.filter(hotel_id=hotel_id_val, name=name)
-    if phone:
-        qs = qs.filter(phone=phone)
-    guest = qs.first()
+    digits = normalize_phone(phone)
+    if digits:
+        with connection.cursor() as cur:
+            cur.execute(GUEST_UPSERT_SQL, [str(uuid.uuid4()), hotel_id_val, name, phone, digits])
+            *row, created = cur.fetchone()
+        guest = Guest.from_db(connection.alias, GUEST_COLUMNS, row)
+        if created:
+            # запись мимо save(): лента, кэш и уведомления — тем же сигналом
+            post_save.send(sender=Guest, instance=guest, created=True, update_fields=None,
+                           raw=False, using=connection.alias)
+        return guest
+    guest = Guest.objects.filter(hotel_id=hotel_id_val, name=name).first()
     if not guest:
-        guest = Guest(id=str(uuid.uuid4()), hotel_id=hotel_id_val, name=name, phone=phone, notes='')
+        guest = Guest(id=str(uuid.uuid4()), hotel_id=hotel_id_val, name=name, phone='', notes='')
         guest.save()
     return guest
 
@@ -401,25 +510,72 @@ BLOCKING_STATUSES = ['CHECKED_IN', 'BOOKED']
 
 def has_room_overlap(hotel_id_val, room_id, check_in, check_out, exclude_id=None):
     """Return True if any active stay occupies this room during [check_in, check_out)."""
-    qs = Stay.objects.filter(
-        hotel_id=hotel_id_val,
-        room_id=room_id,
-        status__in=BLOCKING_STATUSES,
-        check_in_date__lt=check_out,
-        check_out_date__gt=check_in,
-    )
-    if exclude_id:
-        qs = qs.exclude(id=exclude_id)
-    return qs.exists()
+    return room_id in occupancy.busy_rooms(hotel_id_val, [room_id], check_in, check_out, exclude_id)
+
+
+def lock_rooms(hotel_id_val, room_ids):
+    """
+    FOR UPDATE на строки номеров (по id — без взаимных блокировок): пока
+    транзакция не закончилась, другое бронирование этих номеров ждёт, а не
+    проходит проверку пересечений по старым данным.
+    """
+    return list(Room.objects.select_for_update().filter(hotel_id=hotel_id_val, id__in=room_ids).order_by('id'))
+
+
+MAX_ALLOCATE_ROOMS = 100
+
+
+def _room_no(room):
+    """Номер как число для «соседних» ('101' → 101); буквенный — None."""
+    return int(room.number) if room.number.strip().isdigit() else None
+
+
+def pick_rooms(rooms, count, same_floor=False, adjacent=False):
+    """
+    Свободные номера для группы или None. rooms — уже отфильтрованные по
+    типу и вместимости свободные номера.
+
+    adjacent: номера подряд (101, 102, 103) на одном этаже — берётся самый
+    короткий подходящий отрезок, чтобы длинные оставались для больших групп.
+    same_floor: этаж, где свободных номеров меньше всего, но хватает.
+    Иначе — по порядку этажей и номеров.
+    """
+    def order(r):
+        n = _room_no(r)
+        return (r.floor, n is None, n or 0, r.number)
+
+    rooms = sorted(rooms, key=order)
+    if adjacent:
+        runs, run = [], []
+        for r in rooms:
+            n = _room_no(r)
+            if n is None:
+                continue
+            if run and (r.floor != run[-1].floor or n != _room_no(run[-1]) + 1):
+                runs.append(run)
+                run = []
+            run.append(r)
+        if run:
+            runs.append(run)
+        fits = [run for run in runs if len(run) >= count]
+        return min(fits, key=len)[:count] if fits else None
+    if same_floor:
+        floors = {}
+        for r in rooms:
+            floors.setdefault(r.floor, []).append(r)
+        fits = [group for group in floors.values() if len(group) >= count]
+        return min(fits, key=len)[:count] if fits else None
+    return rooms[:count] if len(rooms) >= count else None
 
 
 class StayListCreateView(APIView):
     def get(self, request):
         stays = list(apply_paging(request, Stay.objects.filter(hotel_id=hotel_id(request)).order_by('-created_at')))
         guest_ids = {s.guest_id for s in stays if s.guest_id}
-        guests_map = {g.id: g for g in Guest.objects.filter(id__in=guest_ids)}
+        guests_map = {g.id: g for g in Guest.objects.filter(hotel_id=hotel_id(request), id__in=guest_ids)}
         return Response([stay_data(s, guests_map.get(s.guest_id)) for s in stays])
 
+    @transaction.atomic
     def post(self, request):
         d = request.data
         check_in = parse_date(d.get('check_in_date'))
@@ -429,6 +585,7 @@ class StayListCreateView(APIView):
         hid = hotel_id(request)
 
         if new_status in BLOCKING_STATUSES and check_in and check_out:
+            lock_rooms(hid, [room_id])
             if has_room_overlap(hid, room_id, check_in, check_out):
                 return Response({'message': 'Room is occupied in the selected dates'}, status=409)
 
@@ -458,20 +615,96 @@ class StayListCreateView(APIView):
         return Response(data, status=201)
 
 
+class StayAllocateView(APIView):
+    """
+    Номера для группы одним запросом: диапазон дат, число номеров и условия
+    (room_type, min_capacity, same_floor, adjacent). Свободные — по индексу
+    занятости (api/occupancy.py), подбор в памяти, все заезды — одной транзакцией.
+    """
+
+    def post(self, request):
+        d = request.data
+        check_in = parse_date(d.get('check_in_date'))
+        check_out = parse_date(d.get('check_out_date'))
+        if not check_in or not check_out or check_out <= check_in:
+            return Response({'message': 'check_in_date and check_out_date are required, check-out after check-in'}, status=400)
+        count = parse_int(d.get('count'), 'count')
+        if not 1 <= count <= MAX_ALLOCATE_ROOMS:
+            return Response({'message': f'count must be between 1 and {MAX_ALLOCATE_ROOMS}'}, status=400)
+        new_status = d.get('status', 'BOOKED')
+        if new_status not in BLOCKING_STATUSES:
+            return Response({'message': f'status must be one of {", ".join(BLOCKING_STATUSES)}'}, status=400)
+        hid = hotel_id(request)
+
+        candidates = Room.objects.filter(hotel_id=hid, active=True)
+        if d.get('room_type'):
+            candidates = candidates.filter(room_type=d['room_type'])
+        if d.get('min_capacity') not in (None, ''):
+            candidates = candidates.filter(capacity__gte=parse_int(d['min_capacity'], 'min_capacity'))
+        price = parse_decimal(d['price_per_night'], 'price_per_night') if d.get('price_per_night') not in (None, '') else None
+        discount = parse_decimal(d.get('weekly_discount_amount', 0), 'weekly_discount_amount')
+        adjustment = parse_decimal(d.get('manual_adjustment_amount', 0), 'manual_adjustment_amount')
+        deposit = parse_decimal(d.get('deposit_expected', 0), 'deposit_expected')
+
+        with signals.deferred(), transaction.atomic():
+            # сначала блокировка, потом выборка свободных: конкурирующий запрос
+            # ждёт коммита и видит уже вставленные заезды
+            locked = lock_rooms(hid, candidates.values('id'))
+            busy = occupancy.busy_rooms(hid, [r.id for r in locked], check_in, check_out)
+            free = [r for r in locked if r.id not in busy]
+            rooms = pick_rooms(free, count, bool(d.get('same_floor')), bool(d.get('adjacent')))
+            if rooms is None:
+                return Response({'message': 'Not enough free rooms for the selected constraints', 'available': len(free)}, status=409)
+
+            guest = _find_or_create_guest(hid, d.get('guest_name'), d.get('guest_phone'))
+            now = datetime.now(timezone.utc)
+            stays = []
+            for room in rooms:
+                stay = Stay(
+                    id=str(uuid.uuid4()),
+                    hotel_id=hid,
+                    room_id=room.id,
+                    guest_name=d.get('guest_name', ''),
+                    guest_phone=d.get('guest_phone') or None,
+                    guest_id=guest.id if guest else None,
+                    check_in_date=check_in,
+                    check_out_date=check_out,
+                    status=new_status,
+                    price_per_night=room.base_price if price is None else price,
+                    weekly_discount_amount=discount,
+                    manual_adjustment_amount=adjustment,
+                    deposit_expected=deposit,
+                    comment=d.get('comment') or None,
+                    created_at=now,
+                )
+                stay.save()
+                stays.append(stay)
+
+        data = {'stays': [stay_data(s, guest) for s in stays]}
+        if guest:
+            data['_guest'] = guest_data(guest)
+        return Response(data, status=201)
+
+
 class StayDetailView(APIView):
-    def _get(self, request, pk):
+    def _get(self, request, pk, lock=False):
+        qs = Stay.objects.select_for_update() if lock else Stay.objects
         try:
-            return Stay.objects.get(id=pk, hotel_id=hotel_id(request))
+            return qs.get(id=pk, hotel_id=hotel_id(request))
         except Stay.DoesNotExist:
             return None
 
+    @transaction.atomic
     def patch(self, request, pk):
-        stay = self._get(request, pk)
+        stay = self._get(request, pk, lock=True)
         if not stay:
             return Response({'message': 'Not found'}, status=404)
+        conflict = check_version(request, stay)
+        if conflict:
+            return conflict
+        before = snapshot(stay)
         d = request.data
         if 'room_id' in d:         stay.room_id = d['room_id']
-        guest_changed = 'guest_name' in d or 'guest_phone' in d
         if 'guest_name' in d:     stay.guest_name = d['guest_name']
         if 'guest_phone' in d:    stay.guest_phone = d['guest_phone'] or None
         if 'check_in_date' in d:  stay.check_in_date = parse_date(d['check_in_date'])
@@ -489,19 +722,23 @@ class StayDetailView(APIView):
         if 'deposit_expected' in d:         stay.deposit_expected = parse_decimal(d['deposit_expected'], 'deposit_expected')
         if 'comment' in d:        stay.comment = d['comment'] or None
 
-        # Overlap check: only for blocking statuses
-        if stay.status in BLOCKING_STATUSES:
+        changed = {a for a, v in before.items() if getattr(stay, a) != v}
+
+        # Overlap check: only for blocking statuses and only if room/dates/status moved
+        if stay.status in BLOCKING_STATUSES and changed & {'room_id', 'check_in_date', 'check_out_date', 'status'}:
+            # как при создании: параллельная бронь этого номера ждёт нашего COMMIT
+            lock_rooms(hotel_id(request), [stay.room_id])
             if has_room_overlap(hotel_id(request), stay.room_id, stay.check_in_date, stay.check_out_date, exclude_id=pk):
                 return Response({'message': 'Room is occupied in the selected dates'}, status=409)
 
-        if guest_changed:
+        if changed & {'guest_name', 'guest_phone'}:
             guest = _find_or_create_guest(hotel_id(request), stay.guest_name, stay.guest_phone)
             stay.guest_id = guest.id if guest else None
         else:
-            guest = Guest.objects.filter(id=stay.guest_id).first() if stay.guest_id else None
+            guest = Guest.objects.filter(hotel_id=hotel_id(request), id=stay.guest_id).first() if stay.guest_id else None
 
-        stay.save()
-        return Response(stay_data(stay, guest))
+        save_changed(stay, before)
+        return with_etag(Response(stay_data(stay, guest)), stay)
 
     def delete(self, request, pk):
         stay = self._get(request, pk)
@@ -519,8 +756,8 @@ class StayDetailView(APIView):
 
 def payment_data(p):
     return {
-        'id': p.id, 'hotel_id': p.hotel_id, 'stay_id': p.stay_id,
-        'paid_at': fmt_dt(p.paid_at), 'method': p.method,
+        'id': p.id, 'version': p.version, 'hotel_id': p.hotel_id, 'stay_id': p.stay_id,
+        'paid_at': fmt_dt(p.paid_at), 'business_date': fmt_date(p.business_date), 'method': p.method,
         'custom_method_label': p.custom_method_label,
         'amount': to_float(p.amount), 'comment': p.comment,
         'created_at': fmt_dt(p.created_at),
@@ -549,30 +786,36 @@ class PaymentListCreateView(APIView):
 
 
 class PaymentDetailView(APIView):
-    def _get(self, request, pk):
+    def _get(self, request, pk, lock=False):
+        qs = Payment.objects.select_for_update() if lock else Payment.objects
         try:
-            return Payment.objects.get(id=pk, hotel_id=hotel_id(request))
+            return qs.get(id=pk, hotel_id=hotel_id(request))
         except Payment.DoesNotExist:
             return None
 
+    @transaction.atomic
     def patch(self, request, pk):
-        p = self._get(request, pk)
+        p = self._get(request, pk, lock=True)
         if not p:
             return Response({'message': 'Not found'}, status=404)
+        conflict = check_version(request, p)
+        if conflict:
+            return conflict
+        before = snapshot(p)
         d = request.data
         if 'paid_at' in d:  p.paid_at = parse_date(d['paid_at'])
         if 'method' in d:   p.method = d['method']
         if 'amount' in d:   p.amount = parse_decimal(d['amount'], 'amount')
         if 'comment' in d:              p.comment = d['comment'] or None
-        p.save()
-        return Response(payment_data(p))
+        save_changed(p, before)
+        return with_etag(Response(payment_data(p)), p)
 
     def delete(self, request, pk):
         p = self._get(request, pk)
         if not p:
             return Response({'message': 'Not found'}, status=404)
         # Check if month is closed
-        month = p.paid_at.strftime('%Y-%m')
+        month = p.business_date.strftime('%Y-%m')
         if MonthClosing.objects.filter(hotel_id=p.hotel_id, month=month).exists():
             if not request.user.is_admin:
                 return Response({'message': 'Month is closed'}, status=403)
@@ -582,17 +825,19 @@ class PaymentDetailView(APIView):
 
 # ─── expenses ─────────────────────────────────────────────────────────────────
 
-def expense_data(e):
+def expense_data(e, names=None):
     created_by_name = None
-    if e.created_by_id:
+    if names is not None:
+        created_by_name = names.get(e.created_by_id)
+    elif e.created_by_id:
         try:
             profile = Profile.objects.get(id=e.created_by_id)
             created_by_name = profile.full_name
         except Profile.DoesNotExist:
             created_by_name = None
     return {
-        'id': e.id, 'hotel_id': e.hotel_id,
-        'spent_at': fmt_dt(e.spent_at), 'category': e.category,
+        'id': e.id, 'hotel_id': e.hotel_id, 'version': e.version,
+        'spent_at': fmt_dt(e.spent_at), 'business_date': fmt_date(e.business_date), 'category': e.category,
         'method': e.method,
         'custom_method_label': e.custom_method_label,
         'amount': to_float(e.amount), 'comment': e.comment,
@@ -626,30 +871,36 @@ class ExpenseListCreateView(APIView):
 
 
 class ExpenseDetailView(APIView):
-    def _get(self, request, pk):
+    def _get(self, request, pk, lock=False):
+        qs = Expense.objects.select_for_update() if lock else Expense.objects
         try:
-            return Expense.objects.get(id=pk, hotel_id=hotel_id(request))
+            return qs.get(id=pk, hotel_id=hotel_id(request))
         except Expense.DoesNotExist:
             return None
 
+    @transaction.atomic
     def patch(self, request, pk):
-        e = self._get(request, pk)
+        e = self._get(request, pk, lock=True)
         if not e:
             return Response({'message': 'Not found'}, status=404)
+        conflict = check_version(request, e)
+        if conflict:
+            return conflict
+        before = snapshot(e)
         d = request.data
         if 'spent_at' in d:   e.spent_at = parse_date(d['spent_at'])
         if 'category' in d:   e.category = d['category']
         if 'method' in d:     e.method = d['method']
         if 'amount' in d:     e.amount = parse_decimal(d['amount'], 'amount')
         if 'comment' in d:              e.comment = d['comment'] or None
-        e.save()
-        return Response(expense_data(e))
+        save_changed(e, before)
+        return with_etag(Response(expense_data(e)), e)
 
     def delete(self, request, pk):
         e = self._get(request, pk)
         if not e:
             return Response({'message': 'Not found'}, status=404)
-        month = e.spent_at.strftime('%Y-%m')
+        month = e.business_date.strftime('%Y-%m')
         if MonthClosing.objects.filter(hotel_id=e.hotel_id, month=month).exists():
             if not request.user.is_admin:
                 return Response({'message': 'Month is closed'}, status=403)
@@ -667,79 +918,6 @@ def closing_data(c):
     }
 
 
-def compute_totals(hotel_id_val, from_date, to_date):
-    """Compute TotalsSnapshot for a date range."""
-    payments = Payment.objects.filter(
-        hotel_id=hotel_id_val,
-        paid_at__date__gte=from_date,
-        paid_at__date__lte=to_date,
-    )
-    expenses = Expense.objects.filter(
-        hotel_id=hotel_id_val,
-        spent_at__date__gte=from_date,
-        spent_at__date__lte=to_date,
-    )
-
-    revenue_by_method = {}
-    for p in payments:
-        key = p.custom_method_label if p.method == 'OTHER' and p.custom_method_label else p.method
-        revenue_by_method[key] = revenue_by_method.get(key, 0) + float(p.amount)
-
-    expenses_by_category = {}
-    for e in expenses:
-        expenses_by_category[e.category] = expenses_by_category.get(e.category, 0) + float(e.amount)
-
-    total_revenue = sum(revenue_by_method.values())
-    total_expenses = sum(expenses_by_category.values())
-    profit = total_revenue - total_expenses
-
-    # Occupancy
-    rooms = Room.objects.filter(hotel_id=hotel_id_val, active=True)
-    days = (to_date - from_date).days + 1
-    available_nights = rooms.count() * days
-
-    stays = Stay.objects.filter(
-        hotel_id=hotel_id_val,
-        status__in=['CHECKED_IN', 'CHECKED_OUT'],
-        check_in_date__date__lte=to_date,
-        check_out_date__date__gte=from_date,
-    )
-    sold_nights = 0
-    for s in stays:
-        ci = max(s.check_in_date.date(), from_date)
-        co = min(s.check_out_date.date(), to_date)
-        sold_nights += max(0, (co - ci).days)
-
-    occupancy_rate = (sold_nights / available_nights * 100) if available_nights > 0 else 0
-    adr = (total_revenue / sold_nights) if sold_nights > 0 else 0
-    revpar = (total_revenue / available_nights) if available_nights > 0 else 0
-
-    withdrawals = Withdrawal.objects.filter(
-        hotel_id=hotel_id_val,
-        withdrawn_at__date__gte=from_date,
-        withdrawn_at__date__lte=to_date,
-    )
-    withdrawals_by_method = {}
-    total_withdrawals = 0
-    for w in withdrawals:
-        withdrawals_by_method[w.method] = withdrawals_by_method.get(w.method, 0) + float(w.amount)
-        total_withdrawals += float(w.amount)
-
-    return {
-        'revenue_by_method': revenue_by_method,
-        'expenses_by_category': expenses_by_category,
-        'profit': profit,
-        'withdrawals_by_method': withdrawals_by_method,
-        'total_withdrawals': total_withdrawals,
-        'occupancy_rate': occupancy_rate,
-        'adr': adr,
-        'revpar': revpar,
-        'sold_nights': sold_nights,
-        'available_nights': available_nights,
-        'total_room_revenue': total_revenue,
-    }
-
-
 class MonthClosingListView(APIView):
     def get(self, request):
         closings = MonthClosing.objects.filter(hotel_id=hotel_id(request)).order_by('-month')
@@ -760,7 +938,7 @@ class ClosePreviousMonthView(APIView):
 
         from_date = last_month.replace(day=1).date()
         to_date = last_month.date()
-        totals = compute_totals(hid, from_date, to_date)
+        totals, _ = report_totals(hid, from_date, to_date)
 
         closing = MonthClosing(
             id=str(uuid.uuid4()),
@@ -769,7 +947,13 @@ class ClosePreviousMonthView(APIView):
             closed_at=datetime.now(timezone.utc),
             totals_json=totals,
         )
-        closing.save()
+        try:
+            with transaction.atomic():
+                closing.save(force_insert=True)
+        except IntegrityError:
+            # двойной клик: второй запрос дождался того же расчёта, а месяц
+            # уже закрыт первым — отдаём его закрытие
+            return Response(closing_data(MonthClosing.objects.get(hotel_id=hid, month=month_str)))
         return Response(closing_data(closing), status=201)
 
 
@@ -787,20 +971,237 @@ class ReopenMonthView(APIView):
 
 # ─── reports ──────────────────────────────────────────────────────────────────
 
+# дольше — уже не отчёт, а выгрузка
+MAX_REPORT_DAYS = 3660
+
+
+def report_range(request, start='from', end='to'):
+    """(from, to) из query-параметров или None, если диапазон некорректен."""
+    try:
+        from_date = datetime.strptime(request.query_params.get(start, ''), '%Y-%m-%d').date()
+        to_date = datetime.strptime(request.query_params.get(end, ''), '%Y-%m-%d').date()
+    except (ValueError, TypeError):
+        return None
+    if from_date > to_date or (to_date - from_date).days >= MAX_REPORT_DAYS:
+        return None
+    return from_date, to_date
+
+
+def report_response(result, source):
+    resp = Response(result)
+    resp['X-Report-Cache'] = source
+    return resp
+
+
+def wants_stale(request):
+    return request.query_params.get('stale') in ('1', 'true')
+
+
 class ReportsView(APIView):
     permission_classes = [IsAdmin]
 
     def get(self, request):
-        from_str = request.query_params.get('from', '')
-        to_str = request.query_params.get('to', '')
+        period = report_range(request)
+        if period is None:
+            return Response({'message': 'Invalid date range'}, status=400)
+        return report_response(*report_totals(hotel_id(request), *period, stale=wants_stale(request)))
+
+
+class ReportCubeView(APIView):
+    """Разрезы выручки, ночей, ADR и RevPAR: ?dims=room_type,method&compare=prev_period."""
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        period = report_range(request)
+        if period is None:
+            return Response({'message': 'Invalid date range'}, status=400)
+        try:
+            groupings = parse_cube_dims(request.query_params.get('dims', ''))
+        except ValueError as exc:
+            return Response({'message': str(exc)}, status=400)
+        compare = request.query_params.get('compare') or None
+        if compare is not None and compare not in COMPARE_MODES:
+            return Response({'message': f'Unknown compare mode: {compare}'}, status=400)
+        return report_response(*report_cube(
+            hotel_id(request), *period, groupings, compare=compare, stale=wants_stale(request),
+        ))
+
+
+class ReportSeriesView(APIView):
+    """Ряды по дням/неделям/месяцам местного времени: ?bucket=week&metrics=revenue,adr."""
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        period = report_range(request)
+        if period is None:
+            return Response({'message': 'Invalid date range'}, status=400)
+        bucket = request.query_params.get('bucket') or 'day'
+        if bucket not in BUCKETS:
+            return Response({'message': f'Unknown bucket: {bucket}'}, status=400)
+        try:
+            metrics = parse_series_metrics(request.query_params.get('metrics', ''))
+        except ValueError as exc:
+            return Response({'message': str(exc)}, status=400)
+        return report_response(*report_series(
+            hotel_id(request), *period, bucket, metrics, stale=wants_stale(request),
+        ))
+
+
+class DashboardView(APIView):
+    """Сегодня отеля для стойки: цифры дня, заезды, выезды, проживающие, номера."""
+
+    def get(self, request):
+        return report_response(*report_dashboard(hotel_id(request), stale=wants_stale(request)))
+
+
+class ReportPaceView(APIView):
+    """Темп продаж ночей периода по ежесуточным снимкам: ?target_from=&target_to=."""
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        period = report_range(request, 'target_from', 'target_to')
+        if period is None:
+            return Response({'message': 'Invalid date range'}, status=400)
+        return Response(pace(hotel_id(request), *period))
+
+
+class ForecastView(APIView):
+    """На книгах по ночам от сегодня: ?days=90."""
+
+    def get(self, request):
         try:
-            from_date = datetime.strptime(from_str, '%Y-%m-%d').date()
-            to_date = datetime.strptime(to_str, '%Y-%m-%d').date()
-        except (ValueError, TypeError):
+            days = int(request.query_params.get('days') or DEFAULT_FORECAST_DAYS)
+        except ValueError:
+            days = 0
+        if not 1 <= days <= MAX_FORECAST_DAYS:
+            return Response({'message': f'days must be between 1 and {MAX_FORECAST_DAYS}'}, status=400)
+        return report_response(*report_forecast(hotel_id(request), days, stale=wants_stale(request)))
+
+
+class PortfolioView(APIView):
+    """
+    compute_totals по всем отелям развёртывания (или ?hotels=id,id) за
+    ?from=&to= одним сгруппированным запросом — только операторам. Без пула
+    процессов: воркер gunicorn с потоками не форкаем, длинные периоды
+    параллельно считает команда portfolio_report.
+    """
+    permission_classes = [IsOperator]
+
+    def get(self, request):
+        period = report_range(request)
+        if period is None:
             return Response({'message': 'Invalid date range'}, status=400)
+        hotels = Hotel.objects.order_by('name')
+        requested = [h for h in request.query_params.get('hotels', '').split(',') if h]
+        if requested:
+            hotels = hotels.filter(id__in=requested)
+        names = dict(hotels.values_list('id', 'name'))
+        missing = set(requested) - set(names)
+        if missing:
+            return Response({'message': 'Unknown hotels', 'hotels': sorted(missing)}, status=404)
+        by_hotel, total = portfolio(list(names), *period)
+        return Response({
+            'from': f'{period[0]:%Y-%m-%d}', 'to': f'{period[1]:%Y-%m-%d}',
+            'hotels': [{'id': hid, 'name': name, **by_hotel[hid]} for hid, name in names.items()],
+            'total': total,
+        })
+
+
+GUEST_STATS_SORT = {
+    'revenue': 'revenue DESC', 'nights': 'nights DESC', 'stays': 'stays DESC',
+    'last_stay': 'last_stay DESC',
+}
+GUEST_STATS_LIMIT = 10
+
+# по гостю: заезды (кроме отменённых) с заездом в периоде и все платежи по ним.
+# Старые заезды без guestId относим к гостю по имени (и телефону, если он
+# записан в заезде) — как их сопоставлял фронтенд до появления guestId.
+GUEST_STATS_CTE = """
+    WITH st AS (
+        SELECT s.id, COALESCE(s."guestId", legacy.id) AS guest_id, s."checkInDate" AS check_in,
+               GREATEST(s."checkOutDate"::date - s."checkInDate"::date, 0) AS nights
+        FROM "Stay" s
+        LEFT JOIN LATERAL (
+            SELECT g.id FROM api_guest g
+            WHERE s."guestId" IS NULL AND g.hotel_id = s."hotelId" AND g.name = s."guestName"
+              AND (COALESCE(s."guestPhone", '') = ''
+                   OR g.phone_digits = regexp_replace(s."guestPhone", '\\D', '', 'g'))
+            ORDER BY g.created_at, g.id
+            LIMIT 1
+        ) legacy ON true
+        WHERE s."hotelId" = %(hotel)s AND s.status <> 'CANCELLED'
+          AND COALESCE(s."guestId", legacy.id) IS NOT NULL
+          AND s."checkInDate" >= %(start)s AND s."checkInDate" < %(end)s
+    ), pay AS (
+        SELECT p."stayId" AS stay_id, SUM(p.amount) AS amount
+        FROM "Payment" p JOIN st ON st.id = p."stayId"
+        GROUP BY p."stayId"
+    ), per_guest AS (
+        SELECT st.guest_id, count(*) AS stays, SUM(st.nights) AS nights,
+               COALESCE(SUM(pay.amount), 0) AS revenue, MAX(st.check_in) AS last_stay
+        FROM st LEFT JOIN pay ON pay.stay_id = st.id
+        GROUP BY st.guest_id
+    )
+"""
 
-        totals = compute_totals(hotel_id(request), from_date, to_date)
-        return Response(totals)
+
+class GuestStatsView(APIView):
+    """Аналитика клиентов: KPI по всем активным гостям + страница топа."""
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        qp = request.query_params
+        start = parse_date(qp.get('from')) or datetime(1970, 1, 1, tzinfo=timezone.utc)
+        end = parse_date(qp.get('to'))
+        end = end + timedelta(days=1) if end else datetime(9999, 1, 1, tzinfo=timezone.utc)
+        sort = qp.get('sort', 'revenue')
+        if sort not in GUEST_STATS_SORT:
+            return Response({'message': f'sort must be one of: {", ".join(GUEST_STATS_SORT)}'}, status=400)
+        limit = min(max(parse_int(qp.get('limit'), 'limit', GUEST_STATS_LIMIT), 1), 500)
+        offset = max(parse_int(qp.get('offset'), 'offset'), 0)
+        hid = hotel_id(request)
+        params = {'hotel': hid, 'start': start, 'end': end, 'limit': limit, 'offset': offset}
+
+        summary = fetch_dicts(GUEST_STATS_CTE + """
+            SELECT count(*) AS active_guests,
+                   count(*) FILTER (WHERE stays >= 2) AS returning_guests,
+                   COALESCE(AVG(revenue), 0) AS avg_revenue,
+                   COALESCE(AVG(stays), 0) AS avg_stays,
+                   COALESCE(AVG(nights), 0) AS avg_nights,
+                   count(*) FILTER (WHERE stays = 1) AS freq_1,
+                   count(*) FILTER (WHERE stays = 2) AS freq_2,
+                   count(*) FILTER (WHERE stays BETWEEN 3 AND 5) AS freq_3_5,
+                   count(*) FILTER (WHERE stays >= 6) AS freq_6
+            FROM per_guest
+        """, params)[0]
+        rows = fetch_dicts(GUEST_STATS_CTE + f"""
+            SELECT pg.*, g.name, g.phone
+            FROM per_guest pg JOIN api_guest g ON g.id = pg.guest_id
+            ORDER BY {GUEST_STATS_SORT[sort]}, pg.guest_id
+            LIMIT %(limit)s OFFSET %(offset)s
+        """, params)
+
+        active = summary['active_guests']
+        return Response({
+            'total_guests': Guest.objects.filter(hotel_id=hid).count(),
+            'active_guests': active,
+            'returning_guests': summary['returning_guests'],
+            'returning_ratio': round(summary['returning_guests'] / active, 4) if active else 0,
+            'avg_revenue': to_float(summary['avg_revenue']),
+            'avg_stays': round(float(summary['avg_stays']), 2),
+            'avg_nights': round(float(summary['avg_nights']), 2),
+            'frequency': {
+                '1': summary['freq_1'], '2': summary['freq_2'],
+                '3-5': summary['freq_3_5'], '6+': summary['freq_6'],
+            },
+            'sort': sort, 'limit': limit, 'offset': offset,
+            'guests': [{
+                'id': r['guest_id'], 'name': r['name'], 'phone': r['phone'],
+                'stays': r['stays'], 'nights': r['nights'],
+                'revenue': to_float(r['revenue']),
+                'last_stay': fmt_date(r['last_stay']),
+            } for r in rows],
+        })
 
 
 # ─── users (admin only) ───────────────────────────────────────────────────────
@@ -876,6 +1277,7 @@ class UserRoleView(APIView):
             UserRole(id=str(uuid.uuid4()), user_id=pk, role=role).save()
         # роль в JWT-клейме устарела — отзываем сессии, юзер перелогинится с новой
         User.objects.filter(id=pk).update(token_version=F('token_version') + 1)
+        cache.invalidate_on_commit(hotel_id(request), 'auth')
         try:
             user = User.objects.get(id=pk)
         except User.DoesNotExist:
@@ -907,8 +1309,11 @@ class UserDetailView(APIView):
                 return Response({'message': 'username required'}, status=400)
             if User.objects.filter(email__iexact=username).exclude(id=pk).exists():
                 return Response({'message': 'Username already exists'}, status=409)
-            user.email = username
-            user.save(update_fields=['email'])
+            if username != user.email:
+                user.email = username
+                user.token_version += 1  # в выданных JWT — старое имя
+                user.save(update_fields=['email', 'token_version'])
+                cache.invalidate_on_commit(hotel_id(request), 'auth')
 
         if 'password' in d:
             password = d['password'] or ''
@@ -917,6 +1322,7 @@ class UserDetailView(APIView):
             user.password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
             user.token_version += 1  # отозвать старые сессии
             user.save(update_fields=['password_hash', 'token_version'])
+            cache.invalidate_on_commit(hotel_id(request), 'auth')
 
         role = get_role(pk)
         oldest = Profile.objects.filter(hotel_id=hotel_id(request)).order_by('created_at').first()
@@ -936,6 +1342,7 @@ class UserDetailView(APIView):
             User.objects.filter(id=pk).delete()
         except Exception:
             pass
+        cache.invalidate_on_commit(hotel_id(request), 'auth')
         return Response(status=204)
 
 
@@ -948,10 +1355,10 @@ class CustomPaymentMethodListCreateView(APIView):
         return super().get_permissions()
 
     def get(self, request):
-        methods = CustomPaymentMethod.objects.filter(hotel_id=hotel_id(request)).order_by('name')
-        return Response([{
+        hid = hotel_id(request)
+        return Response(cache.cached(hid, 'payment_methods', lambda: [{
             'id': m.id, 'name': m.name, 'created_at': fmt_dt(m.created_at),
-        } for m in methods])
+        } for m in CustomPaymentMethod.objects.filter(hotel_id=hid).order_by('name')]))
 
     def post(self, request):
         name = (request.data.get('name') or '').strip()
@@ -986,8 +1393,8 @@ class CustomPaymentMethodDeleteView(APIView):
 
 def transfer_data(t):
     return {
-        'id': t.id, 'hotel_id': t.hotel_id,
-        'transferred_at': fmt_dt(t.transferred_at),
+        'id': t.id, 'version': t.version, 'hotel_id': t.hotel_id,
+        'transferred_at': fmt_dt(t.transferred_at), 'business_date': fmt_date(t.business_date),
         'from_method': t.from_method,
         'to_method': t.to_method,
         'amount': to_float(t.amount),
@@ -1027,30 +1434,36 @@ class TransferListCreateView(APIView):
 
 
 class TransferDetailView(APIView):
-    def _get(self, request, pk):
+    def _get(self, request, pk, lock=False):
+        qs = Transfer.objects.select_for_update() if lock else Transfer.objects
         try:
-            return Transfer.objects.get(id=pk, hotel_id=hotel_id(request))
+            return qs.get(id=pk, hotel_id=hotel_id(request))
         except Transfer.DoesNotExist:
             return None
 
+    @transaction.atomic
     def patch(self, request, pk):
-        t = self._get(request, pk)
+        t = self._get(request, pk, lock=True)
         if not t:
             return Response({'message': 'Not found'}, status=404)
+        conflict = check_version(request, t)
+        if conflict:
+            return conflict
+        before = snapshot(t)
         d = request.data
         if 'transferred_at' in d: t.transferred_at = parse_date(d['transferred_at'])
         if 'from_method' in d:    t.from_method = d['from_method']
         if 'to_method' in d:      t.to_method = d['to_method']
         if 'amount' in d:         t.amount = parse_decimal(d['amount'], 'amount')
         if 'comment' in d:        t.comment = d['comment'] or None
-        t.save()
-        return Response(transfer_data(t))
+        save_changed(t, before)
+        return with_etag(Response(transfer_data(t)), t)
 
     def delete(self, request, pk):
         t = self._get(request, pk)
         if not t:
             return Response({'message': 'Not found'}, status=404)
-        month = t.transferred_at.strftime('%Y-%m')
+        month = t.business_date.strftime('%Y-%m')
         if MonthClosing.objects.filter(hotel_id=t.hotel_id, month=month).exists():
             if not request.user.is_admin:
                 return Response({'message': 'Month is closed'}, status=403)
@@ -1060,16 +1473,18 @@ class TransferDetailView(APIView):
 
 # ─── withdrawals ──────────────────────────────────────────────────────────────
 
-def withdrawal_data(w):
+def withdrawal_data(w, names=None):
     created_by_name = None
-    if w.created_by_id:
+    if names is not None:
+        created_by_name = names.get(w.created_by_id)
+    elif w.created_by_id:
         try:
             created_by_name = Profile.objects.get(id=w.created_by_id).full_name
         except Profile.DoesNotExist:
             pass
     return {
-        'id': w.id, 'hotel_id': w.hotel_id,
-        'withdrawn_at': fmt_dt(w.withdrawn_at),
+        'id': w.id, 'hotel_id': w.hotel_id, 'version': w.version,
+        'withdrawn_at': fmt_dt(w.withdrawn_at), 'business_date': fmt_date(w.business_date),
         'method': w.method,
         'amount': to_float(w.amount),
         'comment': w.comment,
@@ -1114,29 +1529,35 @@ class WithdrawalDetailView(APIView):
     def get_permissions(self):
         return [IsAdmin()]
 
-    def _get(self, request, pk):
+    def _get(self, request, pk, lock=False):
+        qs = Withdrawal.objects.select_for_update() if lock else Withdrawal.objects
         try:
-            return Withdrawal.objects.get(id=pk, hotel_id=hotel_id(request))
+            return qs.get(id=pk, hotel_id=hotel_id(request))
         except Withdrawal.DoesNotExist:
             return None
 
+    @transaction.atomic
     def patch(self, request, pk):
-        w = self._get(request, pk)
+        w = self._get(request, pk, lock=True)
         if not w:
             return Response({'message': 'Not found'}, status=404)
+        conflict = check_version(request, w)
+        if conflict:
+            return conflict
+        before = snapshot(w)
         d = request.data
         if 'withdrawn_at' in d: w.withdrawn_at = parse_date(d['withdrawn_at'])
         if 'method' in d:       w.method = d['method']
         if 'amount' in d:       w.amount = parse_decimal(d['amount'], 'amount')
         if 'comment' in d:      w.comment = d['comment'] or None
-        w.save()
-        return Response(withdrawal_data(w))
+        save_changed(w, before)
+        return with_etag(Response(withdrawal_data(w)), w)
 
     def delete(self, request, pk):
         w = self._get(request, pk)
         if not w:
             return Response({'message': 'Not found'}, status=404)
-        month = w.withdrawn_at.strftime('%Y-%m')
+        month = w.business_date.strftime('%Y-%m')
         if MonthClosing.objects.filter(hotel_id=w.hotel_id, month=month).exists():
             if not request.user.is_admin:
                 return Response({'message': 'Month is closed'}, status=403)
@@ -1148,12 +1569,18 @@ class WithdrawalDetailView(APIView):
 
 def guest_data(g):
     return {
-        'id': g.id, 'hotel_id': g.hotel_id,
+        'id': g.id, 'version': g.version, 'hotel_id': g.hotel_id,
         'name': g.name, 'phone': g.phone, 'notes': g.notes,
         'created_at': fmt_dt(g.created_at),
     }
 
 
+def phone_taken(g):
+    other = (Guest.objects.filter(hotel_id=g.hotel_id, phone_digits=normalize_phone(g.phone))
+             .exclude(id=g.id).values_list('id', flat=True).first())
+    return Response({'message': 'Guest with this phone already exists', 'guest_id': other}, status=409)
+
+
 class GuestListCreateView(APIView):
     def get(self, request):
         q = request.query_params.get('q', '').strip()
@@ -1174,27 +1601,110 @@ class GuestListCreateView(APIView):
             phone=(d.get('phone') or '').strip(),
             notes=(d.get('notes') or '').strip(),
         )
-        g.save()
+        try:
+            with transaction.atomic():
+                g.save()
+        except IntegrityError:
+            return phone_taken(g)
         return Response(guest_data(g), status=201)
 
 
+GUEST_SEARCH_LIMIT = 20
+# сколько лучших по похожести кандидатов доранжировать по давности заезда
+GUEST_SEARCH_CANDIDATES = 200
+# национальная часть номера: '+998 90 123-45-67' и '90 123 45 67' — один гость
+PHONE_SUFFIX_DIGITS = 9
+PHONE_QUERY_RE = re.compile(r'[\d\s+()\-]+')
+
+GUEST_SEARCH_SQL = """
+    WITH c AS (
+        SELECT g.*, {score} AS score
+        FROM api_guest g
+        WHERE g.hotel_id = %(hotel)s AND {match}
+        ORDER BY score DESC
+        LIMIT %(candidates)s
+    )
+    SELECT c.id, c.hotel_id, c.name, c.phone, c.notes, c.created_at, c.version,
+           c.score, ls.last_stay
+    FROM c
+    LEFT JOIN LATERAL (
+        SELECT max(s."checkInDate") AS last_stay FROM "Stay" s WHERE s."guestId" = c.id
+    ) ls ON true
+    ORDER BY c.score DESC, ls.last_stay DESC NULLS LAST, c.name
+    LIMIT %(limit)s
+"""
+
+
+def like_escape(val):
+    return val.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_guests(hid, q, limit):
+    """
+    Автодополнение по имени или телефону (caller ID). Оба условия идут по
+    GIN-индексам pg_trgm, так что время не зависит от размера базы гостей.
+    """
+    digits = normalize_phone(q)
+    params = {'hotel': hid, 'candidates': GUEST_SEARCH_CANDIDATES, 'limit': limit}
+    if len(digits) >= 3 and PHONE_QUERY_RE.fullmatch(q):
+        # номер с кодом страны находит гостя, записанного без него, и наоборот
+        params['digits'] = digits
+        params['like'] = '%' + like_escape(digits[-PHONE_SUFFIX_DIGITS:]) + '%'
+        score = ('CASE WHEN g.phone_digits = %(digits)s THEN 2 '
+                 'ELSE similarity(g.phone_digits, %(digits)s) END')
+        match = 'g.phone_digits LIKE %(like)s'
+    else:
+        params['q'] = q
+        params['like'] = '%' + like_escape(q) + '%'
+        score = 'word_similarity(%(q)s, g.name)'
+        match = '(g.name ILIKE %(like)s OR %(q)s <%% g.name)'
+    return fetch_dicts(GUEST_SEARCH_SQL.format(score=score, match=match), params)
+
+
+class GuestSearchView(APIView):
+    def get(self, request):
+        q = request.query_params.get('q', '').strip()
+        limit = min(max(parse_int(request.query_params.get('limit'), 'limit', GUEST_SEARCH_LIMIT), 1), 100)
+        if not q:
+            return Response([])
+        out = []
+        for row in search_guests(hotel_id(request), q, limit):
+            g = Guest(**{k: row[k] for k in ('id', 'hotel_id', 'name', 'phone', 'notes', 'created_at', 'version')})
+            out.append({
+                **guest_data(g),
+                'score': round(float(row['score']), 3),
+                'last_stay': fmt_dt(row['last_stay']),
+            })
+        return Response(out)
+
+
 class GuestDetailView(APIView):
-    def _get(self, request, pk):
+    def _get(self, request, pk, lock=False):
+        qs = Guest.objects.select_for_update() if lock else Guest.objects
         try:
-            return Guest.objects.get(id=pk, hotel_id=hotel_id(request))
+            return qs.get(id=pk, hotel_id=hotel_id(request))
         except Guest.DoesNotExist:
             return None
 
+    @transaction.atomic
     def patch(self, request, pk):
-        g = self._get(request, pk)
+        g = self._get(request, pk, lock=True)
         if not g:
             return Response({'message': 'Not found'}, status=404)
+        conflict = check_version(request, g)
+        if conflict:
+            return conflict
+        before = snapshot(g)
         d = request.data
         if 'name' in d:  g.name  = (d['name'] or '').strip()
         if 'phone' in d: g.phone = (d['phone'] or '').strip()
         if 'notes' in d: g.notes = (d['notes'] or '').strip()
-        g.save()
-        return Response(guest_data(g))
+        try:
+            with transaction.atomic():
+                save_changed(g, before)
+        except IntegrityError:
+            return phone_taken(g)
+        return with_etag(Response(guest_data(g)), g)
 
     def delete(self, request, pk):
         g = self._get(request, pk)
@@ -1204,6 +1714,290 @@ class GuestDetailView(APIView):
         return Response(status=204)
 
 
+# ─── csv export ───────────────────────────────────────────────────────────────
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+class EchoBuffer:
+    """csv.writer пишет сюда, а строка сразу уходит в StreamingHttpResponse."""
+
+    def write(self, value):
+        return value
+
+
+def iter_chunks(qs, size=EXPORT_CHUNK_SIZE):
+    """Server-side cursor (iterator) пачками — память не растёт с объёмом выгрузки."""
+    chunk = []
+    for obj in qs.iterator(chunk_size=size):
+        chunk.append(obj)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def export_rows(kind, qs, hid):
+    """Сериализованные строки выгрузки тем же *_data, что и в JSON API."""
+    if kind in ('expenses', 'withdrawals'):
+        names = dict(Profile.objects.filter(hotel_id=hid).values_list('id', 'full_name'))
+    for chunk in iter_chunks(qs):
+        if kind == 'stays':
+            guest_ids = {s.guest_id for s in chunk if s.guest_id}
+            guests_map = {g.id: g for g in Guest.objects.filter(hotel_id=hid, id__in=guest_ids)}
+            yield from (stay_data(s, guests_map.get(s.guest_id)) for s in chunk)
+        elif kind == 'expenses':
+            yield from (expense_data(e, names) for e in chunk)
+        elif kind == 'withdrawals':
+            yield from (withdrawal_data(w, names) for w in chunk)
+        else:
+            yield from (EXPORTS[kind][2](obj) for obj in chunk)
+
+
+EXPORTS = {
+    # kind: (модель, поле даты для ?from=&to=, сериализатор)
+    'payments':    (Payment, 'paid_at', payment_data),
+    'expenses':    (Expense, 'spent_at', expense_data),
+    'transfers':   (Transfer, 'transferred_at', transfer_data),
+    'withdrawals': (Withdrawal, 'withdrawn_at', withdrawal_data),
+    'stays':       (Stay, 'check_in_date', stay_data),
+}
+
+
+class ExportView(APIView):
+    """CSV-выгрузка истории потоком: колонки — ровно ключи JSON-сериализатора."""
+    permission_classes = [IsAdmin]
+
+    def get(self, request, kind):
+        if kind not in EXPORTS:
+            return Response({'message': 'Unknown export'}, status=404)
+        model, date_field, serializer = EXPORTS[kind]
+        hid = hotel_id(request)
+
+        qs = model.objects.filter(hotel_id=hid)
+        try:
+            from_str = request.query_params.get('from')
+            to_str = request.query_params.get('to')
+            if model in BUSINESS_DATE_SOURCES:
+                # операции — по местной дате отеля, как в отчётах
+                if from_str:
+                    qs = qs.filter(business_date__gte=datetime.strptime(from_str, '%Y-%m-%d').date())
+                if to_str:
+                    qs = qs.filter(business_date__lte=datetime.strptime(to_str, '%Y-%m-%d').date())
+            elif model is Stay:
+                # даты заезда — календарные дни (полночь UTC), как в stay_data/fmt_date
+                if from_str:
+                    qs = qs.filter(**{f'{date_field}__date__gte': datetime.strptime(from_str, '%Y-%m-%d').date()})
+                if to_str:
+                    qs = qs.filter(**{f'{date_field}__date__lte': datetime.strptime(to_str, '%Y-%m-%d').date()})
+            else:
+                # границы — местная полночь отеля, а не UTC
+                zone = hotel_zone(hid)
+                if from_str:
+                    start = datetime.strptime(from_str, '%Y-%m-%d').replace(tzinfo=zone)
+                    qs = qs.filter(**{f'{date_field}__gte': start})
+                if to_str:
+                    end = datetime.strptime(to_str, '%Y-%m-%d').replace(tzinfo=zone) + timedelta(days=1)
+                    qs = qs.filter(**{f'{date_field}__lt': end})
+        except ValueError:
+            return Response({'message': 'Invalid date range'}, status=400)
+        qs = qs.order_by(date_field, 'id')
+
+        columns = list(serializer(model()).keys())
+
+        def stream():
+            writer = csv.writer(EchoBuffer())
+            yield '﻿'  # BOM: Excel иначе ломает кириллицу
+            yield writer.writerow(columns)
+            for row in export_rows(kind, qs, hid):
+                yield writer.writerow([row[c] for c in columns])
+
+        resp = StreamingHttpResponse(stream(), content_type='text/csv; charset=utf-8')
+        resp['Content-Disposition'] = f'attachment; filename="{kind}.csv"'
+        return resp
+
+
+# ─── bulk import ──────────────────────────────────────────────────────────────
+
+class ImportView(APIView):
+    """Импорт истории в свой отель: multipart-файлы guests/stays/payments/expenses."""
+    permission_classes = [IsAdmin]
+
+    def post(self, request):
+        sources = {
+            entity: (request.FILES[entity], detect_format(request.FILES[entity].name))
+            for entity in IMPORT_ENTITIES if entity in request.FILES
+        }
+        if not sources:
+            return Response({'message': 'No files', 'expected': IMPORT_ENTITIES}, status=400)
+        try:
+            result = import_hotel_data(hotel_id(request), sources)
+        except ImportFailed as exc:
+            return Response({'message': 'Import rolled back', 'errors': exc.errors}, status=400)
+        return Response(result, status=201)
+
+
+# ─── batch ────────────────────────────────────────────────────────────────────
+
+BATCH_RESOURCES = {
+    'rooms':                  (RoomListCreateView, RoomDetailView),
+    'stays':                  (StayListCreateView, StayDetailView),
+    'payments':               (PaymentListCreateView, PaymentDetailView),
+    'expenses':               (ExpenseListCreateView, ExpenseDetailView),
+    'transfers':              (TransferListCreateView, TransferDetailView),
+    'withdrawals':            (WithdrawalListCreateView, WithdrawalDetailView),
+    'guests':                 (GuestListCreateView, GuestDetailView),
+    'custom-payment-methods': (CustomPaymentMethodListCreateView, CustomPaymentMethodDeleteView),
+}
+BATCH_METHODS = {'create': 'POST', 'update': 'PATCH', 'delete': 'DELETE'}
+BATCH_MAX_OPERATIONS = 100
+
+
+class BatchRequest:
+    """Подзапрос батча: ровно то, что читают вьюхи (data, user, method, headers)."""
+
+    def __init__(self, request, method, data, headers=None):
+        self.method = method
+        self.data = data
+        self.user = request.user
+        self.auth = request.auth
+        self.COOKIES = request.COOKIES
+        self.query_params = QueryDict()
+        # как request.headers у Django: 'if-match' и 'If-Match' — один заголовок
+        self.headers = CaseInsensitiveMapping(headers or {})
+
+
+class BatchFailed(Exception):
+    def __init__(self, index, status_code, data):
+        super().__init__(index)
+        self.index = index
+        self.status_code = status_code
+        self.data = data
+
+
+# поля, в которые подставляются '$ref'; в остальных (comment, guest_name…)
+# строка с '$' — обычный текст
+BATCH_REF_KEYS = frozenset({'id', 'room_id', 'stay_id', 'guest_id'})
+
+
+def resolve_ref(val, created):
+    """'$ref' → id, созданный ранее в этом же батче."""
+    if isinstance(val, str) and val.startswith('$') and val[1:] in created:
+        return created[val[1:]]
+    return val
+
+
+def resolve_refs(val, created):
+    """resolve_ref по полям из BATCH_REF_KEYS; рекурсивно по dict/list."""
+    if isinstance(val, dict):
+        return {k: resolve_ref(v, created) if k in BATCH_REF_KEYS else resolve_refs(v, created)
+                for k, v in val.items()}
+    if isinstance(val, list):
+        return [resolve_refs(v, created) for v in val]
+    return val
+
+
+def run_batch_operation(request, index, op, created):
+    """Одна операция батча через обычную вьюху — та же валидация и права."""
+    action = op.get('op')
+    resource = op.get('resource')
+    if action not in BATCH_METHODS or resource not in BATCH_RESOURCES:
+        raise BatchFailed(index, 400, {'message': 'Unknown op or resource'})
+    list_view, detail_view = BATCH_RESOURCES[resource]
+    method = BATCH_METHODS[action]
+    view_cls = list_view if action == 'create' else detail_view
+    if not hasattr(view_cls, method.lower()):
+        raise BatchFailed(index, 405, {'message': f'{action} is not supported for {resource}'})
+
+    kwargs = {}
+    if action != 'create':
+        pk = resolve_ref(op.get('id'), created)
+        if not pk:
+            raise BatchFailed(index, 400, {'message': 'id required'})
+        kwargs['pk'] = pk
+    data = resolve_refs(op.get('data') or {}, created)
+    if not isinstance(data, dict):
+        raise BatchFailed(index, 400, {'message': 'data must be an object'})
+    headers = op.get('headers') or {}
+    if not isinstance(headers, dict):
+        raise BatchFailed(index, 400, {'message': 'headers must be an object'})
+    headers = {str(k): str(v) for k, v in headers.items()}
+    if op.get('if_match') is not None:
+        headers['If-Match'] = str(op['if_match'])
+
+    sub = BatchRequest(request, method, data, headers)
+    view = view_cls()
+    view.request, view.args, view.kwargs, view.format_kwarg = sub, (), kwargs, None
+    for permission in view.get_permissions():
+        if not permission.has_permission(sub, view):
+            raise BatchFailed(index, 403, {'message': 'Forbidden'})
+    try:
+        resp = getattr(view, method.lower())(sub, **kwargs)
+    except APIException as exc:
+        raise BatchFailed(index, exc.status_code, exc.detail)
+    if resp.status_code >= 400:
+        raise BatchFailed(index, resp.status_code, resp.data)
+
+    if action == 'create' and op.get('ref') and isinstance(resp.data, dict):
+        created[op['ref']] = resp.data.get('id')
+    return {'status': resp.status_code, 'data': resp.data}
+
+
+class BatchView(APIView):
+    """Упорядоченный список create/update/delete одной транзакцией: всё или ничего."""
+
+    def post(self, request):
+        ops = request.data.get('operations') if isinstance(request.data, dict) else None
+        if not isinstance(ops, list) or not ops:
+            return Response({'message': 'operations must be a non-empty list'}, status=400)
+        if len(ops) > BATCH_MAX_OPERATIONS:
+            return Response({'message': f'At most {BATCH_MAX_OPERATIONS} operations per batch'}, status=400)
+
+        created, results = {}, []
+        try:
+            # уведомления — после коммита и сводкой, а не сообщением на каждую операцию
+            with signals.deferred(), transaction.atomic():
+                for i, op in enumerate(ops):
+                    if not isinstance(op, dict):
+                        raise BatchFailed(i, 400, {'message': 'operation must be an object'})
+                    results.append(run_batch_operation(request, i, op, created))
+        except BatchFailed as exc:
+            return Response({
+                'message': 'Batch rolled back',
+                'failed_index': exc.index,
+                'error': exc.data,
+            }, status=exc.status_code)
+        return Response({'results': results})
+
+
+# ─── change feed ──────────────────────────────────────────────────────────────
+
+class EventsView(APIView):
+    """
+    SSE-лента изменений отеля. Возобновление — заголовок Last-Event-ID
+    (EventSource шлёт его сам) или ?last_event_id= при первом подключении.
+    """
+
+    def get(self, request):
+        last = request.headers.get('Last-Event-ID') or request.query_params.get('last_event_id')
+        last_id = parse_int(last, 'last_event_id') if last else None
+        resp = StreamingHttpResponse(events.stream(hotel_id(request), last_id), content_type='text/event-stream')
+        resp['Cache-Control'] = 'no-cache'
+        resp['X-Accel-Buffering'] = 'no'   # nginx не должен копить кадры
+        return resp
+
+
+# ─── cache stats ──────────────────────────────────────────────────────────────
+
+class CacheStatsView(APIView):
+    """Попадания в кэш справочников этого воркера с момента запуска."""
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        return Response(cache.stats())
+
+
 # ─── health ───────────────────────────────────────────────────────────────────
 
 class HealthView(APIView):
@@ -67,7 +67,7 @@ After=network.target postgresql.service
 Type=simple
 User=root
 WorkingDirectory=${DEST}/backend
-ExecStart=${DEST}/backend/venv/bin/gunicorn hotel_crm.wsgi:application --bind 0.0.0.0:4000 --workers 3 --timeout 60
+ExecStart=${DEST}/backend/venv/bin/gunicorn hotel_crm.wsgi:application --bind 0.0.0.0:4000 --workers 3 --threads 8 --timeout 60
 Restart=always
 RestartSec=5
 StandardOutput=journal
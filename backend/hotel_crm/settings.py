@@ -1,4 +1,5 @@
 import os
+import tempfile
 from datetime import timedelta
 from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
@@ -82,3 +83,17 @@ MIGRATION_MODULES = {
 }
 
 TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN', '')
+
+# общий кэш воркеров (api/cache.py): SQLite-файл + LRU в каждом процессе
+CACHE_PATH = os.environ.get('CACHE_PATH', os.path.join(tempfile.gettempdir(), 'hotel_crm_cache.sqlite3'))
+CACHE_L1_SIZE = int(os.environ.get('CACHE_L1_SIZE', 2000))
+# LISTEN/NOTIFY-слушатель в каждом воркере (api/bus.py); без него L1 сверяется с SQLite
+CACHE_BUS = os.environ.get('CACHE_BUS', 'True') == 'True'
+
+# отчёты через колоночный движок в памяти (api/analytics.py), нужен numpy
+ANALYTICS_ENGINE = os.environ.get('ANALYTICS_ENGINE', 'False') == 'True'
+
+# сколько дней хранить ленту изменений для GET /events (чистит send_daily_report)
+EVENTS_RETENTION_DAYS = int(os.environ.get('EVENTS_RETENTION_DAYS', 7))
+# живых SSE-стримов на процесс (из --threads 8): остальным потокам — обычные запросы
+EVENTS_MAX_STREAMS = int(os.environ.get('EVENTS_MAX_STREAMS', 4))
@@ -1,4 +1,4 @@
-import { useMemo } from "react";
+import { useEffect, useMemo, useState } from "react";
 import { useLanguage } from "@/contexts/LanguageContext";
 import { useData } from "@/contexts/DataContext";
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
@@ -7,7 +7,9 @@ import {
   BarChart, Bar, AreaChart, Area, PieChart, Pie, Cell,
   XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer,
 } from "recharts";
-import { formatCurrency, getNights, getMonthKey, getMonthRange, shiftDateStr, getTodayInTimeZone } from "@/lib/format";
+import { formatCurrency, getMonthKey, getMonthRange, shiftDateStr, getTodayInTimeZone } from "@/lib/format";
+import { apiFetch } from "@/lib/api";
+import type { GuestStats, GuestStatsRow } from "@/types";
 import { Users, TrendingUp, Star, Repeat2, CalendarDays, Wallet } from "lucide-react";
 
 const GOLD   = "hsl(38, 72%, 55%)";
@@ -24,82 +26,32 @@ const GuestReports = () => {
   const locale = language === "uz" ? "uz-UZ" : "ru-RU";
   const todayStr = getTodayInTimeZone(hotel.timezone);
 
-  // ── Build per-guest stats ──────────────────────────────────────────────────
-  const guestStats = useMemo(() => {
-    const map: Record<string, {
-      id: string; name: string; phone: string;
-      stayCount: number; nights: number; revenue: number; lastStay: string;
-    }> = {};
-
-    for (const g of guests) {
-      map[g.id] = { id: g.id, name: g.name, phone: g.phone, stayCount: 0, nights: 0, revenue: 0, lastStay: "" };
-    }
-
-    // Link stays to guests (by guest_id first, then name fallback for old stays)
-    const resolveGuestId = (stay: typeof stays[0]): string | null => {
-      if (stay.guest_id && map[stay.guest_id]) return stay.guest_id;
-      const matched = guests.find(
-        (g) => g.name === stay.guest_name && (!stay.guest_phone || g.phone === stay.guest_phone)
-      );
-      return matched?.id ?? null;
-    };
-
-    for (const stay of stays) {
-      if (stay.status === "CANCELLED") continue;
-      const gid = resolveGuestId(stay);
-      if (!gid) continue;
-      const nights = getNights(stay.check_in_date, stay.check_out_date);
-      map[gid].stayCount++;
-      map[gid].nights += nights;
-      if (!map[gid].lastStay || stay.check_in_date > map[gid].lastStay) {
-        map[gid].lastStay = stay.check_in_date;
-      }
-    }
-
-    const stayIdToGuestId: Record<string, string> = {};
-    for (const stay of stays) {
-      if (stay.status === "CANCELLED") continue;
-      const gid = resolveGuestId(stay);
-      if (gid) stayIdToGuestId[stay.id] = gid;
-    }
-
-    for (const p of payments) {
-      const gid = stayIdToGuestId[p.stay_id];
-      if (gid && map[gid]) map[gid].revenue += p.amount;
-    }
-
-    return Object.values(map).filter((g) => g.stayCount > 0 || g.revenue > 0);
+  // ── Per-guest stats are aggregated on the server (GET /guest-stats) ──────────
+  const [tops, setTops] = useState<Record<GuestStats["sort"], GuestStats> | null>(null);
+  useEffect(() => {
+    let active = true;
+    const sorts = [["revenue", 10], ["nights", 10], ["stays", 10], ["last_stay", 8]] as const;
+    Promise.all(sorts.map(([sort, limit]) => apiFetch<GuestStats>(`/guest-stats?sort=${sort}&limit=${limit}`)))
+      .then(([byRevenue, byNights, byStays, byLastStay]) => {
+        if (active) setTops({ revenue: byRevenue, nights: byNights, stays: byStays, last_stay: byLastStay });
+      })
+      .catch(() => {});
+    return () => { active = false; };
   }, [guests, stays, payments]);
+  const summary = tops?.revenue;
 
   // ── KPI ───────────────────────────────────────────────────────────────────
-  const totalGuests = guests.length;
-  const activeGuests = guestStats.length;
-  const returningGuests = guestStats.filter((g) => g.stayCount >= 2).length;
-  const returningPct = activeGuests > 0 ? (returningGuests / activeGuests) * 100 : 0;
-  const avgRevenue = activeGuests > 0
-    ? guestStats.reduce((s, g) => s + g.revenue, 0) / activeGuests : 0;
-  const avgStays = activeGuests > 0
-    ? guestStats.reduce((s, g) => s + g.stayCount, 0) / activeGuests : 0;
-  const avgNights = activeGuests > 0
-    ? guestStats.reduce((s, g) => s + g.nights, 0) / activeGuests : 0;
-
-  // ── Top by revenue ────────────────────────────────────────────────────────
-  const topByRevenue = useMemo(
-    () => [...guestStats].sort((a, b) => b.revenue - a.revenue).slice(0, 10),
-    [guestStats]
-  );
-
-  // ── Top by nights ─────────────────────────────────────────────────────────
-  const topByNights = useMemo(
-    () => [...guestStats].sort((a, b) => b.nights - a.nights).slice(0, 10),
-    [guestStats]
-  );
+  const totalGuests = summary?.total_guests ?? guests.length;
+  const activeGuests = summary?.active_guests ?? 0;
+  const returningPct = (summary?.returning_ratio ?? 0) * 100;
+  const avgRevenue = summary?.avg_revenue ?? 0;
+  const avgStays = summary?.avg_stays ?? 0;
+  const avgNights = summary?.avg_nights ?? 0;
 
-  // ── Top by stay count ─────────────────────────────────────────────────────
-  const topByStays = useMemo(
-    () => [...guestStats].sort((a, b) => b.stayCount - a.stayCount).slice(0, 10),
-    [guestStats]
-  );
+  // ── Tops ──────────────────────────────────────────────────────────────────
+  const topByRevenue: GuestStatsRow[] = tops?.revenue.guests ?? [];
+  const topByNights: GuestStatsRow[] = tops?.nights.guests ?? [];
+  const topByStays: GuestStatsRow[] = tops?.stays.guests ?? [];
 
   // ── New guests per month (last 6 months) ──────────────────────────────────
   const newGuestsPerMonth = useMemo(() => {
@@ -120,30 +72,21 @@ const GuestReports = () => {
 
   // ── Frequency distribution ────────────────────────────────────────────────
   const frequencyData = useMemo(() => {
-    const dist = { "1 раз": 0, "2 раза": 0, "3–5 раз": 0, "6+ раз": 0 };
-    for (const g of guestStats) {
-      if (g.stayCount === 1) dist["1 раз"]++;
-      else if (g.stayCount === 2) dist["2 раза"]++;
-      else if (g.stayCount <= 5) dist["3–5 раз"]++;
-      else dist["6+ раз"]++;
-    }
+    const freq = summary?.frequency;
     return [
-      { name: "1 раз",   value: dist["1 раз"],   color: MUTED },
-      { name: "2 раза",  value: dist["2 раза"],  color: BLUE },
-      { name: "3–5 раз", value: dist["3–5 раз"], color: GOLD },
-      { name: "6+ раз",  value: dist["6+ раз"],  color: GREEN },
+      { name: "1 раз",   value: freq?.["1"] ?? 0,   color: MUTED },
+      { name: "2 раза",  value: freq?.["2"] ?? 0,   color: BLUE },
+      { name: "3–5 раз", value: freq?.["3-5"] ?? 0, color: GOLD },
+      { name: "6+ раз",  value: freq?.["6+"] ?? 0,  color: GREEN },
     ].filter((d) => d.value > 0);
-  }, [guestStats]);
+  }, [summary]);
 
-  // ── Recent guests (last 10 by last stay) ──────────────────────────────────
-  const recentGuests = useMemo(
-    () => [...guestStats].filter((g) => g.lastStay).sort((a, b) => b.lastStay.localeCompare(a.lastStay)).slice(0, 8),
-    [guestStats]
-  );
+  // ── Recent guests (by last stay) ──────────────────────────────────────────
+  const recentGuests: GuestStatsRow[] = tops?.last_stay.guests ?? [];
 
   const maxRevenue = topByRevenue[0]?.revenue || 1;
   const maxNights  = topByNights[0]?.nights   || 1;
-  const maxStays   = topByStays[0]?.stayCount || 1;
+  const maxStays   = topByStays[0]?.stays || 1;
 
   const ChartTooltip = ({ active, payload, label }: { active?: boolean; payload?: Array<{ name: string; value: number; color: string }>; label?: string }) => {
     if (!active || !payload?.length) return null;
@@ -271,7 +214,7 @@ const GuestReports = () => {
                   </span>
                   <span className="font-medium truncate max-w-[160px]">{g.name}</span>
                   {g.phone && <span className="text-muted-foreground hidden sm:block">{g.phone}</span>}
-                  <Badge variant="outline" className="text-[9px] px-1 py-0">{g.stayCount} раз</Badge>
+                  <Badge variant="outline" className="text-[9px] px-1 py-0">{g.stays} раз</Badge>
                 </span>
                 <span className="font-bold tabular-nums">{formatCurrency(g.revenue, locale, "UZS")}</span>
               </div>
@@ -326,10 +269,10 @@ const GuestReports = () => {
                     <span className="font-medium truncate max-w-[160px]">{g.name}</span>
                     {g.phone && <span className="text-muted-foreground hidden sm:block">{g.phone}</span>}
                   </span>
-                  <span className="font-bold">{g.stayCount}×</span>
+                  <span className="font-bold">{g.stays}×</span>
                 </div>
                 <div className="h-1.5 bg-muted rounded-full overflow-hidden">
-                  <div className="h-full rounded-full" style={{ width: `${(g.stayCount / maxStays) * 100}%`, background: idx === 0 ? GOLD : GREEN }} />
+                  <div className="h-full rounded-full" style={{ width: `${(g.stays / maxStays) * 100}%`, background: idx === 0 ? GOLD : GREEN }} />
                 </div>
               </div>
             ))}
@@ -351,9 +294,9 @@ const GuestReports = () => {
                 {g.phone && <p className="text-xs text-muted-foreground">{g.phone}</p>}
                 <div className="flex items-center justify-between pt-1">
                   <span className="text-[10px] text-muted-foreground">
-                    {g.lastStay ? new Date(g.lastStay + "T12:00:00Z").toLocaleDateString(locale, { day: "numeric", month: "short", year: "numeric" }) : "—"}
+                    {g.last_stay ? new Date(g.last_stay + "T12:00:00Z").toLocaleDateString(locale, { day: "numeric", month: "short", year: "numeric" }) : "—"}
                   </span>
-                  <Badge variant="outline" className="text-[9px] px-1.5">{g.stayCount}×</Badge>
+                  <Badge variant="outline" className="text-[9px] px-1.5">{g.stays}×</Badge>
                 </div>
                 <div className="text-xs font-medium" style={{ color: GOLD }}>
                   {formatCurrency(g.revenue, locale, "UZS")}
@@ -1,4 +1,4 @@
-import { useMemo } from "react";
+import { useEffect, useMemo, useState } from "react";
 import { useLanguage } from "@/contexts/LanguageContext";
 import { useData } from "@/contexts/DataContext";
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
@@ -7,13 +7,31 @@ import { Badge } from "@/components/ui/badge";
 import { Button } from "@/components/ui/button";
 import { LogIn, LogOut, BedDouble, DoorOpen, Plus, TrendingUp, AlertCircle, Wallet } from "lucide-react";
 import { formatCurrency, formatDate, getMonthKey, getMonthRange, getStayTotal, getTodayInTimeZone } from "@/lib/format";
+import { apiFetch } from "@/lib/api";
+import type { DashboardData } from "@/types";
 import { useNavigate } from "react-router-dom";
 
+// several reception terminals poll this; the server answers from its cache until something changes
+const DASHBOARD_POLL_MS = 30_000;
+
 const Dashboard = () => {
   const { t, language } = useLanguage();
   const { rooms, stays, payments, expenses, hotel, loading } = useData();
   const navigate = useNavigate();
-  const todayStr = getTodayInTimeZone(hotel.timezone);
+  const [today, setToday] = useState<DashboardData | null>(null);
+
+  // Today's figures and lists come from one request; refetch on our own edits and on a timer
+  useEffect(() => {
+    let active = true;
+    const load = () => apiFetch<DashboardData>('/dashboard')
+      .then(data => { if (active) setToday(data); })
+      .catch(() => {});
+    load();
+    const timer = window.setInterval(load, DASHBOARD_POLL_MS);
+    return () => { active = false; window.clearInterval(timer); };
+  }, [rooms, stays, payments, expenses]);
+
+  const todayStr = today?.date ?? getTodayInTimeZone(hotel.timezone);
   const currentMonthKey = getMonthKey(todayStr);
   const { start: monthStart, end: monthEnd } = getMonthRange(currentMonthKey);
 
@@ -46,23 +64,9 @@ const Dashboard = () => {
   );
   const locale = language === 'uz' ? 'uz-UZ' : 'ru-RU';
 
-  const todayCheckIns = stays.filter(s => s.check_in_date === todayStr && s.status !== 'CANCELLED');
-  const todayCheckOuts = stays.filter(s => s.check_out_date === todayStr && s.status !== 'CANCELLED' && s.status !== 'CHECKED_OUT');
-
-  const occupiedRoomIds = new Set(
-    stays
-      .filter(s => s.check_in_date <= todayStr && s.check_out_date > todayStr && s.status !== 'CANCELLED')
-      .map(s => s.room_id)
-  );
-
-  const activeRooms = rooms.filter(r => r.active);
-
-  const getRoomStatus = (roomId: string) => {
-    if (todayCheckOuts.some(s => s.room_id === roomId)) return 'checkOutToday';
-    if (todayCheckIns.some(s => s.room_id === roomId)) return 'checkInToday';
-    if (occupiedRoomIds.has(roomId)) return 'occupied';
-    return 'free';
-  };
+  const todayCheckIns = today?.arrivals ?? [];
+  const todayCheckOuts = (today?.departures ?? []).filter(s => s.status !== 'CHECKED_OUT');
+  const activeRooms = today?.rooms ?? [];
 
   const statusColors: Record<string, string> = {
     free: 'bg-success/15 text-success border-success/30',
@@ -78,14 +82,11 @@ const Dashboard = () => {
     CANCELLED: 'bg-destructive/15 text-destructive',
   };
 
-  const getStayPaid = (stayId: string) =>
-    payments.filter(p => p.stay_id === stayId).reduce((s, p) => s + p.amount, 0);
-
   const stats = [
     { label: t.dashboard.checkInsToday, value: todayCheckIns.length, icon: LogIn, accent: 'text-info', bg: 'bg-info/10 border-info/20' },
     { label: t.dashboard.checkOutsToday, value: todayCheckOuts.length, icon: LogOut, accent: 'text-destructive', bg: 'bg-destructive/10 border-destructive/20' },
-    { label: t.dashboard.occupiedRooms, value: occupiedRoomIds.size, icon: BedDouble, accent: 'text-primary', bg: 'bg-primary/10 border-primary/20' },
-    { label: t.dashboard.availableRooms, value: activeRooms.length - occupiedRoomIds.size, icon: DoorOpen, accent: 'text-success', bg: 'bg-success/10 border-success/20' },
+    { label: t.dashboard.occupiedRooms, value: today?.figures.occupied_rooms ?? 0, icon: BedDouble, accent: 'text-primary', bg: 'bg-primary/10 border-primary/20' },
+    { label: t.dashboard.availableRooms, value: today?.figures.free_rooms ?? 0, icon: DoorOpen, accent: 'text-success', bg: 'bg-success/10 border-success/20' },
   ];
 
   if (!loading && rooms.length === 0) {
@@ -165,7 +166,9 @@ const Dashboard = () => {
               </div>
             </div>
             <p className="text-xl font-bold text-success">{formatCurrency(thisMonthRevenue, locale, t.common.currency)}</p>
-            <p className="text-xs text-muted-foreground mt-1">{currentMonthKey}</p>
+            <p className="text-xs text-muted-foreground mt-1">
+              {currentMonthKey} · {t.dashboard.today}: {formatCurrency(today?.figures.income_total ?? 0, locale, t.common.currency)}
+            </p>
           </CardContent>
         </Card>
         <Card className="border-border/50">
@@ -205,11 +208,7 @@ const Dashboard = () => {
         <CardContent>
           <div className="grid grid-cols-2 md:grid-cols-4 gap-3">
             {activeRooms.map(room => {
-              const status = getRoomStatus(room.id);
-              const guest = stays.find(s =>
-                s.room_id === room.id && s.check_in_date <= todayStr && s.check_out_date > todayStr &&
-                s.status !== 'CANCELLED'
-              );
+              const status = room.status;
               return (
                 <div key={room.id} className={`p-3 rounded-lg border ${statusColors[status]}`}>
                   <div className="flex items-center justify-between">
@@ -221,8 +220,8 @@ const Dashboard = () => {
                   <p className="text-xs mt-1 opacity-80">
                     {t.roomType[room.room_type]} / {room.capacity} {t.rooms.beds}
                   </p>
-                  {guest && (
-                    <p className="text-xs mt-1 font-medium truncate">{guest.guest_name}</p>
+                  {room.guest_name && (
+                    <p className="text-xs mt-1 font-medium truncate">{room.guest_name}</p>
                   )}
                 </div>
               );
@@ -250,7 +249,7 @@ const Dashboard = () => {
                 <TableBody>
                   {todayCheckIns.map(stay => (
                     <TableRow key={stay.id}>
-                      <TableCell className="font-medium">#{rooms.find(r => r.id === stay.room_id)?.number}</TableCell>
+                      <TableCell className="font-medium">#{stay.room_number}</TableCell>
                       <TableCell>{stay.guest_name}</TableCell>
                       <TableCell>{stay.check_out_date}</TableCell>
                       <TableCell>
@@ -282,21 +281,16 @@ const Dashboard = () => {
                   </TableRow>
                 </TableHeader>
                 <TableBody>
-                  {todayCheckOuts.map(stay => {
-                    const total = getStayTotal(stay);
-                    const paid = getStayPaid(stay.id);
-                    const due = total - paid;
-                    return (
-                      <TableRow key={stay.id}>
-                      <TableCell className="font-medium">#{rooms.find(r => r.id === stay.room_id)?.number}</TableCell>
+                  {todayCheckOuts.map(stay => (
+                    <TableRow key={stay.id}>
+                      <TableCell className="font-medium">#{stay.room_number}</TableCell>
                       <TableCell>{stay.guest_name}</TableCell>
-                      <TableCell>{formatCurrency(total, locale, t.common.currency)}</TableCell>
-                      <TableCell className={due > 0 ? 'text-destructive font-medium' : 'text-success'}>
-                        {formatCurrency(due, locale, t.common.currency)}
+                      <TableCell>{formatCurrency(stay.total, locale, t.common.currency)}</TableCell>
+                      <TableCell className={stay.due > 0 ? 'text-destructive font-medium' : 'text-success'}>
+                        {formatCurrency(stay.due, locale, t.common.currency)}
                       </TableCell>
                     </TableRow>
-                  );
-                })}
+                  ))}
                 </TableBody>
               </Table>
             )}
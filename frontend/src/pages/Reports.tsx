@@ -11,7 +11,7 @@ import {
   XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer,
 } from "recharts";
 import { formatCurrency, getMonthKey, getMonthRange, getPreviousMonthKeyFromMonthKey, getTodayInTimeZone, shiftDateStr, getNights } from "@/lib/format";
-import { ExpenseCategory, TotalsSnapshot } from "@/types";
+import { ExpenseCategory, TimeSeries, TotalsSnapshot } from "@/types";
 import { apiFetch } from "@/lib/api";
 import * as XLSX from "xlsx";
 import { TrendingUp, TrendingDown, FileDown, Lock, Unlock, BedDouble, CalendarDays, Telescope } from "lucide-react";
@@ -100,7 +100,8 @@ const Reports = () => {
 
   useEffect(() => {
     let active = true;
-    apiFetch<TotalsSnapshot>(`/reports?from=${prevRangeStart}&to=${prevRangeEnd}`)
+    // comparison period: a previous result is fine while the server recomputes
+    apiFetch<TotalsSnapshot>(`/reports?from=${prevRangeStart}&to=${prevRangeEnd}&stale=1`)
       .then(data => {
         if (!active) return;
         setPrevReport({ ...emptySnapshot(), ...data, revenue_by_method: data.revenue_by_method || {} });
@@ -147,27 +148,35 @@ const Reports = () => {
   const profDelta = pctDelta(report.profit, prevReport.profit);
   const occDelta  = pctDelta(report.occupancy_rate, prevReport.occupancy_rate);
 
+  // ── Monthly revenue / expenses (12 months, bucketed on the server) ──────
+  const seriesStart = useMemo(() => {
+    const d = new Date(todayStr + 'T00:00:00');
+    d.setDate(1);
+    d.setMonth(d.getMonth() - 11);
+    return getMonthRange(getMonthKey(d)).start;
+  }, [todayStr]);
+  const seriesEnd = getMonthRange(currentMonthKey).end;
+  const [monthSeries, setMonthSeries] = useState<TimeSeries | null>(null);
+
+  useEffect(() => {
+    let active = true;
+    apiFetch<TimeSeries>(`/reports/timeseries?from=${seriesStart}&to=${seriesEnd}&bucket=month&metrics=revenue,expenses`)
+      .then(data => { if (active) setMonthSeries(data); })
+      .catch(() => { if (active) setMonthSeries(null); });
+    return () => { active = false; };
+  }, [seriesStart, seriesEnd, payments, expenses]);
+
+  const monthRows = useMemo(() => (monthSeries?.buckets ?? []).map((bucket, i) => {
+    const revenue  = monthSeries?.series.revenue?.[i] ?? 0;
+    const expenses = monthSeries?.series.expenses?.[i] ?? 0;
+    return { date: new Date(bucket + 'T00:00:00'), revenue, expenses, profit: revenue - expenses };
+  }), [monthSeries]);
+
   // ── 6-month trend ─────────────────────────────────────────────────────────
-  const trendData = useMemo(() => {
-    const result = [];
-    for (let i = 5; i >= 0; i--) {
-      const d = new Date(todayStr + 'T00:00:00');
-      d.setMonth(d.getMonth() - i);
-      const key = `${d.getFullYear()}-${String(d.getMonth() + 1).padStart(2, '0')}`;
-      const { start, end } = getMonthRange(key);
-      const rev = payments
-        .filter(p => { const date = p.paid_at.slice(0, 10); return date >= start && date <= end; })
-        .reduce((s, p) => s + p.amount, 0);
-      const exp = expenses
-        .filter(e => e.spent_at >= start && e.spent_at <= end)
-        .reduce((s, e) => s + e.amount, 0);
-      result.push({
-        label: d.toLocaleDateString(locale, { month: 'short', year: '2-digit' }),
-        revenue: rev, expenses: exp, profit: rev - exp,
-      });
-    }
-    return result;
-  }, [payments, expenses, todayStr, locale]);
+  const trendData = useMemo(() => monthRows.slice(-6).map(row => ({
+    label: row.date.toLocaleDateString(locale, { month: 'short', year: '2-digit' }),
+    revenue: row.revenue, expenses: row.expenses, profit: row.profit,
+  })), [monthRows, locale]);
 
   // ── Donut chart ───────────────────────────────────────────────────────────
   const methodChartData = useMemo(() =>
@@ -280,28 +289,11 @@ const Reports = () => {
   }, [rooms, stays, payments, rangeStart, rangeEnd, rangeDays]);
 
   // ── P&L by month (12 months) ──────────────────────────────────────────────
-  const plMonths = useMemo(() => {
-    const result = [];
-    for (let i = 11; i >= 0; i--) {
-      const d = new Date(todayStr + 'T00:00:00');
-      d.setMonth(d.getMonth() - i);
-      const key = `${d.getFullYear()}-${String(d.getMonth() + 1).padStart(2, '0')}`;
-      const { start, end } = getMonthRange(key);
-      const rev = payments
-        .filter(p => { const date = p.paid_at.slice(0, 10); return date >= start && date <= end; })
-        .reduce((s, p) => s + p.amount, 0);
-      const exp = expenses
-        .filter(e => e.spent_at >= start && e.spent_at <= end)
-        .reduce((s, e) => s + e.amount, 0);
-      const profit = rev - exp;
-      const margin = rev > 0 ? (profit / rev) * 100 : 0;
-      result.push({
-        label: d.toLocaleDateString(locale, { month: 'long', year: 'numeric' }),
-        revenue: rev, expenses: exp, profit, margin,
-      });
-    }
-    return result;
-  }, [payments, expenses, todayStr, locale]);
+  const plMonths = useMemo(() => monthRows.map(row => ({
+    label: row.date.toLocaleDateString(locale, { month: 'long', year: 'numeric' }),
+    revenue: row.revenue, expenses: row.expenses, profit: row.profit,
+    margin: row.revenue > 0 ? (row.profit / row.revenue) * 100 : 0,
+  })), [monthRows, locale]);
 
   // ── Downtime analysis ─────────────────────────────────────────────────────
   const downtimeAnalysis = useMemo(() => {
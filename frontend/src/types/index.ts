@@ -18,6 +18,62 @@ export interface TotalsSnapshot {
   total_room_revenue: number;
 }
 
+export interface TimeSeries {
+  from: string;
+  to: string;
+  bucket: 'day' | 'week' | 'month';
+  timezone: string;
+  buckets: string[];
+  series: Record<string, number[]>;
+}
+
+export interface DashboardStay {
+  id: string;
+  room_id: string;
+  room_number: string | null;
+  guest_name: string;
+  guest_phone: string | null;
+  status: StayStatus;
+  check_in_date: string;
+  check_out_date: string;
+  total: number;
+  paid: number;
+  due: number;
+}
+
+export interface DashboardRoom {
+  id: string;
+  number: string;
+  floor: number;
+  room_type: RoomType;
+  capacity: number;
+  status: 'free' | 'occupied' | 'checkInToday' | 'checkOutToday';
+  guest_name: string | null;
+}
+
+export interface DashboardData {
+  date: string;
+  timezone: string;
+  figures: {
+    checked_in: number;
+    checked_out: number;
+    income_by_method: Record<string, number>;
+    income_total: number;
+    expenses_by_category: Record<string, number>;
+    expenses_total: number;
+    profit: number;
+    withdrawals_by_method: Record<string, number>;
+    withdrawals_total: number;
+    total_rooms: number;
+    occupied_rooms: number;
+    free_rooms: number;
+  };
+  rooms: DashboardRoom[];
+  arrivals: DashboardStay[];
+  departures: DashboardStay[];
+  in_house: DashboardStay[];
+}
+
 export interface Hotel {
   id: string;
   name: string;
@@ -128,6 +184,31 @@ export interface Guest {
   created_at: string;
 }
 
+export interface GuestStatsRow {
+  id: string;
+  name: string;
+  phone: string;
+  stays: number;
+  nights: number;
+  revenue: number;
+  last_stay: string | null;
+}
+
+export interface GuestStats {
+  total_guests: number;
+  active_guests: number;
+  returning_guests: number;
+  returning_ratio: number; // 0..1
+  avg_revenue: number;
+  avg_stays: number;
+  avg_nights: number;
+  frequency: Record<'1' | '2' | '3-5' | '6+', number>;
+  sort: 'revenue' | 'nights' | 'stays' | 'last_stay';
+  limit: number;
+  offset: number;
+  guests: GuestStatsRow[];
+}
+
 export interface MonthClosing {
   id: string;
   hotel_id: string;